@@ -4,7 +4,8 @@ class BVRuleContextManager(object):
     def __init__(self, grammar, fn, recurse_up=False):
         """
             This manages rules that we add and subtract in the context of grammar generation. This is a class that is somewhat
-            in between Grammar and GrammarRule. It manages creating, adding, and subtracting the bound variable rule via "with" clause in Grammar.
+            in between Grammar and GrammarRule. It manages bringing the bound variable rules into (and out of) the grammar's
+            scope via "with" clause in Grammar. The grammar's own rules are never changed (see Grammar.push_bv_rules).
 
             NOTE: The "rule" here is the added rule, not the "bound variable" one (that adds the rule)
             NOTE: If rule is None, then nothing happens
@@ -26,21 +27,21 @@ class BVRuleContextManager(object):
         for x in self.fn.up_to(to=None) if self.recurse_up else [self.fn]:
             if x.added_rule is not None:
                 #print "# Adding rule ", x.added_rule
-                r = x.added_rule
-                self.added_rules.append(r)
-                self.grammar.rules[r.nt].append(r)
+                self.added_rules.append(x.added_rule)
+
+        if self.added_rules:
+            self.grammar.push_bv_rules(self.added_rules)
 
     def __exit__(self, t, value, traceback):
 
         if self.fn is None: # skip these
             return
 
-        #print "# Removing rule", r
-        for r in self.added_rules:
-            self.grammar.rules[r.nt].remove(r)
+        #print "# Removing rules", self.added_rules
+        if self.added_rules:
+            self.grammar.pop_bv_rules(self.added_rules)
 
         # reset
         self.added_rules = []
 
         return False #re-raise exceptions
-
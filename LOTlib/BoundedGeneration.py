@@ -0,0 +1,320 @@
+"""
+        Generating trees that fit under a depth or node budget.
+
+        Grammar.generate can make trees so big that they overflow the stack, or that LOTHypothesis will only throw
+        away (see maxnodes). Here we sample from the PCFG conditioned on the tree fitting, exactly, by dynamic
+        programming over the probability that each nonterminal makes a tree within the budget:
+
+            - With only a depth budget D, the mass of a nonterminal is the sum over its rules of their probability
+              times the product of their children's masses at D-1. We choose a rule in proportion to its share of
+              that, and give each child D-1.
+            - With a node budget, we work with the mass of trees of exactly n nodes, choose n, then a rule, then
+              how many of the remaining n-1 nodes go to each child, in turn.
+
+        MinimalCompletions keeps the smallest depth and number of nodes each nonterminal can be completed with, so
+        that we never look for trees that cannot fit.
+
+        Bound variables are handled as in TreeCounter: masses depend on the (type, args, p) of the bound variable
+        rules in scope, so that is the context we memoize on. Minimal completions only depend on which kinds of
+        bound variable (type, args) are around.
+
+        Example:
+            sampler = BoundedSampler(grammar)
+            t = sampler.generate(max_nodes=25) # t.count_nodes() <= 25
+            # or
+            t = grammar.generate_bounded(max_depth=5)
+"""
+
+from math import log
+from random import random
+
+from LOTlib.Miscellaneous import Infinity
+from LOTlib.GrammarRule import BVAddGrammarRule
+
+
+def rule_kind(r):
+    """ The (type, args) of a bound variable rule """
+    return (r.nt, tuple(r.to) if r.to is not None else None)
+
+
+def sample_index(weights):
+    """ Sample an index in proportion to weights (which must not all be 0) """
+    u = random() * sum(weights)
+    for i, w in enumerate(weights):
+        u -= w
+        if u < 0.0:
+            return i
+    return max([i for i, w in enumerate(weights) if w > 0.0]) # only if rounding left u at the end
+
+
+class MinimalCompletions(object):
+    """
+    The smallest depth and number of nodes that each nonterminal (and rule) can be completed with, with the kinds of
+    bound variables (a frozenset of (type, args)) that are in scope. Depths are as FunctionNode.depth counts them
+    (a node with no FunctionNode arguments has depth 0), and nodes as count_nodes does.
+
+    These only depend on the grammar's rules, not their p.
+    """
+
+    def __init__(self, grammar):
+        self.grammar = grammar
+        self.tables = dict() # frozenset of kinds -> (depth, nodes), dictionaries from nonterminals
+
+    def is_nonterminal(self, x, kinds):
+        return isinstance(x, str) and (x in self.grammar.rules or any(k[0] == x for k in kinds))
+
+    def added_kind(self, r):
+        """ The kind of bound variable that r adds """
+        return (r.bv_type, tuple(r.bv_args) if r.bv_args is not None else None)
+
+    def table(self, kinds=frozenset()):
+        if kinds not in self.tables:
+            self.tables[kinds] = self.compute(kinds)
+        return self.tables[kinds]
+
+    def compute(self, kinds):
+        # Each way to expand is (nt, to, kinds inside it). Rules that add a bound variable we do not have yet
+        # look up their children in the (strictly larger) set of kinds they make.
+        choices = []
+        for nt in self.grammar.nonterminals():
+            for r in self.grammar.rules[nt]:
+                inner = kinds | frozenset([self.added_kind(r)]) if isinstance(r, BVAddGrammarRule) else kinds
+                choices.append((nt, r.to, inner))
+        choices.extend([(nt, to, kinds) for nt, to in kinds])
+
+        depth = dict([(nt, Infinity) for nt in self.grammar.nonterminals()])
+        depth.update([(nt, Infinity) for nt, _, _ in choices])
+        nodes = dict(depth)
+        changed = True
+        while changed:
+            changed = False
+            for nt, to, inner in choices:
+                d, n = self.expansion(to, inner, kinds, depth, nodes)
+                if d < depth[nt]:
+                    depth[nt], changed = d, True
+                if n < nodes[nt]:
+                    nodes[nt], changed = n, True
+        return depth, nodes
+
+    def expansion(self, to, inner, kinds, depth, nodes):
+        """ The minimal (depth, nodes) of a node whose arguments are to, in inner, where depth and nodes are the
+        tables for kinds, so far """
+        if inner != kinds:
+            depth, nodes = self.table(inner)
+
+        children = [a for a in to or [] if self.is_nonterminal(a, inner)]
+        if not children:
+            return 0, 1
+        return 1 + max([depth[a] for a in children]), 1 + sum([nodes[a] for a in children])
+
+    def depth(self, x, kinds=frozenset()):
+        """ The smallest depth of a tree from x """
+        return self.table(kinds)[0][x] if self.is_nonterminal(x, kinds) else 0
+
+    def nodes(self, x, kinds=frozenset()):
+        """ The fewest nodes in a tree from x (0 for terminals) """
+        return self.table(kinds)[1][x] if self.is_nonterminal(x, kinds) else 0
+
+    def rule_depth(self, r, kinds=frozenset()):
+        """ The smallest depth of a tree that starts with r """
+        inner = kinds | frozenset([self.added_kind(r)]) if isinstance(r, BVAddGrammarRule) else kinds
+        return self.expansion(r.to, inner, kinds, *self.table(kinds))[0]
+
+    def rule_nodes(self, r, kinds=frozenset()):
+        """ The fewest nodes in a tree that starts with r """
+        inner = kinds | frozenset([self.added_kind(r)]) if isinstance(r, BVAddGrammarRule) else kinds
+        return self.expansion(r.to, inner, kinds, *self.table(kinds))[1]
+
+
+class BoundedSampler(object):
+    """
+    Samples trees from grammar conditioned on their depth and number of nodes being within a budget, and computes
+    how much of the prior fits.
+
+    This remembers the masses it computes, so the grammar (and its rules' p) must not change while we use it. See
+    Grammar.bounded_sampler for a copy that is kept up to date.
+    """
+
+    def __init__(self, grammar):
+        self.grammar = grammar
+        self.minimal = MinimalCompletions(grammar)
+        self.depth_memo = dict()  # (x, D, context) -> mass of trees of depth up to D
+        self.exact_memo = dict()  # (x, D, n, context) -> mass of trees of depth up to D and exactly n nodes
+        self.children_memo = dict() # (to, D, m, context) -> mass of arguments with depth up to D and m nodes in all
+
+    # --------------------------------------------------------------------------------------------------------
+    # The grammar, in a context: a tuple of (type, args, p) for the bound variable rules in scope
+    # --------------------------------------------------------------------------------------------------------
+
+    def context(self, scope):
+        return tuple([rule_kind(r) + (r.p,) for r in scope])
+
+    def kinds(self, context):
+        return frozenset([(x, to) for x, to, _ in context])
+
+    def is_nonterminal(self, x, context):
+        return isinstance(x, str) and (x in self.grammar.rules or any(c[0] == x for c in context))
+
+    def expansions(self, x, context):
+        """
+        A list of (p, to, inner context) for x's rules (the grammar's, then the bound variables', in the order of
+        Grammar.get_rules), with p normalized
+        """
+        out = []
+        for r in self.grammar.rules.get(x, []):
+            inner = context
+            if isinstance(r, BVAddGrammarRule):
+                inner = context + (self.minimal.added_kind(r) + (self.grammar.BV_P if r.bv_p is None else r.bv_p,),)
+            out.append((r.p, r.to, inner))
+        out.extend([(p, to, context) for nt, to, p in context if nt == x])
+
+        z = sum([p for p, _, _ in out])
+        return [(p/z, to, inner) for p, to, inner in out]
+
+    # --------------------------------------------------------------------------------------------------------
+    # Masses
+    # --------------------------------------------------------------------------------------------------------
+
+    def budget(self, max_depth, max_nodes):
+        """ The depth budget to use with max_nodes (a tree of n nodes is at most n-1 deep) """
+        return min(max_depth, max_nodes - 1)
+
+    def mass(self, x, max_depth=Infinity, max_nodes=Infinity, scope=()):
+        """ The prior probability that a tree from x (with the bound variable rules in scope) fits the budget """
+        context = self.context(scope)
+        if not self.is_nonterminal(x, context):
+            return 1.0
+        if max_nodes < Infinity:
+            D = self.budget(max_depth, max_nodes)
+            return sum([self.exact_mass(x, D, n, context) for n in xrange(1, int(max_nodes)+1)])
+        elif max_depth < Infinity:
+            return self.depth_mass(x, max_depth, context)
+        else:
+            return 1.0 # (assuming the grammar is proper)
+
+    def depth_mass(self, x, D, context):
+        """ The mass of trees from x of depth at most D """
+        if not self.is_nonterminal(x, context):
+            return 1.0
+        if D < self.minimal.depth(x, self.kinds(context)):
+            return 0.0
+
+        key = (x, D, context)
+        if key not in self.depth_memo:
+            m = 0.0
+            for p, to, inner in self.expansions(x, context):
+                for a in to or []:
+                    p *= self.depth_mass(a, D-1, inner)
+                m += p
+            self.depth_memo[key] = m
+        return self.depth_memo[key]
+
+    def exact_mass(self, x, D, n, context):
+        """ The mass of trees from x of depth at most D and exactly n nodes """
+        if not self.is_nonterminal(x, context):
+            return 1.0 if n == 0 else 0.0
+
+        kinds = self.kinds(context)
+        if D < self.minimal.depth(x, kinds) or n < self.minimal.nodes(x, kinds):
+            return 0.0
+
+        key = (x, D, n, context)
+        if key not in self.exact_memo:
+            self.exact_memo[key] = sum([p * self.children_mass(tuple(to or ()), D-1, n-1, inner)
+                                        for p, to, inner in self.expansions(x, context)])
+        return self.exact_memo[key]
+
+    def children_mass(self, to, D, m, context):
+        """ The mass of arguments to, each at most D deep, with m nodes between them """
+        if not to:
+            return 1.0 if m == 0 else 0.0
+
+        key = (to, D, m, context)
+        if key not in self.children_memo:
+            self.children_memo[key] = sum([self.exact_mass(to[0], D, k, context) *
+                                           self.children_mass(to[1:], D, m-k, context) for k in xrange(m+1)])
+        return self.children_memo[key]
+
+    # --------------------------------------------------------------------------------------------------------
+    # Sampling
+    # --------------------------------------------------------------------------------------------------------
+
+    def generate(self, x=None, max_depth=Infinity, max_nodes=Infinity):
+        """
+        Sample a tree from x (default: the grammar's start), in the grammar's current bound variable scope, with
+        depth at most max_depth and at most max_nodes nodes.
+        """
+        if x is None:
+            x = self.grammar.start
+
+        scope = tuple(reversed(list(self.grammar.iterate_bv_scope())))
+        context = self.context(scope)
+        if not self.is_nonterminal(x, context):
+            return x
+
+        if max_nodes < Infinity:
+            D = self.budget(max_depth, max_nodes)
+            weights = [self.exact_mass(x, D, n, context) for n in xrange(int(max_nodes)+1)]
+            assert sum(weights) > 0.0, "*** No tree from %s fits in depth %s and %s nodes" % (x, max_depth, max_nodes)
+            return self.generate_exact(x, D, sample_index(weights), scope, None)
+        elif max_depth < Infinity:
+            assert self.depth_mass(x, max_depth, context) > 0.0, "*** No tree from %s fits in depth %s" % (x, max_depth)
+            return self.generate_depth(x, max_depth, scope, None)
+        else:
+            return self.grammar.generate(x)
+
+    def rules(self, x, scope):
+        """ The rules of x in scope, in the same order as expansions """
+        return self.grammar.rules.get(x, []) + [r for r in scope if r.nt == x]
+
+    def make_node(self, r, scope, parent):
+        """ A stub for r, and the scope inside it """
+        fn = r.make_FunctionNodeStub(self.grammar, parent)
+        return fn, (scope if fn.added_rule is None else scope + (fn.added_rule,))
+
+    def generate_depth(self, x, D, scope, parent):
+        """ A tree from x, conditioned on being at most D deep """
+        context = self.context(scope)
+        if not self.is_nonterminal(x, context):
+            return x
+
+        weights = []
+        for p, to, inner in self.expansions(x, context):
+            for a in to or []:
+                p *= self.depth_mass(a, D-1, inner)
+            weights.append(p)
+
+        fn, inner = self.make_node(self.rules(x, scope)[sample_index(weights)], scope, parent)
+        if fn.args is not None:
+            fn.args = [self.generate_depth(a, D-1, inner, fn) for a in fn.args]
+        return fn
+
+    def generate_exact(self, x, D, n, scope, parent):
+        """ A tree from x, conditioned on being at most D deep, with exactly n nodes """
+        context = self.context(scope)
+        if not self.is_nonterminal(x, context):
+            return x
+
+        expansions = self.expansions(x, context)
+        weights = [p * self.children_mass(tuple(to or ()), D-1, n-1, inner) for p, to, inner in expansions]
+        k = sample_index(weights)
+        fn, inner = self.make_node(self.rules(x, scope)[k], scope, parent)
+
+        if fn.args is not None:
+            to, inner_context = tuple(fn.args), expansions[k][2]
+            m = n-1
+            for i, a in enumerate(to):
+                # how many of the m nodes left go to this argument
+                ws = [self.exact_mass(a, D-1, j, inner_context) * self.children_mass(to[i+1:], D-1, m-j, inner_context)
+                      for j in xrange(m+1)]
+                j = sample_index(ws)
+                fn.args[i] = self.generate_exact(a, D-1, j, inner, fn)
+                m -= j
+        return fn
+
+    def log_probability(self, t, max_depth=Infinity, max_nodes=Infinity):
+        """ The log probability of generate giving t (in the grammar's current scope) """
+        scope = tuple(reversed(list(self.grammar.iterate_bv_scope())))
+        if t.depth() > max_depth or t.count_nodes() > max_nodes:
+            return -Infinity
+        return self.grammar.log_probability(t) - log(self.mass(t.returntype, max_depth, max_nodes, scope))
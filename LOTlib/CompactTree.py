@@ -0,0 +1,207 @@
+"""
+        A compact, immutable representation of trees.
+
+        A CompactTree stores a tree as the prefix-order list of the rules that generated it, as indices into a
+        RuleTable (a frozen snapshot of a grammar's rules) in an array('H'). Bound variables use indices past the
+        end of the table: nrules+i is the variable introduced by the i'th lambda above (counting from the root).
+        The uuids of the bound variables are kept on the side so that expanding gives back exactly the same tree.
+
+        This takes a few bytes per node, compared to a few hundred for a FunctionNode, so it is useful for keeping
+        a lot of trees around (see TopN, SampleStream.Save, SampleStream.Unique via CompactHypothesis).
+
+        For saving or sending trees, RuleTable.pack writes the same rule indices as varints (one byte per node for
+        the first 128 rules), without the bound variable names. This is the format LOTHypotheses are pickled in
+        (see Grammar.pack).
+
+        Example:
+            table = grammar.rule_table()
+            ct = table.compact(t)
+            assert table.expand(ct) == t
+            assert table.unpack(table.pack(t)) == t
+"""
+
+from array import array
+from itertools import chain
+
+from LOTlib.FunctionNode import isFunctionNode, BVAddFunctionNode, BVUseFunctionNode
+from LOTlib.GrammarRule import BVUseGrammarRule
+
+MAX_INDEX = 2**16 - 1 # the largest index we can store in an array('H')
+
+
+def encode_varints(ints):
+    """Pack non-negative ints into a string, 7 bits per byte, lowest bits first. The high bit of each byte is set if
+    more bytes of the same int follow (as in protocol buffers)."""
+    out = bytearray()
+    for i in ints:
+        while i > 0x7F:
+            out.append((i & 0x7F) | 0x80)
+            i >>= 7
+        out.append(i)
+    return str(out)
+
+
+def decode_varints(s):
+    """Yield the ints from a string made by encode_varints."""
+    i, shift = 0, 0
+    for b in bytearray(s):
+        if b & 0x80:
+            i |= (b & 0x7F) << shift
+            shift += 7
+        else:
+            yield i | (b << shift)
+            i, shift = 0, 0
+
+    if shift > 0:
+        raise ValueError("*** Packed string ends in the middle of a number")
+
+
+class RuleTable(object):
+    """
+    A frozen snapshot of a grammar's rules (not counting any bound variable rules that are in scope).
+
+    Rules are referenced by their index in self.rules. This does not change when rules are added to the
+    grammar -- the grammar just makes a new table (see Grammar.rule_table). The nonterminals are taken in sorted
+    order, so a copy of a grammar (e.g. one that was pickled along with some packed trees) gives the same indices.
+    """
+
+    def __init__(self, grammar):
+        self.rules = tuple([r for nt in sorted(grammar.nonterminals()) for r in grammar.get_rules(nt)
+                            if not isinstance(r, BVUseGrammarRule)])
+        self.nrules = len(self.rules)
+        assert self.nrules <= MAX_INDEX, "*** Too many rules to make a RuleTable"
+
+        self.sig2idx = dict([(r.get_rule_signature(), i) for i, r in enumerate(self.rules)])
+        self.nonterminals = frozenset([r.nt for r in self.rules])
+        self.BV_P = grammar.BV_P # needed to remake bound variable rules (see BVAddGrammarRule.make_bv_rule)
+
+    def __len__(self):
+        return self.nrules
+
+    def compact(self, t):
+        """Make a CompactTree from the FunctionNode t, which must be a complete tree."""
+        rules, bvnames = array('H'), []
+        self.compact_rec(t, rules, bvnames, [])
+        return CompactTree(self, rules, tuple(bvnames))
+
+    def compact_rec(self, t, rules, bvnames, scope):
+        """Append t's rule indices to rules and its bv names to bvnames. scope stores the bv names above us."""
+        if isinstance(t, BVUseFunctionNode):
+            assert t.name in scope, "*** Cannot compact a tree with a free bound variable %s" % t.name
+            i = len(scope) - 1 - scope[::-1].index(t.name)  # the innermost lambda with this name
+            assert self.nrules + i <= MAX_INDEX, "*** Too many nested bound variables to compact"
+            rules.append(self.nrules + i)
+        else:
+            rules.append(self.sig2idx[t.get_rule_signature()])
+
+        if isinstance(t, BVAddFunctionNode):
+            bvnames.append(t.added_rule.name)
+            scope.append(t.added_rule.name)
+
+        if t.args is not None:
+            for a in t.args:
+                if isFunctionNode(a):
+                    self.compact_rec(a, rules, bvnames, scope)
+                else:
+                    assert a not in self.nonterminals, "*** Only complete trees can be compacted, not %s" % t
+
+        if isinstance(t, BVAddFunctionNode):
+            scope.pop()
+
+    def expand(self, ct):
+        """Rebuild the FunctionNode that ct was made from."""
+        assert ct.table is self, "*** CompactTree is from a different RuleTable"
+        return self.expand_rec(iter(ct.rules), iter(ct.bvnames), [], None)
+
+    def expand_rec(self, rules, bvnames, scope, parent):
+        """Build the next node from the iterators rules and bvnames (or, if bvnames is None, give the bound
+        variables new names). scope stores the bv rules above us."""
+        i = rules.next()
+        r = self.rules[i] if i < self.nrules else scope[i - self.nrules]
+
+        # Pass self as the grammar, since make_bv_rule only needs BV_P
+        fn = r.make_FunctionNodeStub(self, parent)
+
+        if isinstance(fn, BVAddFunctionNode):
+            if bvnames is not None:
+                fn.added_rule.name = bvnames.next()
+            scope.append(fn.added_rule)
+
+        if fn.args is not None:
+            for j, a in enumerate(fn.args):
+                if a in self.nonterminals or any(a == s.nt for s in scope):
+                    fn.args[j] = self.expand_rec(rules, bvnames, scope, fn)
+
+        if isinstance(fn, BVAddFunctionNode):
+            scope.pop()
+
+        return fn
+
+    def pack(self, t):
+        """Pack the FunctionNode t, which must be a complete tree, into a string of varints (see encode_varints).
+        The bound variables' names are not kept, so unpacking gives them new ones (as with Grammar.pack_ascii)."""
+        rules = array('H')
+        self.compact_rec(t, rules, [], [])
+        return encode_varints(rules)
+
+    def unpack(self, s):
+        """The inverse of pack."""
+        return self.expand_rec(decode_varints(s), None, [], None)
+
+    def unpack_all(self, s):
+        """Yield the trees from a string of packed trees put end to end (e.g. by writing one pack after another to a
+        file), decoding each only as it is needed."""
+        ints = decode_varints(s)
+        for i in ints:
+            try:
+                yield self.expand_rec(chain([i], ints), None, [], None)
+            except StopIteration:
+                raise ValueError("*** Packed string ends in the middle of a tree")
+
+
+class CompactTree(object):
+    """
+    An immutable tree, stored as rule indices into a RuleTable. Make these with RuleTable.compact.
+
+    Two CompactTrees are equal if they come from the same table and would expand to equal FunctionNodes.
+    """
+    __slots__ = ['table', 'rules', 'bvnames', '_hash']
+
+    def __init__(self, table, rules, bvnames):
+        self.table = table
+        self.rules = rules
+        self.bvnames = bvnames
+        self._hash = None
+
+    def expand(self):
+        return self.table.expand(self)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def __str__(self):
+        return str(self.expand())
+
+    def __repr__(self):
+        return str(self)
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(self.rules.tostring())
+        return self._hash
+
+    def __eq__(self, other):
+        # bvnames do not matter, just as FunctionNode equality ignores the names of bound variables
+        return isinstance(other, CompactTree) and (self.table is other.table) and (self.rules == other.rules)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __getstate__(self):
+        # Pickle the rules as varints, rather than the list of ints that pickling an array gives
+        return (self.table, encode_varints(self.rules), self.bvnames)
+
+    def __setstate__(self, state):
+        self.table, rules, self.bvnames = state
+        self.rules = array('H', decode_varints(rules)) if isinstance(rules, str) else rules
+        self._hash = None
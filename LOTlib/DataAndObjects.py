@@ -9,7 +9,7 @@ For functions, we have a data object of the form [output, args]
 """
 from copy import deepcopy
 
-from LOTlib.Miscellaneous import weighted_sample, qq
+from LOTlib.Miscellaneous import weighted_sample, qq, Infinity
 
 # ------------------------------------------------------------------------------------------------------------
 
@@ -38,6 +38,100 @@ class FunctionData:
 
 # ------------------------------------------------------------------------------------------------------------
 
+def data_key(x):
+    """
+    A hashable key for a piece of data, equal for data that are equal feature for feature: lists, tuples, sets and
+    dicts are keyed on their contents, and FunctionData, Data and Obj on their attributes. Anything else unhashable
+    is keyed on its id, so it is only ever equal to itself.
+    """
+    if isinstance(x, (list, tuple)):
+        return (type(x).__name__, tuple(map(data_key, x)))
+    elif isinstance(x, (set, frozenset)): # sorted, not a frozenset, since distinct members may have equal keys
+        return ('set', tuple(sorted(map(data_key, x))))
+    elif isinstance(x, dict):
+        return ('dict', tuple(sorted([(data_key(k), data_key(v)) for k, v in x.items()])))
+    elif isinstance(x, (FunctionData, Data, Obj)):
+        return (x.__class__.__name__, data_key(x.__dict__))
+    else:
+        try:
+            hash(x)
+            return (type(x).__name__, x) # the type, so that e.g. 1 and 1.0 differ
+        except TypeError:
+            return ('id', id(x))
+
+
+class Dataset(object):
+    """
+    A list of data that stores each distinct datum (see data_key) once, as a row, with how many times it occurs.
+    The rows' inputs and outputs are also kept columnwise, in inputs and outputs, aligned to rows and counts.
+
+    Iterating, indexing and len() behave as for the original list, in its order, so a Dataset can be used wherever
+    a list of data is. Hypothesis.compute_likelihood hands a Dataset its hypothesis, and compute_likelihood below
+    computes each row's likelihood only once.
+    """
+    def __init__(self, data=()):
+        self.rows, self.counts, self.inputs, self.outputs = [], [], [], []
+        self.order = [] # the row of each datum, in the original order
+        self.row_index = dict() # data_key -> row
+        for datum in data:
+            self.append(datum)
+
+    def append(self, datum):
+        k = data_key(datum)
+        i = self.row_index.get(k)
+        if i is None:
+            i = self.row_index[k] = len(self.rows)
+            self.rows.append(datum)
+            self.counts.append(0)
+            self.inputs.append(getattr(datum, 'input', None))
+            self.outputs.append(getattr(datum, 'output', None))
+        self.counts[i] += 1
+        self.order.append(i)
+
+    def unique(self):
+        """ Return a list of (datum, count) for each distinct datum """
+        return zip(self.rows, self.counts)
+
+    def compute_likelihood(self, h, shortcut=-Infinity, **kwargs):
+        """h.compute_likelihood(self, shortcut=shortcut), computing each row's likelihood once.
+
+        With no shortcut, each row's likelihood is weighted by its count. With one, we still add up the data in
+        their original order and stop at the same point as for a list, looking up each row's likelihood the first
+        time we need it.
+        """
+        if shortcut == -Infinity:
+            return sum([c * h.compute_single_likelihood(datum, **kwargs) for datum, c in self.unique()]) / \
+                   h.likelihood_temperature
+
+        row_ll = [None] * len(self.rows)
+        ll = 0.0
+        for i in self.order:
+            if row_ll[i] is None:
+                row_ll[i] = h.compute_single_likelihood(self.rows[i], **kwargs) / h.likelihood_temperature
+            ll += row_ll[i]
+            if ll < shortcut:
+                return -Infinity
+
+        return ll
+
+    def __len__(self):
+        return len(self.order)
+
+    def __iter__(self):
+        for i in self.order:
+            yield self.rows[i]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return Dataset([self.rows[j] for j in self.order[i]])
+        else:
+            return self.rows[self.order[i]]
+
+    def __repr__(self):
+        return '<Dataset of %s data in %s rows>' % (len(self.order), len(self.rows))
+
+# ------------------------------------------------------------------------------------------------------------
+
 class HumanData:
     """Human data class.
 
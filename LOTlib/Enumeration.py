@@ -0,0 +1,487 @@
+"""
+        Enumerating all the trees of a grammar, by depth, with dynamic programming.
+
+        The trees of depth d for a nonterminal are built from the trees of depth < d for its rules' children. An
+        Enumerator keeps a list of the trees for each (nonterminal, depth, bound variable context) it has been
+        asked for as a child, so each is only enumerated once, however many larger trees use it (and across depths,
+        if you keep using the same Enumerator). The trees at the top are not kept, just yielded.
+
+        Trees are stored as nested tuples (rule, added_rule, children), where added_rule is the rule for the
+        bound variable the node introduces (or None), and children are trees or the strings of terminal arguments.
+        Each bound variable context is a tuple of the bound variable rules in scope. Each rule that adds a bound
+        variable gets one added_rule per context, so contexts built the same way are equal, and trees inside them can
+        be shared. They are turned into FunctionNodes (or CompactTrees) only as they are yielded.
+
+        Trees come out in the same order as the old Grammar.enumerate_at_depth gave them: by rule, then by the
+        depths of the children, then by the children themselves (varying the first child fastest).
+
+        enumerate_by_probability instead yields complete trees in order of decreasing prior, best first, by searching
+        over partial trees with a priority queue. The priority of a partial tree is its log probability so far plus,
+        for each nonterminal still to expand, the best log probability that nonterminal could be completed with
+        (best_completion_log_probabilities). These bounds are never too low, so no tree comes out before a better one.
+
+        TreeCounter counts the trees of each depth the same way, without making them, along with their total prior
+        probability. That is enough for sizing (as in PartitionMCMC) and for saying how much of the prior an
+        enumeration has covered.
+
+        Example:
+            enumerator = Enumerator(grammar)
+            for d in xrange(5):
+                for t in enumerator.enumerate_at_depth(d):
+                    print t
+
+            # or, to keep many trees around cheaply:
+            trees = list(Enumerator(grammar, compact=True).enumerate(4))
+"""
+
+from array import array
+from copy import copy
+from heapq import heappush, heappop
+from itertools import product
+from math import log
+
+from LOTlib.Miscellaneous import infrange, Infinity
+from LOTlib.FunctionNode import BVAddFunctionNode
+from LOTlib.GrammarRule import BVAddGrammarRule, BVUseGrammarRule
+from LOTlib.CompactTree import CompactTree
+
+
+def product_first_fastest(lists):
+    """ The product of lists, as tuples, varying the first list fastest (as lazyproduct does) """
+    for x in product(*lists[::-1]):
+        yield x[::-1]
+
+
+def product_last_streamed(lists, last):
+    """
+    As product_first_fastest(lists + [last]), but last (which varies slowest) can be any iterable, and is only
+    gone through once.
+    """
+    if not lists:
+        for y in last:
+            yield (y,)
+    else:
+        rest = list(product_first_fastest(lists)) if len(lists) > 1 else [(x,) for x in lists[0]]
+        for y in last:
+            for x in rest:
+                yield x + (y,)
+
+
+def make_FunctionNode(grammar, x, parent=None):
+    """ A new FunctionNode from the tree x, a tuple (rule, added_rule, children) """
+    if isinstance(x, str):
+        return x
+
+    r, added, children = x
+    if added is None:
+        fn = r.make_FunctionNodeStub(grammar, parent)
+    else: # each tree gets its own copy of the rule, as it would from Grammar.generate
+        fn = BVAddFunctionNode(parent, returntype=r.nt, name=r.name, args=None, added_rule=copy(added))
+
+    if r.to is not None:
+        fn.args = [make_FunctionNode(grammar, c, fn) for c in children]
+    return fn
+
+
+class Enumerator(object):
+    """
+    Enumerates the trees of grammar, remembering the trees of each (nonterminal, depth, context) that are used as
+    children. If leaves is False, the trees of depth 0 are just their nonterminal, as in PartitionMCMC. If compact
+    is True, we yield CompactTrees (from grammar.rule_table()) instead of FunctionNodes.
+
+    The grammar must not change while we use this.
+    """
+
+    def __init__(self, grammar, leaves=True, compact=False):
+        self.grammar = grammar
+        self.leaves = leaves
+        self.compact = compact
+        self.memo = dict()      # (nt, d, context) -> list of trees
+        self.added_rules = dict()   # (context, rule) -> the bound variable rule it adds in that context
+
+    def enumerate(self, d=20, nt=None):
+        """ Yield all trees up to depth d (if Infinity, this runs forever) """
+        for i in infrange(d):
+            for t in self.enumerate_at_depth(i, nt=nt):
+                yield t
+
+    def enumerate_at_depth(self, d, nt=None):
+        """ Yield the trees of depth d, no deeper or shallower """
+        if nt is None:
+            nt = self.grammar.start
+
+        # We start in whatever bound variable scope the grammar is in
+        context = tuple(reversed(list(self.grammar.iterate_bv_scope())))
+
+        if not self.is_nonterminal(nt, context):
+            yield nt # handle garbage that may be passed in here
+            return
+
+        for x in self.iterate(nt, d, context):
+            yield self.make_tree(x)
+
+    def make_tree(self, x):
+        if self.compact:
+            return self.make_CompactTree(x)
+        else:
+            return self.make_FunctionNode(x, None)
+
+    # --------------------------------------------------------------------------------------------------------
+    # The grammar, in a context
+    # --------------------------------------------------------------------------------------------------------
+
+    def is_nonterminal(self, x, context):
+        return isinstance(x, str) and (x in self.grammar.rules or any(r.nt == x for r in context))
+
+    def is_terminal_rule(self, r, context):
+        return not any([self.is_nonterminal(a, context) for a in r.to or []])
+
+    def get_rules(self, nt, context):
+        return self.grammar.rules.get(nt, []) + [r for r in context if r.nt == nt]
+
+    def added_rule(self, r, context):
+        """ The bound variable rule r adds in context, the same each time """
+        key = (context, r)
+        if key not in self.added_rules:
+            self.added_rules[key] = r.make_bv_rule(self.grammar)
+        return self.added_rules[key]
+
+    # --------------------------------------------------------------------------------------------------------
+    # Enumerating
+    # --------------------------------------------------------------------------------------------------------
+
+    def trees(self, nt, d, context):
+        """ The list of trees of depth d from nt in context, memoized """
+        key = (nt, d, context)
+        if key not in self.memo:
+            self.memo[key] = list(self.stream(nt, d, context))
+        return self.memo[key]
+
+    def stream(self, nt, d, context):
+        """ Iterate over the trees of depth d from nt in context, from the memo if they are there, and without
+        storing them if not (for children that we only go through once) """
+        key = (nt, d, context)
+        if key in self.memo:
+            return self.memo[key]
+        elif self.is_nonterminal(nt, context):
+            return self.iterate(nt, d, context)
+        else:
+            return [nt] # terminal arguments are just themselves, at depth 0
+
+    def iterate(self, nt, d, context):
+        """ Yield the trees of depth d from the nonterminal nt in context """
+        if d == 0:
+            if self.leaves:
+                for r in self.get_rules(nt, context):
+                    if self.is_terminal_rule(r, context):
+                        added = self.added_rule(r, context) if isinstance(r, BVAddGrammarRule) else None
+                        yield (r, added, tuple(r.to or ()))
+            else:
+                yield nt # If not leaves, we just put the nonterminal type in the leaves
+            return
+
+        for r in self.get_rules(nt, context):
+            if self.is_terminal_rule(r, context):
+                continue # No good since it won't be deep enough
+
+            added = None
+            inner = context
+            if isinstance(r, BVAddGrammarRule):
+                added = self.added_rule(r, context)
+                inner = context + (added,)
+
+            # Nonterminal children may be any depth up to d-1, and terminal ones are depth 0.
+            # One must be exactly d-1.
+            child_depths = [xrange(d) if self.is_nonterminal(a, inner) else [0] for a in r.to]
+            for cd in product_first_fastest(child_depths):
+                if max(cd) != d-1:
+                    continue
+
+                # The last child varies slowest, so we go through its trees only once, and need not store them
+                lists = [self.trees(a, di, inner) for di, a in zip(cd[:-1], r.to[:-1])]
+                for children in product_last_streamed(lists, self.stream(r.to[-1], cd[-1], inner)):
+                    yield (r, added, children)
+
+    # --------------------------------------------------------------------------------------------------------
+    # Making trees
+    # --------------------------------------------------------------------------------------------------------
+
+    def make_FunctionNode(self, x, parent):
+        """ A new FunctionNode from the tree x """
+        return make_FunctionNode(self.grammar, x, parent)
+
+    def make_CompactTree(self, x):
+        """ A CompactTree from the tree x, which must be complete and not use bound variables from outside it """
+        assert not isinstance(x, str), "*** Cannot compact a nonterminal %s" % x
+        table = self.grammar.rule_table()
+        rules, bvnames = array('H'), []
+        self.compact_rec(x, table, rules, bvnames, [])
+        return CompactTree(table, rules, tuple(bvnames))
+
+    def compact_rec(self, x, table, rules, bvnames, scope):
+        r, added, children = x
+        if isinstance(r, BVUseGrammarRule):
+            assert r in scope, "*** Cannot compact a tree with a free bound variable %s" % r.name
+            rules.append(table.nrules + scope.index(r)) # each context has its own rules, so there is only one
+        else:
+            rules.append(table.sig2idx[r.get_rule_signature()])
+
+        if added is not None:
+            bvnames.append(added.name)
+            scope.append(added)
+
+        for c in children:
+            if not isinstance(c, str):
+                self.compact_rec(c, table, rules, bvnames, scope)
+            else:
+                assert not self.is_nonterminal(c, tuple(scope)), "*** Only complete trees can be compacted"
+
+        if added is not None:
+            scope.pop()
+
+
+class TreeCounter(object):
+    """
+    The number of trees of each depth from each nonterminal, and their total prior probability, by dynamic
+    programming. The trees are those Enumerator(grammar, leaves=leaves) would give (so if leaves is False, depth 0
+    is just the nonterminal, with probability 1, and the probabilities are of the tops of trees).
+
+    Counts and masses only depend on which kinds of bound variables are in scope, not on their names, so we key the
+    memo on a context of (type, args, p) for each bound variable rule in scope.
+
+    The grammar must not change while we use this.
+    """
+
+    def __init__(self, grammar, leaves=True):
+        self.grammar = grammar
+        self.leaves = leaves
+        self.memo = dict()  # (nt, d, context) -> (count, mass) of the trees of exactly depth d
+
+    def start_context(self):
+        return tuple([(r.nt, tuple(r.to) if r.to is not None else None, r.p)
+                      for r in reversed(list(self.grammar.iterate_bv_scope()))])
+
+    def count(self, d, nt=None):
+        """ How many trees of depth d (no deeper or shallower) there are from nt """
+        return self.count_and_mass(nt, d, self.start_context())[0]
+
+    def mass(self, d, nt=None):
+        """ The total prior probability of the trees of depth d from nt """
+        return self.count_and_mass(nt, d, self.start_context())[1]
+
+    def cumulative_count(self, d, nt=None):
+        """ How many trees of depth up to d there are from nt """
+        return self.cumulative(nt, d, self.start_context())[0]
+
+    def cumulative_mass(self, d, nt=None):
+        """ The total prior probability of the trees of depth up to d from nt """
+        return self.cumulative(nt, d, self.start_context())[1]
+
+    # --------------------------------------------------------------------------------------------------------
+    # The grammar, in a context
+    # --------------------------------------------------------------------------------------------------------
+
+    def is_nonterminal(self, x, context):
+        return isinstance(x, str) and (x in self.grammar.rules or any(b[0] == x for b in context))
+
+    def rules(self, nt, context):
+        """ A list of (p, to, added) for each rule of nt in context, where added is the bound variable it adds """
+        out = []
+        for r in self.grammar.rules.get(nt, []):
+            added = None
+            if isinstance(r, BVAddGrammarRule):
+                b = r.make_bv_rule(self.grammar)
+                added = (b.nt, tuple(b.to) if b.to is not None else None, b.p)
+            out.append((r.p, r.to, added))
+        out.extend([(p, to, None) for x, to, p in context if x == nt])
+        return out
+
+    # --------------------------------------------------------------------------------------------------------
+    # Counting
+    # --------------------------------------------------------------------------------------------------------
+
+    def cumulative(self, nt, d, context):
+        """ The count and mass of the trees of depth up to d """
+        if nt is None:
+            nt = self.grammar.start
+        n, m = 0, 0.0
+        for i in xrange(d+1):
+            c, x = self.count_and_mass(nt, i, context)
+            n += c
+            m += x
+        return n, m
+
+    def count_and_mass(self, nt, d, context):
+        """ The count and mass of the trees of exactly depth d from nt in context, memoized """
+        if nt is None:
+            nt = self.grammar.start
+
+        key = (nt, d, context)
+        if key in self.memo:
+            return self.memo[key]
+
+        if d < 0:
+            return 0, 0.0
+        if not self.is_nonterminal(nt, context):
+            return (1, 1.0) if d == 0 else (0, 0.0) # terminal arguments are just themselves, at depth 0
+        if d == 0 and not self.leaves:
+            return 1, 1.0
+
+        rules = self.rules(nt, context)
+        z = sum([p for p, _, _ in rules])
+        n, m = 0, 0.0
+        for p, to, added in rules:
+            inner = context + (added,) if added is not None else context
+            children = [a for a in to or [] if self.is_nonterminal(a, inner)]
+
+            if d == 0:
+                if not children:
+                    n += 1
+                    m += p / z
+            elif children:
+                # One child must be exactly d-1 deep, so these are the trees with all children up to d-1, less those
+                # with all up to d-2.
+                n1, m1, n2, m2 = 1, 1.0, 1, 1.0
+                for a in children:
+                    c1, x1 = self.cumulative(a, d-1, inner)
+                    c2, x2 = self.cumulative(a, d-2, inner)
+                    n1, m1, n2, m2 = n1*c1, m1*x1, n2*c2, m2*x2
+                n += n1 - n2
+                m += (p / z) * (m1 - m2)
+
+        self.memo[key] = (n, m)
+        return n, m
+
+
+# ------------------------------------------------------------------------------------------------------------
+# Best-first enumeration
+# ------------------------------------------------------------------------------------------------------------
+
+def best_completion_log_probabilities(grammar, context=()):
+    """
+    A dictionary from each nonterminal (and bound variable type) to an upper bound on the log probability of any
+    complete tree from it, in context or in any context inside it.
+
+    Each rule's log probability is bounded by log(p/z), with z its nonterminal's total p without bound variables
+    (any in scope only make z larger). A bound variable of type T with probability p can be used with at most
+    log(p/(z_T + p)), since it is in scope itself. We find the best trees from these, in the manner of Knuth's
+    generalization of Dijkstra's algorithm, by relaxing until nothing changes.
+    """
+    def z(nt):
+        return grammar.nonterminal_table(nt).z if nt in grammar.rules else 0.0
+
+    # each choice is (nt, log probability bound, children)
+    choices = []
+    for nt in grammar.nonterminals():
+        for r in grammar.rules[nt]:
+            if r.p > 0.0:
+                choices.append((nt, log(r.p) - log(z(nt)), r.to or []))
+
+    for r in list(grammar) + list(context):
+        if isinstance(r, BVAddGrammarRule):
+            r = r.make_bv_rule(grammar)
+        elif not isinstance(r, BVUseGrammarRule):
+            continue
+
+        if r.p > 0.0:
+            choices.append((r.nt, log(r.p / (z(r.nt) + r.p)), r.to or []))
+
+    best = dict([(nt, -Infinity) for nt, _, _ in choices])
+    for nt in grammar.nonterminals():
+        best.setdefault(nt, -Infinity)
+
+    def child_bound(a):
+        # Arguments that are not the grammar's nonterminals may be terminals, or bound variable types with
+        # nothing in scope, which are left as they are.
+        return best[a] if a in grammar.rules else 0.0
+
+    changed = True
+    while changed:
+        changed = False
+        for nt, lp, to in choices:
+            v = lp + sum([child_bound(a) for a in to])
+            if v > best[nt]:
+                best[nt] = v
+                changed = True
+    return best
+
+
+def enumerate_by_probability(grammar, nt=None, min_lp=-Infinity, max_count=Infinity):
+    """
+    Yield the complete trees from nt in order of decreasing log probability (ties in no particular order), until
+    the next would have log probability below min_lp, or we have yielded max_count of them.
+
+    We expand partial trees leftmost nonterminal first, so each tree is reached in only one way. A partial tree is
+    (lp, bound, choices, pending): choices is a linked list (most recent first) of the (rule, added_rule, expanded)
+    made so far, where expanded says which of the rule's arguments were nonterminals; pending is a linked list of
+    (nonterminal, context, bound) still to expand, where bound is the sum of the best completions of it and those
+    after it.
+    """
+    if nt is None:
+        nt = grammar.start
+
+    context = tuple(reversed(list(grammar.iterate_bv_scope())))
+    enumerator = Enumerator(grammar)
+    if not enumerator.is_nonterminal(nt, context):
+        if max_count > 0:
+            yield nt
+        return
+
+    best = best_completion_log_probabilities(grammar, context)
+
+    def log_normalizer(x, ctx):
+        z = sum([r.p for r in ctx if r.nt == x], grammar.nonterminal_table(x).z if x in grammar.rules else 0.0)
+        return log(z) if z > 0.0 else -Infinity
+
+    counter = 0 # breaks ties in the queue, so we never compare the rest
+    queue = [(-best[nt], counter, 0.0, None, (nt, context, best[nt], None))]
+    count = 0
+    while queue and count < max_count:
+        priority, _, lp, choices, pending = heappop(queue)
+        if -priority < min_lp or -priority == -Infinity:
+            break
+
+        if pending is None:
+            yield make_FunctionNode(grammar, unflatten(choices))
+            count += 1
+            continue
+
+        x, ctx, _, rest = pending
+        lz = log_normalizer(x, ctx)
+        for r in enumerator.get_rules(x, ctx):
+            if r.p <= 0.0:
+                continue
+
+            added, inner = None, ctx
+            if isinstance(r, BVAddGrammarRule):
+                added = r.make_bv_rule(grammar)
+                inner = ctx + (added,)
+
+            to = r.to or []
+            expanded = tuple([enumerator.is_nonterminal(a, inner) for a in to])
+
+            # push the nonterminal children on the front, so that the first is expanded next
+            p = rest
+            for a, e in reversed(zip(to, expanded)):
+                if e:
+                    p = (a, inner, best[a] + (p[2] if p is not None else 0.0), p)
+
+            newlp = lp + log(r.p) - lz
+            bound = p[2] if p is not None else 0.0
+            if newlp + bound > -Infinity and newlp + bound >= min_lp:
+                counter += 1
+                heappush(queue, (-(newlp + bound), counter, newlp, ((r, added, expanded), choices), p))
+
+
+def unflatten(choices):
+    """ The tree (as a tuple, see Enumerator) from a linked list of choices, most recent first """
+    order = []
+    while choices is not None:
+        order.append(choices[0])
+        choices = choices[1]
+    it = reversed(order)
+
+    def build():
+        r, added, expanded = it.next()
+        return (r, added, tuple([build() if e else a for a, e in zip(r.to or [], expanded)]))
+    return build()
@@ -46,15 +46,15 @@ def ifU_(C,X):
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
 from LOTlib.Miscellaneous import random, weighted_sample
-from LOTlib.DataAndObjects import FunctionData, sample_sets_of_objects, make_all_objects
+from LOTlib.DataAndObjects import FunctionData, Dataset, sample_sets_of_objects, make_all_objects
 
 WORDS = ['one_', 'two_', 'three_', 'four_', 'five_', 'six_', 'seven_', 'eight_', 'nine_', 'ten_']
 
 def make_data(data_size=300, alpha=0.75):
     """
-    Sample some data according to the target
+    Sample some data according to the target. This is a Dataset, since many of the data are the same
     """
-    data = []
+    data = Dataset()
     for i in range(data_size):
         # how many in this set
         set_size = weighted_sample( range(1,10+1), probs=[7187, 1484, 593, 334, 297, 165, 151, 86, 105, 112] )
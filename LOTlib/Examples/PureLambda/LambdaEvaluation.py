@@ -6,7 +6,7 @@
 
 from copy import copy
 from LOTlib.Eval import EvaluationException
-from LOTlib.FunctionNode import FunctionNode, BVAddFunctionNode, BVUseFunctionNode, percent_s_regex
+from LOTlib.FunctionNode import FunctionNode, BVAddFunctionNode, BVUseFunctionNode
 
 MAX_RECURSE_DEPTH = 25
 MAX_NODES = 50 # how many is the max, in all stages of eval?
@@ -42,7 +42,7 @@ def lambdastring(fn, d=0, bv_names=None):
         return bv_names[fn.name]
     else:
         assert fn.args is None
-        assert not percent_s_regex(fn.name), "*** String formatting not yet supported for lambdastring"
+        assert '%s' not in fn.name, "*** String formatting not yet supported for lambdastring"
         return str(fn.name)
 
 def lambda_reduce(fn):
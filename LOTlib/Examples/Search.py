@@ -16,9 +16,10 @@ import codecs
 import LOTlib
 from LOTlib.Miscellaneous import q, display_option_summary, qq
 from LOTlib.FunctionNode import cleanFunctionNodeString
-from LOTlib.MPI.MPI_map import MPI_unorderedmap, is_master_process
+from LOTlib.MPI.MPI_map import MPI_unorderedmap, is_master_process, get_size
 
 from LOTlib.Inference.Samplers.StandardSample import standard_sample
+from LOTlib.Hypotheses.LikelihoodStore import DataPrefix, likelihood_store
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 # the main sampling function to run
@@ -36,6 +37,19 @@ def run(make_hypothesis, make_data, data_size):
                            steps=options.STEPS,
                            show=False,save_top=None)
 
+def run_prefix(make_hypothesis, data, data_size):
+    """
+    Like run, but on the first data_size of data, so likelihoods come from (and go into) the likelihood store
+    """
+    if LOTlib.SIG_INTERRUPTED:
+        return set()
+
+    return standard_sample(make_hypothesis,
+                           lambda: DataPrefix(data, data_size),
+                           N=options.TOP_COUNT,
+                           steps=options.STEPS,
+                           show=False,save_top=None)
+
 
 if __name__ == "__main__":
 
@@ -54,6 +68,10 @@ if __name__ == "__main__":
     parser.add_option("--dmax", dest="DATA_MAX", type="int", default=0, help="Max data to run")
     parser.add_option("--dstep", dest="DATA_STEP", type="int", default=0, help="Step size for varying data")
     parser.add_option("--evaldata", dest="EVAL_DATA", type="int", default=1000, help="If specified, we'll print everything evaled on this amount.")
+    parser.add_option("--likelihood-store", dest="LIKELIHOOD_STORE", type="string", default=None,
+                      help="If specified, each chain samples one data set and runs on prefixes of it, keeping "
+                           "likelihoods in this file (a pickle of the LikelihoodStore) for the next run. "
+                           "Not supported under MPI.")
     parser.add_option("--model", dest="MODEL", type="string", default="Number", help="Which model do we run? (e.g. 'Number', 'Magnetism.Simple', etc.")
     parser.add_option("--alsoprint", dest="ALSO_PRINT", type="string", default="None",
                       help="A function of a hypothesis we can also print at the start of a line to see things we "
@@ -62,6 +80,9 @@ if __name__ == "__main__":
 
     alsoprint = eval(options.ALSO_PRINT)
 
+    # each process would have its own store, and only the master's (which runs no chains) would be saved
+    assert options.LIKELIHOOD_STORE is None or get_size() == 1, "*** --likelihood-store cannot be used under MPI"
+
     if options.DATA_STEP > 0:
         data_amounts = range(options.DATA_MIN, options.DATA_MAX, options.DATA_STEP)
     else:
@@ -89,13 +110,21 @@ if __name__ == "__main__":
 
 
     # choose the appropriate map function
-    args = list(itertools.product([make_hypothesis],[make_data], data_amounts * options.CHAINS) )
+    if options.LIKELIHOOD_STORE is not None:
+        likelihood_store.load(options.LIKELIHOOD_STORE)
+        run_function = run_prefix
+        chain_data = [make_data(max(data_amounts)) for _ in xrange(options.CHAINS)]
+        args = list(itertools.product([make_hypothesis], chain_data, data_amounts))
+    else:
+        run_function = run
+        args = list(itertools.product([make_hypothesis],[make_data], data_amounts * options.CHAINS) )
 
     # set the output codec -- needed to display lambda to stdout
     sys.stdout = codecs.getwriter('utf8')(sys.stdout)
 
     seen = set()
-    for fs in MPI_unorderedmap(run, numpy.random.permutation(args)):
+    # NOTE: we permute indices, since numpy would try to make arrays out of the data in args
+    for fs in MPI_unorderedmap(run_function, [args[i] for i in numpy.random.permutation(len(args))]):
         assert is_master_process()
 
         for h in fs:
@@ -114,3 +143,6 @@ if __name__ == "__main__":
     with open(options.OUT_PATH, 'w') as f:
         pickle.dump(seen, f)
 
+    if options.LIKELIHOOD_STORE is not None:
+        likelihood_store.save(options.LIKELIHOOD_STORE)
+
@@ -5,7 +5,7 @@ from LOTlib.Examples.SymbolicRegression import make_hypothesis
 from math import sin
 from random import random
 from numpy.random import normal
-from LOTlib.DataAndObjects import FunctionData
+from LOTlib.DataAndObjects import FunctionData, Dataset
 
 ## The target function for symbolic regression
 def F1(x):
@@ -21,4 +21,4 @@ def make_data(n=1, target=F1, data_size=100, sd=0.1):
         y = target(x) + normal()*sd
         data.append( FunctionData(input=[x], output=y, ll_sd=sd) )
 
-    return data*n
+    return Dataset(data*n)
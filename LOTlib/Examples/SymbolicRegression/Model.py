@@ -44,19 +44,19 @@ See also: Jeffreys, W. H., and Berger, J. O. (1992), "Ockham's Razor and Bayesia
     Scientist, 80, 64-72 (Erratum, p. 116).
 """
 
-from LOTlib.DataAndObjects import FunctionData
+from LOTlib.DataAndObjects import FunctionData, Dataset
 
 # NOTE: these must be floats, else we get hung up on powers of ints
 data_sd = 50.0
 
 def make_data(n=1):
-    return [ FunctionData(input=[1000.], output=1500., ll_sd=data_sd),
-             FunctionData(input=[828.], output=1340., ll_sd=data_sd),
-             FunctionData(input=[800.], output=1328., ll_sd=data_sd),
-             FunctionData(input=[600.], output=1172., ll_sd=data_sd),
-             FunctionData(input=[300.], output=800., ll_sd=data_sd),
-             FunctionData(input=[0.], output=0., ll_sd=data_sd) # added 0,0 since it makes physical sense.
-    ]*n
+    return Dataset([ FunctionData(input=[1000.], output=1500., ll_sd=data_sd),
+                     FunctionData(input=[828.], output=1340., ll_sd=data_sd),
+                     FunctionData(input=[800.], output=1328., ll_sd=data_sd),
+                     FunctionData(input=[600.], output=1172., ll_sd=data_sd),
+                     FunctionData(input=[300.], output=800., ll_sd=data_sd),
+                     FunctionData(input=[0.], output=0., ll_sd=data_sd) # added 0,0 since it makes physical sense.
+                   ]*n) # a Dataset, so the n copies are only evaluated once
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # Hypothesis
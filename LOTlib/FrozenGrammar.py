@@ -0,0 +1,366 @@
+"""
+        A read-only, array-backed copy of a Grammar, for sending to worker processes.
+
+        A Grammar is a defaultdict of GrammarRule objects, and every worker (e.g. in MPI_map, or running one of
+        several chains) has to unpickle or rebuild that whole object graph. A FrozenGrammar stores the same rules as a
+        few numpy arrays and tuples of strings instead, so it is small and quick to pickle (and the arrays could be put
+        in shared memory). Rules are numbered as in Grammar.rule_table: by nonterminal, in sorted order, so the
+        rules of the i'th nonterminal are offsets[i]:offsets[i+1]. Every string in the grammar (nonterminals first,
+        then terminals and bound variable types) is numbered in symbols.
+
+        It can generate, compute log probabilities, pack and unpack trees (in the same format as Grammar.pack), and
+        count rules, without the grammar's GrammarRules (only the rules for bound variables are made, since trees
+        keep them). Bound variables are handled as in Grammar, except that the rules in scope are kept in a list as
+        we go, rather than in the grammar's scope.
+
+        Example:
+            frozen = grammar.freeze()
+            t = frozen.generate()
+            assert abs(frozen.log_probability(t) - grammar.log_probability(t)) < 1e-12
+            assert grammar.unpack(frozen.pack(t)) == t
+            grammar2 = frozen.thaw() # a Grammar again, e.g. for proposals
+"""
+
+from bisect import bisect_right
+from math import log
+from random import random
+
+try: import numpy as np
+except ImportError: import numpypy as np
+
+from LOTlib.Miscellaneous import Infinity
+from LOTlib.FunctionNode import FunctionNode, BVAddFunctionNode, BVUseFunctionNode
+from LOTlib.GrammarRule import BVAddGrammarRule, BVUseGrammarRule
+from LOTlib.CompactTree import encode_varints, decode_varints
+
+
+def index_array(xs):
+    """ An array of the non-negative ints xs, as int16 if they fit (as they do for most grammars), else int32 """
+    return np.array(xs, dtype=np.int16 if max(xs or [0]) < 2**15 else np.int32)
+
+
+class FrozenGrammar(object):
+    """
+    The rules of a grammar, as arrays. Make these with Grammar.freeze.
+
+    Per nonterminal: offsets (into the rules).
+    Per rule: names, p, log_p (normalized within its nonterminal), arity (-1 for a terminal, whose args are None),
+    and child_offsets (into children, which are indices into symbols).
+    Per rule that adds a bound variable: bv_rules (its index), bv_type and bv_arity (as for rules), bv_arg_offsets
+    (into bv_args), bv_p, and bv_prefixes.
+
+    The rest (e.g. the cumulative p for sampling) is computed from these when it is first needed, and not pickled.
+    """
+
+    def __init__(self, grammar):
+        self.start = grammar.start
+        self.BV_P = grammar.BV_P
+
+        nonterminals = sorted(grammar.nonterminals())
+        symbols = list(nonterminals)
+        symbol_index = dict([(s, i) for i, s in enumerate(symbols)])
+
+        def index(s):
+            if s not in symbol_index:
+                symbol_index[s] = len(symbols)
+                symbols.append(s)
+            return symbol_index[s]
+
+        offsets, names, p, log_p = [0], [], [], []
+        arity, child_offsets, children = [], [0], []
+        bv_rules, bv_type, bv_arity, bv_arg_offsets, bv_args, bv_p, bv_prefixes = [], [], [], [0], [], [], []
+        for nt in nonterminals:
+            rules = [r for r in grammar.rules[nt] if not isinstance(r, BVUseGrammarRule)]
+            z = sum([r.p for r in rules])
+
+            for r in rules:
+                if isinstance(r, BVAddGrammarRule):
+                    bv_rules.append(len(names))
+                    bv_type.append(index(r.bv_type))
+                    bv_arity.append(-1 if r.bv_args is None else len(r.bv_args))
+                    bv_args.extend([index(a) for a in r.bv_args or []])
+                    bv_arg_offsets.append(len(bv_args))
+                    bv_p.append(grammar.BV_P if r.bv_p is None else r.bv_p)
+                    bv_prefixes.append(r.bv_prefix)
+
+                names.append(r.name)
+                p.append(r.p)
+                log_p.append(log(r.p) - log(z))
+                arity.append(-1 if r.to is None else len(r.to))
+                children.extend([index(a) for a in r.to or []])
+                child_offsets.append(len(children))
+            offsets.append(len(names))
+
+        self.nnonterminals = len(nonterminals)
+        self.symbols = tuple(symbols)
+        self.names = tuple(names)
+        self.bv_prefixes = tuple(bv_prefixes)
+
+        self.offsets = index_array(offsets)
+        self.p = np.array(p, dtype=np.float64)
+        self.log_p = np.array(log_p, dtype=np.float64)
+        self.arity = np.array(arity, dtype=np.int8)
+        self.child_offsets = index_array(child_offsets)
+        self.children = index_array(children)
+
+        self.bv_rules = index_array(bv_rules)
+        self.bv_type = index_array(bv_type)
+        self.bv_arity = np.array(bv_arity, dtype=np.int8)
+        self.bv_arg_offsets = index_array(bv_arg_offsets)
+        self.bv_args = index_array(bv_args)
+        self.bv_p = np.array(bv_p, dtype=np.float64)
+
+    def __getstate__(self):
+        """The lists and dictionaries we make from the arrays (attributes starting with _) are not pickled."""
+        return dict([(k, v) for k, v in self.__dict__.items() if not k.startswith('_')])
+
+    def nrules(self):
+        return len(self.names)
+
+    def nonterminals(self):
+        return list(self.symbols[:self.nnonterminals])
+
+    def is_nonterminal(self, x, scope=()):
+        """ Is x a nonterminal, either of the grammar or of one of the bound variable rules in scope? """
+        return isinstance(x, str) and (x in self.nonterminal_index() or any(r.nt == x for r in scope))
+
+    # --------------------------------------------------------------------------------------------------------
+    # Tables made from the arrays when they are first needed in this process, since indexing numpy arrays one
+    # element at a time is slow
+    # --------------------------------------------------------------------------------------------------------
+
+    def nonterminal_index(self):
+        """ A dictionary from nonterminals to their indices """
+        if getattr(self, '_nonterminal_index', None) is None:
+            self._nonterminal_index = dict([(nt, i) for i, nt in enumerate(self.nonterminals())])
+        return self._nonterminal_index
+
+    def rule_stubs(self):
+        """
+        For each rule, a tuple (nt, name, to, bv), where to is a tuple (or None) and bv is None or a tuple
+        (bv_type, bv_args, bv_p, bv_prefix). This is all we need to make FunctionNodes.
+        """
+        if getattr(self, '_rule_stubs', None) is None:
+            symbols = self.symbols
+            offsets, arity, child_offsets, children = [a.tolist() for a in [self.offsets, self.arity,
+                                                                             self.child_offsets, self.children]]
+            bv_arity, bv_arg_offsets, bv_args = [a.tolist() for a in [self.bv_arity, self.bv_arg_offsets,
+                                                                       self.bv_args]]
+
+            bvs = dict()
+            for j, (k, t, p) in enumerate(zip(self.bv_rules.tolist(), self.bv_type.tolist(), self.bv_p.tolist())):
+                args = None
+                if bv_arity[j] >= 0:
+                    args = tuple([symbols[i] for i in bv_args[bv_arg_offsets[j]:bv_arg_offsets[j+1]]])
+                bvs[k] = (symbols[t], args, p, self.bv_prefixes[j])
+
+            stubs = []
+            for i in xrange(self.nnonterminals):
+                for k in xrange(offsets[i], offsets[i+1]):
+                    to = None
+                    if arity[k] >= 0:
+                        to = tuple([symbols[j] for j in children[child_offsets[k]:child_offsets[k+1]]])
+                    stubs.append((symbols[i], self.names[k], to, bvs.get(k)))
+            self._rule_stubs = stubs
+        return self._rule_stubs
+
+    def sig2idx(self):
+        """ A dictionary from rule signatures to rule indices (see GrammarRule.get_rule_signature) """
+        if getattr(self, '_sig2idx', None) is None:
+            self._sig2idx = dict([((nt, name) + (to or ()), k) for k, (nt, name, to, _) in enumerate(self.rule_stubs())])
+        return self._sig2idx
+
+    def tables(self):
+        """
+        offsets, z (the total p of each nonterminal's rules), cumulative (the running total of p within each
+        nonterminal, for sampling by bisection), p, and log_p, as lists. These sum in the same order as Grammar does.
+        """
+        if getattr(self, '_tables', None) is None:
+            offsets, p = self.offsets.tolist(), self.p.tolist()
+            z, cumulative = [], []
+            for i in xrange(self.nnonterminals):
+                total = 0.0
+                for k in xrange(offsets[i], offsets[i+1]):
+                    total += p[k]
+                    cumulative.append(total)
+                z.append(total)
+            self._tables = (offsets, z, cumulative, p, self.log_p.tolist())
+        return self._tables
+
+    # --------------------------------------------------------------------------------------------------------
+    # Making trees
+    # --------------------------------------------------------------------------------------------------------
+
+    def make_FunctionNodeStub(self, k, parent):
+        """ A FunctionNode for rule k, with none of its arguments realized (as GrammarRule.make_FunctionNodeStub) """
+        nt, name, to, bv = self.rule_stubs()[k]
+        args = None if to is None else list(to)
+        if bv is None:
+            return FunctionNode(parent, returntype=nt, name=name, args=args)
+
+        bvtype, bvargs, bvp, bvprefix = bv
+        added_rule = BVUseGrammarRule(bvtype, None if bvargs is None else list(bvargs), p=bvp, bv_prefix=bvprefix)
+        return BVAddFunctionNode(parent, returntype=nt, name=name, args=args, added_rule=added_rule)
+
+    def build(self, choose, x, scope, parent):
+        """
+        Make a tree from the nonterminal x. choose(x, scope) gives the rule to expand x with: either a rule index, or
+        one of the bound variable rules in scope. scope is the list of bound variable rules introduced above us,
+        outermost first.
+        """
+        c = choose(x, scope)
+        if isinstance(c, BVUseGrammarRule):
+            fn = c.make_FunctionNodeStub(self, parent)
+        else:
+            fn = self.make_FunctionNodeStub(c, parent)
+
+        if fn.added_rule is not None:
+            scope.append(fn.added_rule)
+
+        if fn.args is not None:
+            for i, a in enumerate(fn.args):
+                if self.is_nonterminal(a, scope):
+                    fn.args[i] = self.build(choose, a, scope, fn)
+
+        if fn.added_rule is not None:
+            scope.pop()
+
+        return fn
+
+    def sample_rule(self, x, scope):
+        """ Choose a rule for x in proportion to its p, as Grammar.generate does """
+        offsets, z, cumulative, _, _ = self.tables()
+        i = self.nonterminal_index().get(x)
+        lo, hi, zi = (0, 0, 0.0) if i is None else (offsets[i], offsets[i+1], z[i])
+        bvrules = [r for r in scope if r.nt == x]
+        assert hi > lo or bvrules, "*** No rules in x=%s" % x
+
+        u = random() * (sum([r.p for r in bvrules], zi) if bvrules else zi)
+        if u < zi:
+            return bisect_right(cumulative, u, lo, hi)
+
+        u -= zi
+        for r in bvrules:
+            u -= r.p
+            if u < 0.0:
+                return r
+        return bvrules[-1] if bvrules else hi-1 # only if rounding left u at the end
+
+    def generate(self, x=None):
+        """ Generate a tree from x (by default, the start symbol) """
+        if x is None:
+            x = self.start
+        if not self.is_nonterminal(x):
+            return x
+        return self.build(self.sample_rule, x, [], None)
+
+    # --------------------------------------------------------------------------------------------------------
+    # Scoring and counting trees
+    # --------------------------------------------------------------------------------------------------------
+
+    def log_normalizer(self, nt, scope=()):
+        """ The log of the total p of nt's rules, including the bound variable rules in scope """
+        i = self.nonterminal_index().get(nt)
+        z = 0.0 if i is None else self.tables()[1][i]
+        bvrules = [r for r in scope if r.nt == nt]
+        if bvrules:
+            z = sum([r.p for r in bvrules], z)
+        return log(z) if z > 0.0 else -Infinity
+
+    def get_rule_index(self, t):
+        """ The index of the rule that made the (non bound variable) node t """
+        k = self.sig2idx().get(t.get_rule_signature())
+        assert k is not None, "Grammar Error: no matching rule for this FunctionNode! %s %s" % \
+                              (t.get_rule_signature(), t)
+        return k
+
+    def log_probability(self, t, scope=None):
+        """ The log probability of generating t, as Grammar.log_probability """
+        if scope is None:
+            scope = []
+
+        if isinstance(t, BVUseFunctionNode):
+            sig = t.get_rule_signature()
+            matches = [r for r in scope if r.get_rule_signature() == sig]
+            assert len(matches) == 1, "Grammar Error: %s matching rules for this FunctionNode! %s %s" % \
+                                      (len(matches), sig, t)
+            lp = log(matches[0].p) - self.log_normalizer(t.returntype, scope)
+        else:
+            k = self.get_rule_index(t)
+            if any(r.nt == t.returntype for r in scope):
+                lp = log(self.tables()[3][k]) - self.log_normalizer(t.returntype, scope)
+            else:
+                lp = self.tables()[4][k]
+
+        if t.added_rule is not None:
+            scope.append(t.added_rule)
+        for a in t.argFunctionNodes():
+            lp += self.log_probability(a, scope)
+        if t.added_rule is not None:
+            scope.pop()
+
+        return lp
+
+    def count_rules(self, t):
+        """ An array of how many times each rule is used in t (bound variables are not counted) """
+        counts = np.zeros(self.nrules(), dtype=np.int32)
+        for x in t:
+            if not isinstance(x, BVUseFunctionNode):
+                counts[self.get_rule_index(x)] += 1
+        return counts
+
+    # --------------------------------------------------------------------------------------------------------
+    # Packing trees, in the format of Grammar.pack
+    # --------------------------------------------------------------------------------------------------------
+
+    def pack(self, t):
+        """ Pack the (complete) tree t into a string of varints, exactly as Grammar.pack would """
+        ints = []
+        self.pack_rec(t, ints, [])
+        return encode_varints(ints)
+
+    def pack_rec(self, t, ints, scope):
+        """ Append t's rule indices to ints. scope stores the bv names above us. """
+        if isinstance(t, BVUseFunctionNode):
+            assert t.name in scope, "*** Cannot pack a tree with a free bound variable %s" % t.name
+            ints.append(self.nrules() + len(scope) - 1 - scope[::-1].index(t.name))  # the innermost lambda
+        else:
+            ints.append(self.get_rule_index(t))
+
+        if t.added_rule is not None:
+            scope.append(t.added_rule.name)
+        for a in t.argFunctionNodes():
+            self.pack_rec(a, ints, scope)
+        if t.added_rule is not None:
+            scope.pop()
+
+    def unpack(self, s):
+        """ The inverse of pack (and Grammar.pack). The bound variables get new names. """
+        ints = decode_varints(s)
+        nrules = self.nrules()
+
+        def choose(x, scope):
+            i = ints.next()
+            return i if i < nrules else scope[i - nrules]
+
+        return self.build(choose, self.start, [], None)
+
+    # --------------------------------------------------------------------------------------------------------
+    # Converting back
+    # --------------------------------------------------------------------------------------------------------
+
+    def thaw(self):
+        """ A Grammar with the same rules, in the same order (so it packs trees the same way) """
+        from LOTlib.Grammar import Grammar
+
+        grammar = Grammar(BV_P=self.BV_P, start=self.start)
+        p = self.tables()[3]
+        for k, (nt, name, to, bv) in enumerate(self.rule_stubs()):
+            to = None if to is None else list(to)
+            if bv is None:
+                grammar.add_rule(nt, name, to, p[k])
+            else:
+                bvtype, bvargs, bvp, bvprefix = bv
+                grammar.add_rule(nt, name, to, p[k], bv_type=bvtype,
+                                 bv_args=None if bvargs is None else list(bvargs), bv_prefix=bvprefix, bv_p=bvp)
+        return grammar
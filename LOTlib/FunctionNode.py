@@ -6,7 +6,7 @@ from math import log
 from random import random
 
 from LOTlib.BVRuleContextManager import BVRuleContextManager
-from LOTlib.Miscellaneous import lambdaTrue, lambdaOne, self_update, nicelog
+from LOTlib.Miscellaneous import lambdaTrue, lambdaOne, nicelog
 
 
 # ------------------------------------------------------------------------------------------------------------
@@ -58,14 +58,65 @@ class FunctionNode(object):
       using get_rule_signature()
 
     """
-    NoCopy = {'self', 'parent', 'returntype', 'name', 'args', 'parent'}
+    # Every FunctionNode has exactly these attributes, so we use slots rather than a __dict__ (this saves a lot of
+    # memory and makes copying faster). The subclasses add no slots of their own, so that setto can change a
+    # node's class. Any other information a node needs to carry (e.g. p_propose in PartitionMCMC) must be
+    # stored with annotate; it is then available as an ordinary attribute.
+    #   added_rule -- the bound variable rule this node introduces (only for BVAddFunctionNode)
+    #   bv_prefix -- the prefix for displaying the bound variable (only for BVUseFunctionNode)
+    #   annotations -- None, or a dictionary of the annotations
+    #   _hash -- the cached structural hash (see __hash__)
+    #   _free -- the bound variables introduced above us that _hash was computed for (see hash_and_free_bvs)
+    #   _size -- the cached number of nodes below (and including) this one (see subtree_weight)
+    __slots__ = ['parent', 'returntype', 'name', 'args', 'added_rule', 'bv_prefix', 'annotations',
+                 '_hash', '_free', '_size']
 
     def __init__(self, parent, returntype, name, args):
-        self_update(self,locals())
+        self.parent = parent
+        self.returntype = returntype
+        self.name = name
+        self.args = args
         self.added_rule = None
-        
+        self.bv_prefix = None
+        self.annotations = None
+        self._hash = None
+        self._free = ()
+        self._size = None
+
         assert self.name is None or isinstance(self.name, str)
 
+    def annotate(self, k, v):
+        """Store some extra information v on this node, so that self.k == v. This is copied with the node."""
+        if self.annotations is None:
+            self.annotations = dict()
+        self.annotations[k] = v
+
+    def __getattr__(self, k):
+        # Only called when k is not a slot, so we look in the annotations
+        if k != 'annotations' and self.annotations is not None and k in self.annotations:
+            return self.annotations[k]
+        raise AttributeError(k)
+
+    def __getstate__(self):
+        # The parent is not saved, so that pickling (or deepcopying) a node only saves the tree below it.
+        # __setstate__ puts the kids' parent refs back.
+        return dict([(k, getattr(self, k)) for k in FunctionNode.__slots__ if k != 'parent'])
+
+    def __setstate__(self, state):
+        """Restore from __getstate__, or from the __dict__ of a FunctionNode pickled before we used slots."""
+        self.parent, self.added_rule, self.bv_prefix, self.annotations = None, None, None, None
+        self._hash, self._free, self._size = None, (), None
+        for k, v in state.items():
+            if k == 'parent':
+                pass
+            elif k in FunctionNode.__slots__:
+                setattr(self, k, v)
+            else:
+                self.annotate(k, v)
+
+        for a in self.argFunctionNodes():
+            a.parent = self
+
     def setto(self, q):
         """Makes all the parts the same as q, not copies.
 
@@ -73,7 +124,8 @@ class FunctionNode(object):
 
         """
         old_parent = self.parent        # preserve my parent
-        self.__dict__ = q.__dict__
+        for k in FunctionNode.__slots__:
+            setattr(self, k, getattr(q, k))
         self.__class__ = q.__class__    # to update in case q is a different subtype of FunctionNode.
                                         # NOTE: Setting __class__ is not a recommended thing to do.
         # and we must fix the kid refs. Everything else should be right.
@@ -81,6 +133,20 @@ class FunctionNode(object):
             a.parent = self
         self.parent = old_parent
 
+        # q's cached values are still right for q, but everything above us has changed
+        if self.parent is not None:
+            self.parent.invalidate_cache()
+
+    def invalidate_cache(self):
+        """Clear the cached structural values (the hash and size) on this node and every node above it.
+
+        setto does this for you, but this must be called if you change args or name in place on a tree
+        that may have been hashed.
+
+        """
+        for x in self.up_to(to=None):
+            x._hash, x._size = None, None
+
     def get_rule_signature(self):
         """ The rule signature is used to pair up FunctionNodes with GrammarRules in computing log probability
             So it needs to be synced to GrammarRule.get_rule_signature and provide a unique identifier
@@ -91,7 +157,7 @@ class FunctionNode(object):
         return tuple(sig)
 
     def __copy__(self, shallow=False):
-        """Copy a function node.
+        """Copy a function node (of any subclass).
 
         Arguments
         ---------
@@ -103,23 +169,30 @@ class FunctionNode(object):
         The rule is NOT deeply copied (regardless of shallow)
 
         """
-        fn = FunctionNode(self.parent, self.returntype, self.name, None)
-
-        # And then then copy the rest -- needed for if we add info to FunctionNodes, like a resample_p
-        for k in set(self.__dict__.keys()).difference(FunctionNode.NoCopy): # None of these!
-            fn.__dict__[k] = copy(self.__dict__[k])
+        fn = object.__new__(type(self))
+        fn.parent = self.parent
+        fn.returntype = self.returntype
+        fn.name = self.name
+        fn.added_rule = None if self.added_rule is None else copy(self.added_rule) ## TODO: We should not need to copy added_rule
+        fn.bv_prefix = self.bv_prefix
+        fn._hash, fn._free, fn._size = self._hash, self._free, self._size
+
+        # And then then copy the annotations, like a resample_p
+        if self.annotations is None:
+            fn.annotations = None
+        else:
+            fn.annotations = dict([(k, copy(v)) for k, v in self.annotations.items()])
 
         if (not shallow) and self.args is not None:
-            fn.args = map(copy, self.args)
+            fn.args = [a.__copy__() if isinstance(a, FunctionNode) else copy(a) for a in self.args]
+            for a in fn.args:
+                if isinstance(a, FunctionNode):
+                    a.parent = fn
         else:
             fn.args = self.args
 
-        # and update 
-        for a in fn.argFunctionNodes():
-            a.parent = fn 
+        return fn
 
-        return fn 
-        
     def is_nonfunction(self):
         """Returns True if the Node contains no function arguments, False otherwise."""
         return self.args is None
@@ -243,31 +316,81 @@ class FunctionNode(object):
         NOTE: We need to do thsi using fullstring instead of pystring in order to avoid the fact that pystring ignores
         returntypes and nodes whose name is ''
 
+        NOTE: This gives the same answer as comparing fullstrings, but never builds them. We first compare the
+            (cached) hashes, and only walk the two trees if those match. See structurally_equal.
+
         """
-        return fullstring(self) == fullstring(other)
+        if self is other:
+            return True
+        elif not isFunctionNode(other):
+            return False
+        else:
+            return structurally_equal(self, other)
 
-    # TODO: overwrite these with something faster
-    # hash trees. This just converts to string -- maybe too slow?
     def __hash__(self):
-        # # An attempt to speed things up -- not so great!
-        # hsh = self.ruleid
-        # if self.args is not None:
-        #     for a in filter(isFunctionNode, self.args):
-        #         hsh = hsh ^ hash(a)
-        # return hsh
-        #
-        # # use a quicker string hash
-        # return hash(self.quickstring())
+        """A structural (Merkle-style) hash, built from my rule signature and my kids' hashes.
+
+        This is cached on each node and only recomputed for nodes whose cache was cleared by invalidate_cache,
+        so re-hashing a tree after a proposal only costs the path from the changed node up to the root.
 
-        # normal string hash -- faster?
-        return hash(str(self))
+        Note
+        ----
+        Bound variables are hashed by their de Bruijn index (how many lambdas up they were introduced, see
+        BVUseFunctionNode.bv_index) rather than their uuid, so that trees that are equal under fullstring
+        (which renames bound variables by depth) always hash equally. The indices are found on the way down (see
+        hash_and_free_bvs), so a node that uses variables introduced above it hashes them by their uuid here,
+        and by their index when it is hashed as part of the whole tree.
+
+        """
+        if self._hash is None or self._free:
+            return self.hash_and_free_bvs(dict(), 0)[0]
+        return self._hash
+
+    def hash_and_free_bvs(self, depths, n):
+        """Compute the hash of this node and the names of the bound variables used below it but introduced above
+        it.
+
+        depths maps the names of the bound variables introduced above us to how many lambdas there are above
+        (and including) the one that introduced them, and n is how many lambdas there are above us, so a variable
+        introduced above us has the index n - depths[name] here. Hashes are cached along with the indices of the
+        variables introduced above the node (in _free), and reused as long as those are the same.
+
+        """
+        if self._hash is not None and all([depths.get(name) == n-i for name, i in self._free]):
+            return self._hash, frozenset([name for name, _ in self._free])
+
+        kid_hashes, free = self.kid_hashes_and_free_bvs(depths, n)
+        h = self.structure_hash(kid_hashes, depths, n)
+        if all([name in depths for name in free]): # not if a variable is introduced above where we started
+            self._hash, self._free = h, tuple([(name, n-depths[name]) for name in free])
+        return h, free
+
+    def kid_hashes_and_free_bvs(self, depths, n):
+        """The hashes of the kids, and the names of the bound variables used below us but introduced above us."""
+        free = frozenset()
+        kid_hashes = []
+        for a in self.args or ():
+            if isinstance(a, FunctionNode):
+                h, f = a.hash_and_free_bvs(depths, n)
+                free = free.union(f)
+                kid_hashes.append(h)
+            else:
+                kid_hashes.append(hash(a))
+        return kid_hashes, free
+
+    def structure_hash(self, kid_hashes, depths, n):
+        """Compute (without caching) the hash of this node, given the hashes of the kids."""
+        if self.args is None:
+            return hash((self.returntype, self.name))
+        else:
+            return hash((self.returntype, self.name, tuple(kid_hashes)))
 
 
     def __cmp__(self, x):
         return cmp(str(self), str(x))
 
     def __len__(self):
-        return len([a for a in self])
+        return self.subtree_weight()
 
     def log_probability(self):
         """Compute the log probability of a tree."""
@@ -340,32 +463,43 @@ class FunctionNode(object):
         ----
         * This will NOT work if you modify the tree. Then all goes to hell.
         * If the tree must be modified, use self.subnodes().
+        * This (and iterdepth, all_leaves, iterate_subnodes) uses an explicit stack rather than recursive
+          generators, so that each node costs O(1) rather than O(depth) and deep trees do not hit the recursion limit.
 
         """
-        yield self
+        stack = [self]
+        while stack:
+            x = stack.pop()
+            yield x
 
-        for a in self.argFunctionNodes():
-            for ssn in a:
-                yield ssn
+            # push the kids (after yielding x, like the recursive version) so that the first comes out next
+            if x.args is not None:
+                for a in reversed(x.args):
+                    if isinstance(a, FunctionNode):
+                        stack.append(a)
 
     def iterdepth(self):
         """Iterates subnodes, yielding node and depth."""
-        yield (self, 0)
+        stack = [(self, 0)]
+        while stack:
+            x, d = stack.pop()
+            yield (x, d)
 
-        if self.args is not None:
-            for a in self.argFunctionNodes():
-                for ssn, dd in a.iterdepth():
-                    yield (ssn, dd+1)
+            if x.args is not None:
+                for a in reversed(x.args):
+                    if isinstance(a, FunctionNode):
+                        stack.append((a, d+1))
 
     def all_leaves(self):
         """Returns a generator for all leaves of the subtree rooted at the instantiated FunctionNode."""
-        if self.args is not None:
-            for i in range(len(self.args)):  # loop through kids
-                if isFunctionNode(self.args[i]):
-                    for ssn in self.args[i].all_leaves():
-                        yield ssn
-                else:
-                    yield self.args[i]
+        stack = [self]
+        while stack:
+            x = stack.pop()
+            if isinstance(x, FunctionNode):
+                if x.args is not None:
+                    stack.extend(reversed(x.args))
+            else:
+                yield x
 
     def string_below(self, sep=" "):
         """The string of terminals (leaves) below the current FunctionNode in the parse tree.
@@ -395,13 +529,87 @@ class FunctionNode(object):
             yield ptr
             ptr = ptr.parent
 
+    def path_to(self, n):
+        """Return the list of nodes going down from self to its subnode n (both included), or None if n is not below self.
+
+        This does not trust n's parent refs, so it gives the real path even in a tree made by path_copy.
+
+        """
+        # Going up n's parent refs gives n's position (the index of each node among its parent's args). In a tree
+        # made by path_copy these refs may lead into an older tree, but one where everything is at the same position,
+        # so we follow the positions back down from self, and only search the whole tree if that does not find n.
+        positions = []
+        x = n
+        while (x is not self) and (x.parent is not None) and (x.parent.args is not None):
+            i = [j for j, a in enumerate(x.parent.args) if a is x]
+            if not i:
+                break
+            positions.append(i[0])
+            x = x.parent
+
+        path = [self]
+        for i in reversed(positions):
+            if path[-1].args is None or i >= len(path[-1].args) or not isFunctionNode(path[-1].args[i]):
+                break
+            path.append(path[-1].args[i])
+
+        if path[-1] is n:
+            return path
+
+        path = []
+        if self.path_to_rec(n, path):
+            path.reverse()
+            return path
+        else:
+            return None
+
+    def path_to_rec(self, n, path):
+        # Helper for path_to: if n is below self, append the nodes from n up to self to path and return True
+        if self is n or any(a.path_to_rec(n, path) for a in self.argFunctionNodes()):
+            path.append(self)
+            return True
+        return False
+
+    def path_copy(self, n, replacement):
+        """Return a new tree that is self with its subnode n replaced by replacement. self is not changed.
+
+        Only the nodes on the path from self down to n are copied; every other subtree is shared between self and
+        the returned tree. This takes O(depth) copies, rather than the O(size) of copy(self) followed by setto.
+
+        Note
+        ----
+        The shared subtrees keep their parent refs into self (or whatever tree they were shared from). Going up
+        from them passes through nodes with the same rules and bound variables as their real ancestors (none of
+        these can have been regenerated, or the subtree would not be shared), so BVRuleContextManager(recurse_up=True)
+        and sampling probabilities come out right. But those nodes may have different subtrees, so code that needs
+        the actual ancestors must use path_to. Such trees must be treated as immutable: copy() one (which gives it
+        its own parent refs) before changing it in place.
+
+        """
+        path = self.path_to(n)
+        assert path is not None, "*** %s is not a subnode of %s" % (n, self)
+
+        # Walk back up the path, copying each node and pointing the copy at its new kid
+        new = replacement
+        for old, kid in reversed(zip(path[:-1], path[1:])):
+            c = old.__copy__(shallow=True)
+            c.args = [new if a is kid else a for a in old.args]
+            c._hash, c._size = None, None
+            new.parent = c
+            new = c
+        new.parent = self.parent
+
+        return new
+
     def count_nodes(self, **kwargs):
         """Returns the subnode count."""
         return self.count_subnodes(**kwargs)
 
     def count_subnodes(self, predicate=lambdaTrue):
-        """Returns the subnode count."""
-        return len(filter(predicate, self))
+        """Returns the subnode count. Without a predicate, this is cached (see subtree_weight)."""
+        if predicate is lambdaTrue:
+            return self.subtree_weight()
+        return sum(1 for x in self if predicate(x))
 
     def depth(self):
         """Returns the depth of the tree (how many embeddings below)."""
@@ -409,13 +617,40 @@ class FunctionNode(object):
         depths.append(-1)  # for no function nodes (+1=0)
         return max(depths)+1
 
+    def subtree_weight(self, resampleProbability=lambdaOne):
+        """The sum of resampleProbability over all my subnodes. With lambdaOne (the default), this is the node count.
+
+        Like the hash, the counts are cached on each node and only recomputed for nodes whose cache was cleared by
+        invalidate_cache, so after a proposal this only costs the path from the changed node up to the root. Sums
+        of other functions take a pass over the tree.
+        """
+        if resampleProbability is lambdaOne:
+            if self._size is None:
+                self.count_sizes()
+            return self._size
+        else:
+            return sum([1.0*resampleProbability(x) for x in self])
+
+    def count_sizes(self):
+        """Fill in the cached counts (see subtree_weight) on every node below that lacks them."""
+        # post-order, so each node's kids are counted before it
+        stack = [(self, False)]
+        while stack:
+            x, kids_counted = stack.pop()
+            if kids_counted:
+                x._size = 1 + sum([a._size for a in x.argFunctionNodes()])
+            elif x._size is None:
+                stack.append((x, True))
+                if x.args is not None:
+                    stack.extend([(a, False) for a in x.args if isinstance(a, FunctionNode)])
+
     def sample_node_normalizer(self, resampleProbability=lambdaOne):
         """
         Compute Z to be the sum of all subnodes' value from resampleProbability.
         * resampleProbability -- a function that gives the resample probability (NOT log prob.) of each node.
         NOTE: We allow resampleProbability to return a boolean, for 0/1 probability.
         """
-        return sum([ 1.0*resampleProbability(x) for x in self])
+        return self.subtree_weight(resampleProbability=resampleProbability)
 
     def sampling_log_probability(self,node,resampleProbability=lambdaOne):
         return nicelog(1.0*resampleProbability(node)) - nicelog(self.sample_node_normalizer(resampleProbability=resampleProbability))
@@ -425,6 +660,10 @@ class FunctionNode(object):
 
         We return a sampled tree and the log probability of sampling it
 
+        With lambdaOne, whose sums are the cached counts (see subtree_weight), this goes straight down from the
+        root, choosing each kid with probability proportional to its subtree's size, in O(depth) rather than
+        O(size). Either way, the same random number picks out the same node.
+
         """
         Z = self.sample_node_normalizer(resampleProbability=resampleProbability) # the total probability
         if not (Z > 0.0):
@@ -432,13 +671,37 @@ class FunctionNode(object):
 
         r = random() * Z # now select a random number (giving a random node)
 
-        for t in self:
+        if resampleProbability is not lambdaOne:
+            for t in self:
+                trp = float(resampleProbability(t))
+                r -= trp
+                if r <= 0:
+                    return [t, log(trp) - log(Z)]
+
+            assert False, "Should not get here"
+
+        # r is somewhere among t's subnodes (in the order of iteration): either t itself, or in one of its kids' subtrees
+        t = self
+        while True:
             trp = float(resampleProbability(t))
             r -= trp
             if r <= 0:
                 return [t, log(trp) - log(Z)]
 
-        assert False, "Should not get here"
+            below = None
+            for a in t.argFunctionNodes():
+                w = a.subtree_weight(resampleProbability)
+                if w > 0:
+                    below = a
+                if r <= w:
+                    break
+                r -= w
+            else:
+                if below is not None: # rounding error left r just past the end
+                    r = min(r, below.subtree_weight(resampleProbability))
+
+            assert below is not None, "Should not get here"
+            t = below
 
     # get a description of the input and output types
     # if collapse_terminal then we just map non-FunctionNodes to "TERMINAL"
@@ -587,6 +850,7 @@ class FunctionNode(object):
 
         ret = self.__copy__(shallow=True)  # don't copy kids
         ret.args = newargs
+        ret.invalidate_cache()
 
         return ret
 
@@ -640,22 +904,43 @@ class FunctionNode(object):
         recurse_up : bool
             Do we recurse all the way up and add all above nodes too?
         """
-        if not t:
+        if t is None:
             t = self
-        if predicate(t):
-            yield (t, d) if yield_depth else t
-
-        # Define a new context that is the grammar with the rule added.
-        # Then, when we exit, it's still right.
-        with BVRuleContextManager(grammar, t, recurse_up=recurse_up):
-            for a in t.argFunctionNodes():
-                # Pass up anything from below
-                for g in self.iterate_subnodes(grammar, a, d=d+1, yield_depth=yield_depth,
-                                               predicate=predicate, recurse_up=False): # we never have to recurse up
-                    yield g
-
-
 
+        # The stack holds (node, depth) to visit, and EXIT_CONTEXT wherever we must leave the context of the node
+        # we went down from. A node only needs a context if it adds a rule (or, at the top, if we recurse_up).
+        stack = [(t, d)]
+        contexts = []
+        try:
+            while stack:
+                x = stack.pop()
+                if x is EXIT_CONTEXT:
+                    contexts.pop().__exit__(None, None, None)
+                    continue
+
+                n, dn = x
+                if predicate(n):
+                    yield (n, dn) if yield_depth else n
+
+                if n.args is not None:
+                    # Define a new context that is the grammar with the rule added.
+                    # Then, when we are done with the kids, it's still right.
+                    if n.added_rule is not None or (recurse_up and n is t):
+                        c = BVRuleContextManager(grammar, n, recurse_up=recurse_up and n is t) # we never have to recurse up below t
+                        c.__enter__()
+                        contexts.append(c)
+                        stack.append(EXIT_CONTEXT)
+
+                    for a in reversed(n.args):
+                        if isinstance(a, FunctionNode):
+                            stack.append((a, dn+1))
+        finally:
+            # if we stopped early, take out any rules that are still added
+            while contexts:
+                contexts.pop().__exit__(None, None, None)
+
+
+EXIT_CONTEXT = object() # a marker for iterate_subnodes
 
 
 # ============================================================================================================
@@ -668,11 +953,27 @@ class BVAddFunctionNode(FunctionNode):
 
     This should almost never need to be called, as it is defaultly handled by LOTlib.Grammar
     """
+    __slots__ = () # see FunctionNode.__slots__
+
     def __init__(self, parent, returntype, name, args,  added_rule=None):
         FunctionNode.__init__(self, parent, returntype, name, args)
         self.added_rule = added_rule
         assert added_rule is not None, "*** Cannot use BVAddFunctionNode if added_rule is None!"
 
+    def structure_hash(self, kid_hashes, depths, n):
+        # The added rule's name is a uuid, so we hash only its prefix (as fullstring does)
+        return hash((FunctionNode.structure_hash(self, kid_hashes, depths, n), self.added_rule.bv_prefix))
+
+    def kid_hashes_and_free_bvs(self, depths, n):
+        # Our kids are below one more lambda, which introduces our variable
+        name = self.added_rule.name
+        depths[name] = n+1
+        try:
+            kid_hashes, free = FunctionNode.kid_hashes_and_free_bvs(self, depths, n+1)
+        finally:
+            del depths[name]
+        return kid_hashes, free - frozenset([name])
+
     def uses_bv(self):
         """ Is my rule used below? """
         for a in self.argFunctionNodes():
@@ -681,31 +982,6 @@ class BVAddFunctionNode(FunctionNode):
                     return True
         return False
 
-    def __copy__(self, shallow=False):
-        """Copy a function node.
-                
-        Note
-        ----
-        The rule is NOT deeply copied (regardless of shallow)
-
-        Arguments
-        ---------
-        shallow: if True, this does not copy the children (self.to points to the same as what we return)
-
-        """
-        fn = BVAddFunctionNode(self.parent, self.returntype, self.name, None,
-            added_rule=copy(self.added_rule)) ## TODO: We should not need to copy added_rule
-
-        if (not shallow) and self.args is not None:
-            fn.args = map(copy, self.args)
-        else:
-            fn.args = self.args
-
-        for a in fn.argFunctionNodes():
-            a.parent = fn
-
-        return fn
-
     def as_list(self, d=0, bv_names=None):
         """Returns a list representation of the FunctionNode with function/self.name as the first element.
 
@@ -744,10 +1020,38 @@ class BVUseFunctionNode(FunctionNode):
     """
     A FunctionNode that uses a bound variable. As in, the use of "x" in lambda x: x+1
     """
+    __slots__ = () # see FunctionNode.__slots__
+
     def __init__(self, parent, returntype, name, args, bv_prefix=None):
         FunctionNode.__init__(self, parent, returntype, name, args)
         self.bv_prefix = bv_prefix
 
+    def structure_hash(self, kid_hashes, depths, n):
+        # Our name is the uuid of the bound variable, so we hash which lambda introduced it instead (or the uuid,
+        # if it was introduced above where we started hashing)
+        index = n - depths[self.name] if self.name in depths else self.name
+        if self.args is None:
+            return hash((self.returntype, '<BV>', index))
+        else:
+            return hash((self.returntype, '<BV>', index, tuple(kid_hashes)))
+
+    def kid_hashes_and_free_bvs(self, depths, n):
+        kid_hashes, free = FunctionNode.kid_hashes_and_free_bvs(self, depths, n)
+        return kid_hashes, free.union([self.name])
+
+    def bv_index(self):
+        """How many lambdas (BVAddFunctionNodes) up our bound variable was introduced, not counting the one that
+        introduced it: 0 for the nearest. None if it was not introduced above us."""
+        d = 0
+        x = self.parent
+        while x is not None:
+            if isinstance(x, BVAddFunctionNode):
+                if x.added_rule.name == self.name:
+                    return d
+                d += 1
+            x = x.parent
+        return None
+
     def as_list(self, d=0, bv_names=None):
         """Returns a list representation of the FunctionNode with function/self.name as the first element.
 
@@ -768,29 +1072,66 @@ class BVUseFunctionNode(FunctionNode):
  
         return x
 
-    def __copy__(self, shallow=False):
-        """Copy a function node.
-                
-        Note:
-            The rule is NOT deeply copied (regardless of shallow)
 
-        Arguments
-            shallow: if True, this does not copy the children (self.to points to the same as what we return)
+# ------------------------------------------------------------------------------------------------------------
+# Equality
 
-        """
-        fn = BVUseFunctionNode(self.parent, self.returntype, self.name, None, bv_prefix=self.bv_prefix)
-        
-        if (not shallow) and self.args is not None:
-            fn.args = map(copy, self.args)
-        else:
-            fn.args = self.args
+def structurally_equal(x, y, d=0, x_bv=None, y_bv=None):
+    """Are the trees x and y identical up to the naming of bound variables?
 
-        for a in fn.argFunctionNodes():
-            a.parent = fn
+    This computes fullstring(x) == fullstring(y) without making any strings: like fullstring, each bound variable
+    is identified by the bv_prefix and depth of the lambda that introduced it, which is stored in x_bv and y_bv
+    (dictionaries from uuids to (bv_prefix, depth) pairs). We compare the hashes of the whole trees first, and
+    below that the cached hashes of subtrees that use no variables introduced above them (which are the same
+    wherever they are), so we do not hash any subtree twice. Shared subtrees are not walked at all.
 
-        return fn
+    """
+    if x_bv is None:
+        x_bv, y_bv = dict(), dict()
+
+    if x is y and x_bv == y_bv:
+        return True
 
+    if (x.returntype != y.returntype) or (type(x) is not type(y)) or (d == 0 and hash(x) != hash(y)):
+        return False
 
+    if x._hash is not None and y._hash is not None and not x._free and not y._free and x._hash != y._hash:
+        return False
+
+    # The names must match, after renaming bound variables
+    if isinstance(x, BVUseFunctionNode):
+        if x_bv.get(x.name, x.name) != y_bv.get(y.name, y.name):
+            return False
+    elif x.name != y.name:
+        return False
+
+    if x.args is None or y.args is None:
+        return x.args is None and y.args is None
+    elif len(x.args) != len(y.args):
+        return False
+
+    # On a lambda, we must add the introduced bv, and then remove it again afterwards (as in fullstring)
+    isbvadd = isinstance(x, BVAddFunctionNode)
+    if isbvadd:
+        if x.added_rule.bv_prefix != y.added_rule.bv_prefix:
+            return False
+        x_bv[x.added_rule.name] = (x.added_rule.bv_prefix, d)
+        y_bv[y.added_rule.name] = (y.added_rule.bv_prefix, d)
+
+    ret = True
+    for a, b in zip(x.args, y.args):
+        if isFunctionNode(a) and isFunctionNode(b):
+            ret = structurally_equal(a, b, d+1, x_bv, y_bv)
+        else:
+            ret = (a == b)
+        if not ret:
+            break
+
+    if isbvadd:
+        del x_bv[x.added_rule.name]
+        del y_bv[y.added_rule.name]
+
+    return ret
 
 
 # ------------------------------------------------------------------------------------------------------------
@@ -801,10 +1142,6 @@ class BVUseFunctionNode(FunctionNode):
 # ------------------------------------------------------------------------------------------------------------
 # ------------------------------------------------------------------------------------------------------------
 
-import re
-percent_s_regex = re.compile(r"%s")
-bv_regex = re.compile(r"\<BV\>")
-
 def schemestring(x, d=0, bv_names=None):
     """Outputs a scheme string in (lambda (x) (+ x 3)) format.
 
@@ -888,10 +1225,13 @@ def pystring(x, d=0, bv_names=None):
     Args:
         bv_names: A dictionary from the uuids to nicer names.
 
+    NOTE: This gets called to compile every hypothesis, so it uses plain string operations rather than regular
+        expressions, and avoids making lambdas for each node.
+
     """
     if isinstance(x, str):
         return x
-    elif isFunctionNode(x):
+    elif isinstance(x, FunctionNode):
 
         if bv_names is None:
             bv_names = dict()
@@ -902,34 +1242,33 @@ def pystring(x, d=0, bv_names=None):
             bv_names[x.added_rule.name] = bvn
             # assert len(x.args) == 1
 
-
         # Now handle the name special cases
+        name = x.name
         if x.args is None: # terminal
             if isinstance(x, BVUseFunctionNode):
-                ret = bv_names.get(x.name, x.name)
+                ret = bv_names.get(name, name)
             else:
-                ret = x.name
-        elif x.name == '':
+                ret = name
+        elif name == '':
             assert len(x.args) == 1, "Null names must have exactly 1 argument"
-            ret = pystring(x.args[0], d=d+1, bv_names=bv_names)
+            ret = pystring(x.args[0], d+1, bv_names)
 
-        elif percent_s_regex.search(x.name): # If we match the python string substitution character %s, then format
-            ret = x.name % tuple(map(lambda a: pystring(a, d=d+1, bv_names=bv_names), x.args))
+        elif '%s' in name: # If we match the python string substitution character %s, then format
+            ret = name % tuple([pystring(a, d+1, bv_names) for a in x.args])
 
-        elif x.name == 'lambda': # we are a lambda but NOT a BVAddFunctionNode -- a lambda thunk!
+        elif name == 'lambda': # we are a lambda but NOT a BVAddFunctionNode -- a lambda thunk!
                 assert len(x.args) == 1
-                ret = 'lambda %s: %s' % (bvn, pystring(x.args[0], d=d+1, bv_names=bv_names))
+                ret = 'lambda %s: %s' % (bvn, pystring(x.args[0], d+1, bv_names))
         else:
 
-            name = x.name
             if isinstance(x, BVUseFunctionNode): # handle bv functions
-                name = bv_names.get(x.name, x.name)
+                name = bv_names.get(name, name)
 
-            ret = name+'('+', '.join(map(lambda a: pystring(a, d=d+1, bv_names=bv_names), x.args))+')'
+            ret = name+'('+', '.join([pystring(a, d+1, bv_names) for a in x.args])+')'
 
         # and if we have any bv matches, then insert the bv we introduce
-        if bv_regex.search(ret):
-            ret = bv_regex.sub(bvn, ret)
+        if '<BV>' in ret:
+            ret = ret.replace('<BV>', bvn)
 
         # On a lambda, we must add the introduced bv, and then remove it again afterwards
         if isinstance(x, BVAddFunctionNode):
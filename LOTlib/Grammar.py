@@ -3,14 +3,21 @@
 try: import numpy as np
 except ImportError: import numpypy as np
 
+from bisect import bisect_right
 from copy import copy
 from collections import defaultdict
 import itertools
+from random import random
+import threading
 
 from LOTlib.Miscellaneous import *
 from LOTlib.GrammarRule import GrammarRule, BVAddGrammarRule
 from LOTlib.BVRuleContextManager import BVRuleContextManager
 from LOTlib.FunctionNode import FunctionNode, BVAddFunctionNode
+from LOTlib.CompactTree import RuleTable
+from LOTlib.FrozenGrammar import FrozenGrammar
+from LOTlib.Enumeration import Enumerator, TreeCounter, enumerate_by_probability
+from LOTlib.BoundedGeneration import BoundedSampler
 
 
 # when we pack, we are allowed to use these characters, in this order
@@ -18,6 +25,39 @@ import string
 pack_string = '0123456789'+string.ascii_lowercase+string.ascii_uppercase
 
 
+class NonterminalTable(object):
+    """
+    The cached numbers for sampling and scoring one nonterminal's rules (see Grammar.nonterminal_tables): the
+    cumulative p of the grammar's own rules. Bound variable rules are not in here, since which ones are in scope
+    changes as we go; they are passed in (from Grammar.bv_rules) instead.
+    """
+    __slots__ = ['rules', 'cumulative', 'z', 'log_z']
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self.cumulative = []
+        z = 0.0
+        for r in self.rules:
+            z += r.p
+            self.cumulative.append(z)
+        self.z = z
+        self.log_z = log(z) if z > 0.0 else -Infinity
+
+    def sample(self, bvrules=()):
+        """ Sample a rule in proportion to its p, from our rules followed by bvrules """
+        total = sum([r.p for r in bvrules], self.z) if bvrules else self.z # in the same order as Grammar.get_rules
+        u = random() * total
+        if u < self.z:
+            return self.rules[bisect_right(self.cumulative, u)]
+
+        u -= self.z
+        for r in bvrules:
+            u -= r.p
+            if u < 0.0:
+                return r
+        return bvrules[-1] if bvrules else self.rules[-1] # only if rounding left u at the end
+
+
 class Grammar(CommonEqualityMixin):
     """
     A PCFG-ish class that can handle rules that introduce bound variables
@@ -27,6 +67,19 @@ class Grammar(CommonEqualityMixin):
         self.rules = defaultdict(list)  # A dict from nonterminals to lists of GrammarRules.
         self.rule_count = 0
         self.bv_count = 0   # How many rules in the grammar introduce bound variables?
+        self._local = threading.local() # each thread's bound variable scope (see bv_scope)
+
+    def __getstate__(self):
+        """Cached tables (attributes starting with _) are not pickled or copied; they are rebuilt when needed."""
+        return dict([(k, v) for k, v in self.__dict__.items() if not k.startswith('_')])
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def __eq__(self, other):
+        # Compare everything except the cached tables
+        return isinstance(other, self.__class__) and self.__getstate__() == other.__getstate__()
 
     def __str__(self):
         """Display a grammar."""
@@ -39,8 +92,11 @@ class Grammar(CommonEqualityMixin):
 
     def get_rules(self, nt):
         """
-        The possible rules for any nonterminal
+        The possible rules for any nonterminal: the grammar's own, followed by the bound variable rules in scope
         """
+        bvrules = self.bv_rules(nt)
+        if bvrules:
+            return self.rules[nt] + bvrules
         return self.rules[nt]
 
     def get_all_rules(self):
@@ -52,9 +108,19 @@ class Grammar(CommonEqualityMixin):
                 yield r
 
     def is_nonterminal(self, x):
-        """A nonterminal is just something that is a key for self.rules"""
+        """A nonterminal is just something that is a key for self.rules (or the nt of a bound variable rule in scope)"""
         # if x is a string  &&  if x is a key
-        return isinstance(x, str) and (x in self.rules)
+        if not isinstance(x, str):
+            return False
+        if x in self.rules:
+            return True
+
+        scope = self.bv_scope()
+        while scope is not None:
+            if scope[0].nt == x:
+                return True
+            scope = scope[1]
+        return False
 
     def display_rules(self):
         """Prints all the rules to the console."""
@@ -79,23 +145,177 @@ class Grammar(CommonEqualityMixin):
         assert len(matches)==1, "%s %s %s" % (n, nt, str(matches))
         return matches[0]
 
+    # --------------------------------------------------------------------------------------------------------
+    # Bound variable scope
+    # BVRuleContextManager adds the rules for bound variables here, rather than to self.rules, so that the
+    # grammar itself is never changed by generating or scoring trees. Each thread has its own scope, so
+    # several samplers can share one grammar.
+    # --------------------------------------------------------------------------------------------------------
+
+    def bv_scope(self):
+        """
+        The bound variable rules in scope in this thread, as a linked list of (rule, rest) pairs, innermost first
+        (or None if there are none). These are never changed, only replaced, so it is safe to hold on to one.
+        """
+        return getattr(self._local, 'scope', None)
+
+    def iterate_bv_scope(self):
+        """ Yield the bound variable rules in scope, innermost first """
+        scope = self.bv_scope()
+        while scope is not None:
+            r, scope = scope
+            yield r
+
+    def bv_rules(self, nt):
+        """ The bound variable rules in scope for nt, in the order they were added """
+        scope = getattr(self._local, 'scope', None) # this is called for every node, so we don't call bv_scope
+        if scope is None:
+            return []
+
+        out = []
+        while scope is not None:
+            r, scope = scope
+            if r.nt == nt:
+                out.append(r)
+        out.reverse()
+        return out
+
+    def push_bv_rules(self, rules):
+        """
+        Bring each of the bound variable rules into scope, in order. This and pop_bv_rules are called by
+        BVRuleContextManager.
+        """
+        scope = self.bv_scope()
+        for r in rules:
+            scope = (r, scope)
+        self._local.scope = scope
+
+    def pop_bv_rules(self, rules):
+        """
+        Take rules (as given to push_bv_rules) out of scope.
+        """
+        # Normally they are on top, in the reverse order
+        scope = self.bv_scope()
+        for r in reversed(rules):
+            if scope is None or scope[0] is not r:
+                break
+            scope = scope[1]
+        else:
+            self._local.scope = scope
+            return
+
+        # Otherwise, contexts were left out of order (e.g. by interleaved iterate_subnodes), so remove the
+        # innermost occurrence of each, by identity (comparing rules compares their signatures)
+        remaining = list(rules)
+        kept = []
+        for r in self.iterate_bv_scope():
+            for i, x in enumerate(remaining):
+                if x is r:
+                    del remaining[i]
+                    break
+            else:
+                kept.append(r)
+
+        scope = None
+        for r in reversed(kept):
+            scope = (r, scope)
+        self._local.scope = scope
+
+    def rule_index(self):
+        """
+        A dictionary from rule signatures to the grammar's rules with that signature (normally just one). This is
+        cached until we add a rule. Bound variable rules are not in here (see get_matching_rule).
+        """
+        if getattr(self, '_rule_index', None) is None:
+            self._rule_index = defaultdict(list)
+            for r in self:
+                self._rule_index[r.get_rule_signature()].append(r)
+        return self._rule_index
+
     def get_matching_rule(self, t):
         """
-        Get the rule matching t's signature. Note: We could probably speed this up with a hash table if need be.
+        Get the rule matching t's signature, from the rule_index.
         """
-        rules = self.get_rules(t.returntype)
-        matching_rules = [r for r in rules if (r.get_rule_signature() == t.get_rule_signature())]
+        sig = t.get_rule_signature()
+        matching_rules = self.rule_index().get(sig)
+        if not matching_rules: # a bound variable rule, or maybe a rule appended to self.rules directly
+            matching_rules = [r for r in self.bv_rules(t.returntype) if r.get_rule_signature() == sig] or \
+                             [r for r in self.rules[t.returntype] if r.get_rule_signature() == sig]
         assert len(matching_rules) == 1, \
             "Grammar Error: " + str(len(matching_rules)) + " matching rules for this FunctionNode! %s %s %s" % (t.get_rule_signature(), str(t), matching_rules)
         return matching_rules[0]
 
+    def nonterminal_tables(self):
+        """
+        A dictionary from nonterminals to their NonterminalTables, which are made as they are needed. This is cached
+        until we add a rule or change a rule's p (see invalidate). Rules must be added with add_rule for the tables
+        to stay right.
+        """
+        if getattr(self, '_nonterminal_tables', None) is None:
+            self._nonterminal_tables = dict()
+            self._log_p = dict([(r, log(r.p)) for r in self])
+        return self._nonterminal_tables
+
+    def set_p(self, r, p):
+        """ Set rule r's (unnormalized) probability to p, forgetting the tables computed from the old one """
+        r.p = float(p)
+        self.invalidate() # in case r was not added with add_rule
+
+    def invalidate(self):
+        """
+        Forget the tables cached from the rules' probabilities. add_rule calls this, and so does setting the p of a
+        rule that was added with add_rule (see GrammarRule.p).
+        """
+        self._nonterminal_tables = None
+        self._log_p = None
+        self._bounded_sampler = None
+        self._p_version = None
+
+    def p_version(self):
+        """
+        A token that is replaced every time we invalidate, so that things computed from the rules' probabilities
+        (e.g. PCFGPrior.value_log_probability) can tell if they are still current.
+        """
+        if getattr(self, '_p_version', None) is None:
+            self._p_version = object()
+        return self._p_version
+
+    def nonterminal_table(self, nt):
+        tables = self.nonterminal_tables()
+        table = tables.get(nt)
+        if table is None:
+            table = tables[nt] = NonterminalTable(self.rules[nt])
+        return table
+
+    def log_normalizer(self, nt):
+        """
+        The log of the total p of nt's rules, including the bound variable rules in scope.
+        """
+        table = self.nonterminal_table(nt)
+        bvrules = self.bv_rules(nt)
+        if bvrules:
+            z = sum([r.p for r in bvrules], table.z)
+            return log(z) if z > 0.0 else -Infinity
+        return table.log_z
+
+    def rule_log_probability(self, r):
+        """
+        The log probability of expanding r.nt with r, in the current scope, looked up in the cached tables.
+        """
+        if getattr(self._local, 'scope', None) is None: # the usual case, with no bound variables in scope
+            z = self.nonterminal_table(r.nt).log_z
+        else:
+            z = self.log_normalizer(r.nt)
+        lp = self._log_p.get(r) # keyed by the rule object itself, since rules hash by id
+        if lp is None: # a bound variable rule, or one appended to self.rules directly
+            lp = log(r.p)
+        return lp - z
+
     def single_probability(self, t):
         # in this tree, in its context (recursing up), what is the probability of this single expansion?
 
         with BVRuleContextManager(self, t, recurse_up=True):
-            z = log(sum([ r.p for r in self.get_rules(t.returntype) ]))
-            r = self.get_matching_rule(t)
-            return log(r.p)-z
+            return self.rule_log_probability(self.get_matching_rule(t))
 
     def log_probability(self, t):
         """
@@ -105,20 +325,21 @@ class Grammar(CommonEqualityMixin):
         """
         assert isinstance(t, FunctionNode)
 
-        z = log(sum([ r.p for r in self.get_rules(t.returntype) ]))
-
         # Find the one that matches. While it may seem like we should store this, that is hard to make work
         # with multiple grammar objects across loading/saving, because the objects will change. This way,
-        # we always look it up.
-        lp = -Infinity
+        # we always look it up (in rule_index), and then look up its probability (in the nonterminal_tables)
         r = self.get_matching_rule(t)
         assert r is not None, "Failed to find matching rule at %s %s" % (t, r)
 
-        lp = log(r.p) - z
+        lp = self.rule_log_probability(r)
 
-        with BVRuleContextManager(self, t):
+        if t.added_rule is None:
             for a in t.argFunctionNodes():
                 lp += self.log_probability(a)
+        else:
+            with BVRuleContextManager(self, t):
+                for a in t.argFunctionNodes():
+                    lp += self.log_probability(a)
 
         return lp
 
@@ -141,7 +362,11 @@ class Grammar(CommonEqualityMixin):
         else:
             newrule = GrammarRule(nt, name, to, p=p)
 
+        newrule.grammar = self # so that changing its p invalidates us
         self.rules[nt].append(newrule)
+        self._rule_table = None # these are now out of date
+        self._rule_index = None
+        self.invalidate()
         return newrule
     
     def is_terminal_rule(self, r):
@@ -176,26 +401,29 @@ class Grammar(CommonEqualityMixin):
         elif self.is_nonterminal(x):
 
             # sample a grammar rule
-            rules = self.get_rules(x)
-            assert len(rules) > 0, "*** No rules in x=%s"%x
+            table, bvrules = self.nonterminal_table(x), self.bv_rules(x)
+            assert len(table.rules) + len(bvrules) > 0, "*** No rules in x=%s"%x
 
-            # sample the rule
-            r = weighted_sample(rules, probs=lambda x: x.p, log=False)
+            # sample the rule (by bisection in the nonterminal's cumulative probabilities)
+            r = table.sample(bvrules)
 
             # Make a stub for this functionNode 
             fn = r.make_FunctionNodeStub(self, None)
 
-            # Define a new context that is the grammar with the rule added
-            # Then, when we exit, it's still right.
-            with BVRuleContextManager(self, fn, recurse_up=False):      # not sure why we can't use with/as:
-                # Can't recurse on None or else we genreate from self.start
-                if fn.args is not None:
-                    # and generate below *in* this context (e.g. with the new rules added)
-                    try:
+            # Can't recurse on None or else we genreate from self.start
+            if fn.args is not None:
+                try:
+                    if fn.added_rule is None:
                         fn.args = self.generate(fn.args)
-                    except RuntimeError as e:
-                        print "*** Runtime error in %s" % fn
-                        raise e
+                    else:
+                        # Define a new context that is the grammar with the rule added
+                        # Then, when we exit, it's still right.
+                        with BVRuleContextManager(self, fn, recurse_up=False):
+                            # and generate below *in* this context (e.g. with the new rules added)
+                            fn.args = self.generate(fn.args)
+                except RuntimeError as e:
+                    print "*** Runtime error in %s" % fn
+                    raise e
 
                 # and set the parents
                 for a in fn.argFunctionNodes():
@@ -205,6 +433,7 @@ class Grammar(CommonEqualityMixin):
         elif isinstance(x, FunctionNode): # this will let us finish generation of a partial tree
 
             x.args = [ self.generate(a) for a in x.args]
+            x.invalidate_cache()
 
             for a in x.argFunctionNodes():
                 a.parent = x
@@ -215,7 +444,76 @@ class Grammar(CommonEqualityMixin):
             assert isinstance(x, str), ("*** Terminal must be a string! x="+x)
             return x
 
-    def enumerate(self, d=20, nt=None, leaves=True):
+    def generate_batch(self, n, nt=None, compact=False):
+        """Generate n trees at once, with the same distribution as n calls to generate(nt).
+
+        The trees are built breadth-first: at each level, the nonterminals still to expand are grouped by type (and
+        the p of the bound variables in scope), and all of a group's rules are drawn together, by searching the
+        cumulative p with numpy. This does not recurse, so it does not mind deep trees. Like generate, it draws from
+        the random module, so random.seed makes it repeatable.
+
+        Arguments:
+            n (int): how many trees
+            nt (string): what we start from (None reverts to self.start)
+            compact (bool): return CompactTrees instead of FunctionNodes
+
+        """
+        if nt is None:
+            nt = self.start
+            assert self.start in self.nonterminals(), \
+                "The default start symbol %s is not a defined nonterminal" % self.start
+
+        if not self.is_nonterminal(nt): # a terminal, as generate would give
+            return [nt] * n
+
+        trees = [None] * n
+        cumulatives = dict() # nonterminal -> array of the cumulative p of its rules
+
+        # Each item still to expand is (nt, scope, parent, i), for parent.args[i] (or trees[i] if parent is None),
+        # where scope is the tuple of the bound variable rules it is in (outermost first, as Grammar.bv_rules)
+        frontier = [(nt, tuple(reversed(list(self.iterate_bv_scope()))), None, i) for i in xrange(n)]
+        while frontier:
+            # Items whose bound variables have the same p can be drawn together, even if they are in different trees
+            groups = defaultdict(list)
+            for item in frontier:
+                x, scope = item[0], item[1]
+                bvrules = [r for r in scope if r.nt == x]
+                groups[(x, tuple([r.p for r in bvrules]))].append((item, bvrules))
+
+            frontier = []
+            for (x, bvp), items in groups.iteritems():
+                table = self.nonterminal_table(x)
+                nrules = len(table.rules)
+                assert nrules + len(bvp) > 0, "*** No rules in x=%s" % x
+
+                if x not in cumulatives:
+                    cumulatives[x] = np.array(table.cumulative, dtype=np.float64)
+                cumulative = cumulatives[x]
+                if bvp:
+                    cumulative = np.concatenate([cumulative, table.z + np.cumsum(bvp)])
+
+                # sample the rules (clipping in case rounding puts u at the very end)
+                ks = np.searchsorted(cumulative, np.array([random() for _ in items]) * cumulative[-1], side='right')
+                for ((x, scope, parent, i), bvrules), k in zip(items, np.minimum(ks, nrules + len(bvp) - 1)):
+                    r = table.rules[k] if k < nrules else bvrules[k - nrules]
+                    fn = r.make_FunctionNodeStub(self, parent)
+                    if parent is None:
+                        trees[i] = fn
+                    else:
+                        parent.args[i] = fn
+
+                    if fn.args is not None:
+                        inner = scope if fn.added_rule is None else scope + (fn.added_rule,)
+                        for j, a in enumerate(fn.args):
+                            if isinstance(a, str) and (a in self.rules or any([r.nt == a for r in inner])):
+                                frontier.append((a, inner, fn, j))
+
+        if compact:
+            table = self.rule_table()
+            return [table.compact(t) for t in trees]
+        return trees
+
+    def enumerate(self, d=20, nt=None, leaves=True, compact=False):
         """Enumerate all trees up to depth n.
 
         Parameters:
@@ -223,13 +521,13 @@ class Grammar(CommonEqualityMixin):
             nt (str): the nonterminal type
             leaves (bool): do we put terminals in the leaves or leave nonterminal types? This is useful in
               PartitionMCMC
+            compact (bool): yield CompactTrees instead of FunctionNodes
 
+        The subtrees of each depth are enumerated once and reused (see LOTlib.Enumeration).
         """
-        for i in infrange(d):
-            for t in self.enumerate_at_depth(i, nt=nt, leaves=leaves):
-                yield t
+        return Enumerator(self, leaves=leaves, compact=compact).enumerate(d, nt=nt)
 
-    def enumerate_at_depth(self, d, nt=None, leaves=True):
+    def enumerate_at_depth(self, d, nt=None, leaves=True, compact=False):
         """Generate trees at depth d, no deeper or shallower.
 
         Parameters
@@ -237,110 +535,89 @@ class Grammar(CommonEqualityMixin):
             nt (str): the type of the nonterminal you want to return (None reverts to self.start)
             leaves (bool): do we put terminals in the leaves or leave nonterminal types? This is useful in
               PartitionMCMC. This returns trees of depth d-1!
+            compact (bool): yield CompactTrees instead of FunctionNodes
 
         Return:
-            yields the ...
+            yields the trees. To enumerate several depths, it is faster to use one Enumerator for all of them.
 
         """
-        if nt is None:
-            nt = self.start
-
-        # handle garbage that may be passed in here
-        if not self.is_nonterminal(nt):
-            yield nt
-            raise StopIteration
-
-        if d == 0:
-            if leaves:
-                # Note: can NOT use filter here, or else it doesn't include added rules
-                for r in self.rules[nt]:
-                    if self.is_terminal_rule(r):
-                        yield r.make_FunctionNodeStub(self, None)
-            else:
-                # If not leaves, we just put the nonterminal type in the leaves
-                yield nt
-        else:
-            # Note: can NOT use filter here, or else it doesn't include added rules. No sorting either!
-            for r in self.rules[nt]:
+        return Enumerator(self, leaves=leaves, compact=compact).enumerate_at_depth(d, nt=nt)
 
-                # No good since it won't be deep enough
-                if self.is_terminal_rule(r):
-                    continue
+    def enumerate_by_probability(self, nt=None, min_lp=-Infinity, max_count=Infinity):
+        """Generate complete trees in order of decreasing log probability, best first.
 
+        Parameters
+            nt (str): the nonterminal to start from (None reverts to self.start)
+            min_lp (float): stop before any tree with log probability below this
+            max_count (int): stop after this many trees
 
-                fn = r.make_FunctionNodeStub(self, None)
+        Return:
+            yields the trees, searching partial trees with a priority queue (see LOTlib.Enumeration). With neither
+            min_lp nor max_count, this runs forever on grammars with infinitely many trees, and the queue keeps
+            growing, so give one of them.
 
-                # The possible depths for the i'th child
-                # Here we just ensure that nonterminals vary up to d, and otherwise
-                child_i_depths = lambda i: xrange(d) if self.is_nonterminal(fn.args[i]) else [0]
+        """
+        return enumerate_by_probability(self, nt=nt, min_lp=min_lp, max_count=max_count)
 
-                # The depths of each kid
-                for cd in lazyproduct(map(child_i_depths, xrange(len(fn.args))), child_i_depths):
+    def count_trees(self, d, nt=None, leaves=True):
+        """How many trees enumerate_at_depth(d, nt, leaves) would give, computed without making them.
 
-                    # One must be equal to d-1
-                    # TODO: can be made more efficient via permutations. Also can skip terminals in args.
-                    if max(cd) < d-1:
-                        continue
-                    assert max(cd) == d-1
+        For many depths (or prior_mass too), use one LOTlib.Enumeration.TreeCounter.
+        """
+        return TreeCounter(self, leaves=leaves).count(d, nt=nt)
 
-                    myiter = lazyproduct(
-                        [self.enumerate_at_depth(di, nt=a, leaves=leaves) for di, a in zip(cd, fn.args)],
-                        lambda i: self.enumerate_at_depth(cd[i], nt=fn.args[i], leaves=leaves))
-                    try:
-                        while True:
-                            # Make a copy so we don't modify anything
-                            yieldfn = copy(fn)
+    def prior_mass(self, d, nt=None):
+        """The total prior probability of the trees of depth d (no deeper or shallower).
 
-                            # BVRuleContextManager here makes us remove the rule BEFORE yielding,
-                            # or else this will be incorrect. Wasteful but necessary.
-                            with BVRuleContextManager(self, fn, recurse_up=False):
-                                yieldfn.args = myiter.next()
-                                for a in yieldfn.argFunctionNodes():
-                                    # Update parents
-                                    a.parent = yieldfn
+        So the trees up to depth d cover sum([prior_mass(i) for i in xrange(d+1)]) of the prior.
+        """
+        return TreeCounter(self).mass(d, nt=nt)
 
-                            yield copy(yieldfn)
+    def depth_to_terminal(self, x):
+        """
+        How quickly we can go from x (a nonterminal, or a GrammarRule) to a terminal: the smallest depth of a tree
+        from it, as FunctionNode.depth counts. This is looked up in tables computed once (see bounded_sampler).
+        """
+        minimal = self.bounded_sampler().minimal
+        kinds = frozenset([(r.nt, tuple(r.to) if r.to is not None else None) for r in self.iterate_bv_scope()])
+        if isinstance(x, GrammarRule):
+            return minimal.rule_depth(x, kinds)
+        else:
+            return minimal.depth(x, kinds)
 
-                    except StopIteration:
-                        # Catch this here so we continue in this loop over rules
-                        pass
+    def nodes_to_terminal(self, x):
+        """
+        The fewest nodes in a tree from x (a nonterminal, or a GrammarRule), as FunctionNode.count_nodes counts.
+        """
+        minimal = self.bounded_sampler().minimal
+        kinds = frozenset([(r.nt, tuple(r.to) if r.to is not None else None) for r in self.iterate_bv_scope()])
+        if isinstance(x, GrammarRule):
+            return minimal.rule_nodes(x, kinds)
+        else:
+            return minimal.nodes(x, kinds)
 
-    def depth_to_terminal(self, x, openset=None, current_d=None):
+    def bounded_sampler(self):
+        """
+        A BoundedSampler for this grammar, which keeps the minimal completions and masses it computes. This is
+        cached until we invalidate, as for nonterminal_tables.
         """
-        Return a dictionary that maps both this grammar's rules and its nonterminals to a number,
-        giving how quickly we can go from that nonterminal or rule to a terminal.
+        if getattr(self, '_bounded_sampler', None) is None:
+            self._bounded_sampler = BoundedSampler(self)
+        return self._bounded_sampler
+
+    def generate_bounded(self, x=None, max_depth=Infinity, max_nodes=Infinity):
+        """Generate from the grammar, conditioned on the tree fitting in max_depth and max_nodes.
+
+        Trees come out with their probability under generate, divided by the probability of fitting (see
+        LOTlib.BoundedGeneration), so nothing is generated only to be thrown away for being too big.
 
         Arguments:
-            openset(doc?): stores the set of things we're currently trying to compute for. We must skip rules
-              that contain anything in there, since they have to be defined still, and so we want to avoid
-              a loop.
+            x (string): What we start from -- can be None and then we use Grammar.start.
+            max_depth (int): the deepest tree (as FunctionNode.depth counts)
+            max_nodes (int): the most nodes (as FunctionNode.count_nodes counts)
 
         """
-        if current_d is None: 
-            current_d = dict()
-            
-        if openset is None:
-            openset = set()
-            
-        openset.add(x)
-        
-        if isinstance(x, GrammarRule):
-            if x.to is None or len(x.to) == 0:
-                current_d[x] = 0 # we are a terminal
-            else:
-                current_d[x] = 1 + max([(self.depth_to_terminal(a, openset=openset, current_d=current_d)
-                                        if a not in openset else 0) for a in x.to])
-        elif isinstance(x, str):
-            if x not in self.rules:
-                current_d[x] = 0    # A terminal
-            else:
-                current_d[x] = min([(self.depth_to_terminal(r, openset=openset, current_d=current_d)
-                                    if r not in openset else Infinity) for r in self.rules[x]])
-        else:
-            assert False, "Shouldn't get here!"
-
-        openset.remove(x)
-        return current_d[x]
+        return self.bounded_sampler().generate(x, max_depth=max_depth, max_nodes=max_nodes)
 
     def renormalize(self):
         """ go through each rule in each nonterminal, and renormalize the probabilities """
@@ -349,7 +626,43 @@ class Grammar(CommonEqualityMixin):
             z = sum([r.p for r in self.get_rules(nt)])
             for r in self.get_rules(nt):
                 r.p = r.p / z
+        self.invalidate() # in case some rules were not added with add_rule
+
+
+    # --------------------------------------------------------------------------------------------------------
+    # Compact trees
+    # --------------------------------------------------------------------------------------------------------
+
+    def rule_table(self):
+        """
+        A frozen table of this grammar's rules, for making CompactTrees. This is cached until we add a rule.
+        """
+        if getattr(self, '_rule_table', None) is None:
+            self._rule_table = RuleTable(self)
+        return self._rule_table
+
+    def freeze(self):
+        """
+        A FrozenGrammar with this grammar's rules (not counting any bound variable rules in scope), stored in arrays
+        that are quick to pickle, e.g. for sending to worker processes. It numbers the rules as rule_table does.
+        """
+        return FrozenGrammar(self)
+
+    def compact(self, t):
+        """ Make a CompactTree from t """
+        return self.rule_table().compact(t)
+
+    def pack(self, t):
+        """
+        Pack the (complete) tree t into a binary string, one varint per node (see RuleTable.pack). Unlike pack_ascii,
+        this works for any number of rules, and the index of each rule signature is cached with the rule table.
+        This is how LOTHypotheses store their values when pickled (e.g. by Save, MPI_map, or standard_sample).
+        """
+        return self.rule_table().pack(t)
 
+    def unpack(self, s):
+        """ The inverse of pack. s must have been packed by this grammar, or a copy of it """
+        return self.rule_table().unpack(s)
 
     # --------------------------------------------------------------------------------------------------------
     # Packing and unpacking trees
@@ -423,8 +736,8 @@ class Grammar(CommonEqualityMixin):
         return s
 
     def unpack_ascii(self, s):
-        # we must convert to list(s) so that it will support pop, delete
-        s = list(s)
+        # an iterator over the characters, so that each recursive call takes the next one
+        s = iter(s)
 
         return self.unpack_ascii_rec(s, self.start, self.idx2rule())
 
@@ -445,8 +758,7 @@ class Grammar(CommonEqualityMixin):
 
             # index
             # instead of sampling a rule, get it from the string
-            i = pack_string.index(s[0])
-            del s[0]  # remove (works since s is a list)
+            i = pack_string.index(s.next())
             r = idx2rule[i]
 
             # Make a stub for this functionNode
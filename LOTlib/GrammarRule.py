@@ -35,12 +35,18 @@ class GrammarRule(object):
     ----
     The rule id (rid) is very important -- it's what we use expansion determine equality
 
+    p is a property so that changing it (r.p = ...) invalidates the tables that the grammar the rule was added to
+    (see Grammar.add_rule) caches from the rules' probabilities.
+
     """
+    grammar = None # the Grammar we were added to, if any
+
     def __init__(self, nt, name, to, p=1.0, bv_prefix=None):
         p = float(p)
         assert p>0.0, "*** p=0 in rule %s %s %s. What are you thinking?" %(nt,name,to)
 
         self_update(self, locals())
+        self._p = self.__dict__.pop('p') # self_update sets p in __dict__, bypassing the property
 
         assert to is None or isinstance(to, list) or isinstance(to, tuple), "*** 'to' in a GrammarRule must be a list!"
 
@@ -50,6 +56,23 @@ class GrammarRule(object):
             assert (to is None) or (len(to) == 1), \
                 "*** GrammarRules with empty names must have only 1 argument"
 
+    @property
+    def p(self):
+        return self._p
+
+    @p.setter
+    def p(self, p):
+        self._p = p
+        if self.grammar is not None:
+            self.grammar.invalidate()
+
+    def __setstate__(self, state):
+        # rules pickled before p was a property
+        if 'p' in state:
+            state = dict(state)
+            state['_p'] = state.pop('p')
+        self.__dict__.update(state)
+
     def __repr__(self):
         """Print string in format: 'NT -> [TO]   w/ p=1.0'."""
         return str(self.nt) + " -> " + self.name + (str(self.to) if self.to is not None else '') + \
@@ -59,6 +82,12 @@ class GrammarRule(object):
         """Equality is determined through "is" so that we can remove a rule from lists via list.remove()."""
         return self.get_rule_signature() == other.get_rule_signature()
 
+    def __copy__(self):
+        # Much quicker than the default copy. This matters since we copy the added_rule of every lambda in a tree.
+        r = object.__new__(type(self))
+        r.__dict__.update(self.__dict__)
+        return r
+
     def short_str(self):
         """Print string in format: 'NT -> [TO]'."""
         return str(self.nt) + " -> " + self.name + (str(self.to) if self.to is not None else '')
@@ -109,6 +138,7 @@ class BVAddGrammarRule(GrammarRule):
     def __init__(self, nt, name, to, p=1.0, bv_prefix="y", bv_type=None, bv_args=None, bv_p=None):
         p = float(p)
         self_update(self, locals())
+        self._p = self.__dict__.pop('p')
         assert bv_type is not None, "Did you mean to use a GrammarRule instead of a BVGrammarRule?"
         assert isinstance(bv_type, str), "bv_type must be a string! Make sure it's not a tuple or list."
         
@@ -0,0 +1,86 @@
+"""
+        Data whose likelihoods are added up in an order learned, as a sampler runs, to reject proposals soonest.
+
+        Hypothesis.compute_likelihood stops as soon as the running log likelihood falls below the shortcut, so how
+        much of the data it evaluates for a proposal that will be rejected depends on the order of the data. For each
+        datum, an AdaptiveDataOrder counts its triggers (how often it was the one that took the likelihood below the
+        shortcut) and keeps the mean of its log likelihoods. Every reorder_every likelihoods, the data are put in order
+        of their trigger rate (triggers per evaluation), highest first, and then of their mean log likelihood, lowest
+        first.
+
+        If the data are a Dataset, the statistics are kept for each row, identical data are put next to each other,
+        and each row is evaluated only once per likelihood; a row's mean log likelihood is then that of all its data.
+
+        Hypothesis.compute_likelihood hands an AdaptiveDataOrder its hypothesis. Otherwise it behaves as a list of
+        the data, in their original order. MHSamplerShortcut wraps lists and Datasets of data in one.
+"""
+import numpy
+
+from LOTlib.DataAndObjects import Dataset
+from LOTlib.Miscellaneous import Infinity
+
+
+class AdaptiveDataOrder(object):
+
+    def __init__(self, data, adaptive=True, reorder_every=100):
+        self.data = list(data)
+        self.adaptive, self.reorder_every = adaptive, reorder_every
+
+        # identical data (the same row of a Dataset) are only evaluated once per likelihood, and share statistics
+        self.rows = list(data.order) if isinstance(data, Dataset) else range(len(self.data))
+        nrows = max(self.rows)+1 if self.rows else 0
+        self.counts = numpy.bincount(numpy.array(self.rows, dtype=int), minlength=nrows) # how many data each row stands for
+
+        self.order = range(len(self.data)) # the order we evaluate the data in
+        self.triggers = [0] * nrows
+        self.evaluations = [0] * nrows
+        self.ll_sum = [0.0] * nrows
+        self.calls = 0
+        self.last_evaluated = 0 # how many likelihoods of single data the last likelihood computed
+
+    def compute_likelihood(self, h, shortcut=-Infinity, **kwargs):
+        """ What h.compute_likelihood(data, shortcut=shortcut) would be, adding up the data in our order """
+        row_ll = dict()
+        ll = 0.0
+        for i in self.order:
+            r = self.rows[i]
+            lli = row_ll.get(r)
+            if lli is None:
+                lli = row_ll[r] = h.compute_single_likelihood(self.data[i], **kwargs) / h.likelihood_temperature
+                self.evaluations[r] += 1
+                self.ll_sum[r] += lli
+
+            ll += lli
+            if ll < shortcut:
+                self.triggers[r] += 1
+                self.finish(len(row_ll))
+                return -Infinity
+
+        self.finish(len(row_ll))
+        return ll
+
+    def finish(self, evaluated):
+        self.last_evaluated = evaluated
+        self.calls += 1
+        if self.adaptive and self.calls % self.reorder_every == 0:
+            self.reorder()
+
+    def reorder(self):
+        n = numpy.maximum(numpy.array(self.evaluations, dtype=float), 1.0)
+        trigger_rate = numpy.array(self.triggers) / n
+        mean_ll = self.counts * numpy.array(self.ll_sum) / n # of all the row's data
+        rows = numpy.array(self.rows, dtype=int)
+        # by trigger rate, then mean log likelihood, then row, so identical data stay together
+        self.order = map(int, numpy.lexsort((rows, mean_ll[rows], -trigger_rate[rows])))
+
+    def __len__(self):
+        return len(self.data)
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __getitem__(self, i):
+        return self.data[i]
+
+    def __repr__(self):
+        return '<AdaptiveDataOrder of %s data>' % len(self.data)
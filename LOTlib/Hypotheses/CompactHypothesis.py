@@ -0,0 +1,63 @@
+"""
+        A memory-light stand-in for a hypothesis whose value is a FunctionNode. The value is stored as a
+        CompactTree and the compiled function is dropped; expand() gives back a working hypothesis.
+
+        This is what TopN, SampleStream.Save and SampleStream.Unique store when they are made with compact=True.
+"""
+from LOTlib.FunctionNode import FunctionNode
+
+
+class CompactHypothesis(object):
+    """
+    Stores the type and attributes of hypothesis h (e.g. prior, likelihood, posterior_score, grammar), but keeps
+    h.value as a CompactTree made from h.grammar.
+
+    Hashing and equality match Hypothesis, so these can be kept in sets.
+    """
+
+    def __init__(self, h):
+        assert isinstance(h.value, FunctionNode), "*** CompactHypothesis requires a FunctionNode value"
+        self.cls = type(h)
+        self.value = h.grammar.compact(h.value)
+        self.state = dict([(k, v) for k, v in h.__dict__.items() if k not in ('value', 'fvalue')])
+
+    def __getattr__(self, k):
+        # Look up scores, etc. in the stored state. (Only called when k is not one of our own attributes.)
+        if k == 'state':
+            raise AttributeError(k)
+        try:
+            return self.state[k]
+        except KeyError:
+            raise AttributeError(k)
+
+    def expand(self):
+        """ Rehydrate the hypothesis, rebuilding its value and recompiling its function """
+        h = self.cls.__new__(self.cls)
+        h.__dict__.update(self.state)
+        h.set_value(self.value.expand())
+        return h
+
+    def __str__(self):
+        return self.state.get('display', "%s") % str(self.value)
+
+    def __repr__(self):
+        return str(self)
+
+    def __hash__(self):
+        return hash(self.value)
+
+    def __eq__(self, other):
+        return isinstance(other, CompactHypothesis) and self.value == other.value
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+
+def compact_hypothesis(h):
+    """ Return h as a CompactHypothesis, unless it already is one """
+    return h if isinstance(h, CompactHypothesis) else CompactHypothesis(h)
+
+
+def expand_hypothesis(h):
+    """ The inverse of compact_hypothesis """
+    return h.expand() if isinstance(h, CompactHypothesis) else h
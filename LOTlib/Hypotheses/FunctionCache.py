@@ -0,0 +1,71 @@
+"""
+        A process-wide, bounded, least-recently-used cache of compiled functions, used by LOTHypothesis.compile_function.
+
+        An MCMC chain keeps proposing (and mostly rejecting) the same handful of expressions, so most of the calls to
+        eval that compile_function would make are repeats. Keys are the code compile_function evals (str of the
+        hypothesis), so we keep no trees, and equal trees (including ones that only differ in bound variable names,
+        which are named by depth) share a compiled function.
+
+        Example:
+            from LOTlib.Hypotheses.FunctionCache import function_cache
+            ... run a sampler ...
+            print function_cache.hits, function_cache.misses, function_cache.evictions
+            function_cache.resize(0) # turn the cache off
+"""
+from collections import OrderedDict
+
+
+class FunctionCache(object):
+    """
+    Map keys to compiled functions, keeping only the maxsize most recently used (a maxsize of 0 stores nothing).
+
+    Counts hits, misses, and evictions (functions dropped to make room).
+    """
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.clear()
+
+    def clear(self):
+        """ Forget all the functions and reset the counts """
+        self.cache = OrderedDict() # key -> (the key we stored, function), least recently used first
+        self.hits, self.misses, self.evictions = 0, 0, 0
+
+    def resize(self, maxsize):
+        self.maxsize = maxsize
+        self.evict()
+
+    def get(self, key):
+        """ Return the function stored for key, or None if there is none """
+        try:
+            stored_key, f = self.cache.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+
+        # put it back at the most recently used end, under the same key object
+        self.cache[stored_key] = (stored_key, f)
+        self.hits += 1
+        return f
+
+    def add(self, key, f):
+        """ Store f for key. The key must not be changed afterwards, so pass a copy if it is mutable """
+        if self.maxsize > 0:
+            self.cache[key] = (key, f)
+            self.evict()
+
+    def evict(self):
+        while len(self.cache) > self.maxsize:
+            self.cache.popitem(last=False)
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self.cache)
+
+    def __str__(self):
+        return "<FunctionCache: %s functions, %s hits, %s misses, %s evictions>" % \
+               (len(self), self.hits, self.misses, self.evictions)
+
+
+# The cache used by LOTHypothesis
+function_cache = FunctionCache()
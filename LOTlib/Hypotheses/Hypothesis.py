@@ -1,3 +1,4 @@
+from LOTlib.FunctionNode import isFunctionNode
 from LOTlib.Miscellaneous import Infinity, attrmem
 from copy import copy, deepcopy
 import numpy
@@ -55,7 +56,10 @@ class Hypothesis(object):
 
         # and then we need to explicitly *deepcopy* the value (in case its a dict or tree, or whatever)
         if value is None:
-            value = deepcopy(self.value)
+            if isFunctionNode(self.value):
+                value = copy(self.value) # copies the whole tree, but much faster than deepcopy
+            else:
+                value = deepcopy(self.value)
 
         thecopy.set_value(value)
 
@@ -95,7 +99,14 @@ class Hypothesis(object):
         Shortcut here allows us to stop evaluation if the likelihood falls below the shortcut value (taking into account temperature)
 
         Versions using decayed likelihood can be found in Hypothesis.DecayedLikelihoodHypothesis.
+
+        Data that know how to compute a hypothesis's likelihood on themselves (with a compute_likelihood(h,
+        shortcut=shortcut, **kwargs) method, e.g. a Dataset, which computes each distinct datum's likelihood only
+        once, a DataPrefix, which looks it up in the LikelihoodStore, or an AdaptiveDataOrder, which adds up the data
+        in its own order) are handed this hypothesis.
         """
+        if hasattr(data, 'compute_likelihood'):
+            return data.compute_likelihood(self, shortcut=shortcut, **kwargs)
 
         ll = 0.0
         for datum in data:
@@ -111,8 +122,14 @@ class Hypothesis(object):
         The predictive likelihood is a list of likelihoods aligned to data. The i'th predictive likelihood
         is the likelihood of 0..(i-1) data points (thus it is the likelihood used in the predictive
         posterior for the i'th data point)
+
+        As for compute_likelihood, data with a compute_predictive_likelihood(h, include_last=include_last, **kwargs)
+        method are handed this hypothesis.
         """
 
+        if hasattr(data, 'compute_predictive_likelihood'):
+            return data.compute_predictive_likelihood(self, include_last=include_last, **kwargs)
+
         # all but the last data point unless include_last
         lls = [0.0] + [self.compute_single_likelihood(datum, **kwargs) for datum in data[:(None if include_last else -1)]]
 
@@ -1,6 +1,9 @@
+from copy import deepcopy
 from LOTlib.Eval import * # Necessary for compile_function eval below
+from LOTlib.FunctionNode import isFunctionNode
+from LOTlib.Hypotheses.FunctionCache import function_cache
 from LOTlib.Hypotheses.FunctionHypothesis import FunctionHypothesis
-from LOTlib.Hypotheses.Proposers import regeneration_proposal, ProposalFailedException
+from LOTlib.Hypotheses.Proposers import regeneration_proposer, persistent_regeneration_proposer, ProposalFailedException
 from LOTlib.Miscellaneous import self_update
 from LOTlib.Primitives import *
 from Priors.PCFGPrior import PCFGPrior
@@ -18,6 +21,9 @@ class LOTHypothesis(PCFGPrior, FunctionHypothesis):
         The maximum amount of nodes that the grammar can have
     args : list
         The arguments to the function.
+    persistent : bool
+        If True, proposals share all untouched subtrees with this hypothesis's value instead of copying the whole
+        tree (see FunctionNode.path_copy). Values must then never be changed in place.
 
     Attributes
     ----------
@@ -26,8 +32,10 @@ class LOTHypothesis(PCFGPrior, FunctionHypothesis):
     prior_vector : np.ndarray
 
     """
+    cache_functions = True # look up compiled functions in function_cache
+    bounded = False # generate and propose only trees with at most maxnodes nodes (see Grammar.generate_bounded)
 
-    def __init__(self, grammar=None, value=None, f=None, maxnodes=25, **kwargs):
+    def __init__(self, grammar=None, value=None, f=None, maxnodes=25, persistent=False, **kwargs):
 
         if 'args' in kwargs:
             assert False, "*** Use of 'args' is deprecated. Use display='...' instead."
@@ -35,7 +43,7 @@ class LOTHypothesis(PCFGPrior, FunctionHypothesis):
         # Save all of our keywords
         self_update(self, locals())
         if value is None and grammar is not None:
-            value = grammar.generate()
+            value = grammar.generate_bounded(max_nodes=maxnodes) if self.bounded else grammar.generate()
 
         FunctionHypothesis.__init__(self, value=value, f=f, **kwargs)
 
@@ -56,30 +64,100 @@ class LOTHypothesis(PCFGPrior, FunctionHypothesis):
     def type(self):
         return self.value.type()
 
+    def set_value(self, value, f=None):
+        self.value_log_probability = None # see PCFGPrior; set_edited_prior fills this in for proposals
+        FunctionHypothesis.set_value(self, value, f=f)
+
     def compile_function(self):
-        """Called in set_value to compile into a function."""
+        """Called in set_value to compile into a function.
+
+        Compiled functions are shared through function_cache (see FunctionCache), keyed by the code we eval,
+        str(self). Subclasses whose code means something different for different hypotheses (e.g. it refers to
+        names that are bound differently for each) should set cache_functions = False.
+        """
         if self.value.count_nodes() > self.maxnodes:
             return lambda *args: raise_exception(TooBigException)
-        else:
+
+        code = str(self)
+        f = function_cache.get(code) if self.cache_functions else None
+        if f is None:
             try:
-                return eval(str(self)) # evaluate_expression(str(self))
+                f = eval(code) # evaluate_expression(str(self))
             except Exception as e:
-                print "# Warning: failed to execute evaluate_expression on " + str(self)
+                print "# Warning: failed to execute evaluate_expression on " + code
                 print "# ", e
-                return lambda *args: raise_exception(EvaluationException)
+                f = lambda *args: raise_exception(EvaluationException)
+
+            if self.cache_functions:
+                function_cache.add(code, f)
+        return f
 
     def compute_single_likelihood(self, datum):
         raise NotImplementedError
 
+    # ~~~~~~~~~
+    # Inside a packed_values() block (as Save, standard_sample's save_top and MPI_map results use), pickle the
+    # value in the grammar's binary format (see Grammar.pack), which is much smaller and faster to save and load
+    # than the FunctionNodes. The grammar is pickled with us, so it can unpack it. Values the grammar can't pack
+    # (e.g. using rules appended to grammar.rules directly, not with add_rule), or that have annotations, which
+    # the format does not keep, are pickled as they are.
+
+    def __getstate__(self):
+        dd = FunctionHypothesis.__getstate__(self)
+        if packed_values.depth > 0 and isFunctionNode(self.value) and self.grammar is not None and \
+                self.value.is_complete_tree(self.grammar) and all([n.annotations is None for n in self.value]):
+            try:
+                dd['packed_value'] = self.grammar.pack(self.value)
+                dd['value'] = None
+            except KeyError:
+                pass
+        return dd
+
+    def __deepcopy__(self, memo):
+        # never packed, so that annotations and bound variable names are kept
+        thecopy = object.__new__(type(self))
+        memo[id(self)] = thecopy
+        thecopy.__setstate__(deepcopy(FunctionHypothesis.__getstate__(self), memo))
+        return thecopy
+
+    def __setstate__(self, state):
+        if 'packed_value' in state:
+            state = dict(state)
+            state['value'] = state['grammar'].unpack(state.pop('packed_value'))
+        FunctionHypothesis.__setstate__(self, state)
+
     def propose(self, **kwargs):
-        ret_value, fb = None, None
+        if self.bounded:
+            kwargs.setdefault('max_nodes', self.maxnodes)
+
+        ret_value, fb, edit = None, None, None
         while True: # keep trying to propose
             try:
-                ret_value, fb = regeneration_proposal(self.grammar, self.value, **kwargs)
+                proposer = persistent_regeneration_proposer if getattr(self, 'persistent', False) else regeneration_proposer
+                ret_value, fb, edit = proposer.edit_proposal_content(self.grammar, self.value, **kwargs)
                 break
             except ProposalFailedException:
                 pass
 
         ret = self.__copy__(value=ret_value)
+        ret.set_edited_prior(self, edit)
 
         return ret, fb
+
+
+class packed_values(object):
+    """
+    Within a "with packed_values():" block, LOTHypotheses are pickled with their values packed (see
+    LOTHypothesis.__getstate__). Use it around pickling for saving to disk or sending to other processes:
+
+        with packed_values():
+            pickle.dump(hypotheses, f, pickle.HIGHEST_PROTOCOL)
+    """
+    depth = 0 # how many blocks we are in
+
+    def __enter__(self):
+        packed_values.depth += 1
+        return self
+
+    def __exit__(self, t, value, traceback):
+        packed_values.depth -= 1
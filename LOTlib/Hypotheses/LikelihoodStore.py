@@ -0,0 +1,164 @@
+"""
+        A process-wide store of each hypothesis's likelihoods on each datum, for runs on prefixes of the same data.
+
+        Sweeps over data amounts (e.g. Examples/Search.py) run a sampler on the first n data for many n, and mostly
+        see the same hypotheses each time. If the data are given as a DataPrefix, Hypothesis.compute_likelihood
+        and compute_predictive_likelihood look them up here instead. For each hypothesis (its class and value) and
+        set of data (by its content, see data_id), we keep the cumulative sum of its likelihoods on the data, as far
+        as we have needed them, so the likelihood of any prefix is one lookup.
+
+        The store assumes that compute_single_likelihood depends only on the datum and the hypothesis's class and
+        value. Like FunctionCache, it keeps only the most recently used hypotheses (see LikelihoodStore.maxsize).
+        It can be saved, and loaded by a later run to start from what we have already computed.
+
+        Example:
+            from LOTlib.Hypotheses.LikelihoodStore import DataPrefix, likelihood_store
+            likelihood_store.load('likelihoods.pkl') # if we have one
+            data = make_data(1000)
+            for n in xrange(0, 1000, 100):
+                standard_sample(make_hypothesis, lambda: DataPrefix(data, n), ...)
+            likelihood_store.save('likelihoods.pkl')
+"""
+import os
+import pickle
+from collections import OrderedDict
+from copy import copy
+from hashlib import sha1
+
+import numpy
+
+from LOTlib.DataAndObjects import Dataset, data_key
+from LOTlib.FunctionNode import isFunctionNode
+from LOTlib.Miscellaneous import Infinity
+
+
+class DataPrefix(list):
+    """
+    The first n of data, as a list, remembering the data it came from (in full). Hypothesis.compute_likelihood and
+    compute_predictive_likelihood hand it their hypothesis, and it looks the likelihoods up in likelihood_store.
+    Hypotheses whose values are not FunctionNodes, and likelihoods with extra arguments, are computed as for a list.
+    """
+
+    def __init__(self, data, n):
+        list.__init__(self, data[:n])
+        self.full, self.n = data, len(self)
+
+    def compute_likelihood(self, h, shortcut=-Infinity, **kwargs):
+        if isFunctionNode(h.value) and not kwargs:
+            return likelihood_store.compute_likelihood(h, self, shortcut=shortcut)
+        return h.compute_likelihood(list(self), shortcut=shortcut, **kwargs)
+
+    def compute_predictive_likelihood(self, h, include_last=False, **kwargs):
+        if isFunctionNode(h.value) and not kwargs:
+            return likelihood_store.compute_predictive_likelihood(h, self, include_last=include_last)
+        return h.compute_predictive_likelihood(list(self), include_last=include_last, **kwargs)
+
+
+class LikelihoodStore(object):
+    """
+    Map (data_id, hypothesis class name, value) to a numpy array of the cumulative sums of the hypothesis's
+    likelihoods (without temperature) on the first so many data, keeping only the maxsize most recently used.
+
+    Counts hits (likelihoods we only had to look up), misses (ones we had to compute some data for), and evictions
+    (hypotheses dropped to make room).
+    """
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.clear()
+
+    def clear(self):
+        """ Forget all the likelihoods and reset the counts """
+        self.table = OrderedDict() # least recently used first
+        self.data_ids = dict() # id(data) -> (data, its data_id), for data we have seen in this process
+        self.hits, self.misses, self.evictions = 0, 0, 0
+
+    def resize(self, maxsize):
+        self.maxsize = maxsize
+        self.evict()
+
+    def evict(self):
+        while len(self.table) > self.maxsize:
+            self.table.popitem(last=False)
+            self.evictions += 1
+
+    def data_id(self, data):
+        """ A digest of the content of data (see DataAndObjects.data_key), the same in every run """
+        data_ids = self.data_ids.get(id(data))
+        if data_ids is None or data_ids[0] is not data:
+            data_ids = self.data_ids[id(data)] = (data, sha1(repr(map(data_key, data))).hexdigest())
+        return data_ids[1]
+
+    def cumulative_likelihoods(self, h, data, n):
+        """ The cumulative sums of h's likelihoods on the first n (or more) of data """
+        key = (self.data_id(data), h.__class__.__name__, h.value)
+        try:
+            key, cumulative = self.table.pop(key)
+            self.table[key] = (key, cumulative) # now the most recently used, under the same key object
+        except KeyError:
+            cumulative = numpy.zeros(0)
+            key = (key[0], key[1], copy(h.value)) # in case the value gets changed in place
+
+        if len(cumulative) >= n:
+            self.hits += 1
+            return cumulative
+
+        # compute the data we are missing, only once for each row if data is a Dataset
+        self.misses += 1
+        if isinstance(data, Dataset):
+            lls = numpy.diff(numpy.concatenate(([0.0], cumulative)))
+            row_ll = dict(zip(data.order[:len(cumulative)], lls))
+            new = []
+            for i in data.order[len(cumulative):n]:
+                if i not in row_ll:
+                    row_ll[i] = h.compute_single_likelihood(data.rows[i])
+                new.append(row_ll[i])
+        else:
+            new = [h.compute_single_likelihood(datum) for datum in data[len(cumulative):n]]
+
+        start = cumulative[-1] if len(cumulative) > 0 else 0.0
+        cumulative = numpy.concatenate((cumulative, start + numpy.cumsum(new)))
+        if self.maxsize > 0:
+            self.table[key] = (key, cumulative)
+            self.evict()
+        return cumulative
+
+    def compute_likelihood(self, h, data, shortcut=-Infinity):
+        """ What h.compute_likelihood(data, shortcut=shortcut) would be, for a DataPrefix """
+        if data.n == 0:
+            return 0.0
+
+        cumulative = self.cumulative_likelihoods(h, data.full, data.n)[:data.n] / h.likelihood_temperature
+        if shortcut > -Infinity and (cumulative < shortcut).any():
+            return -Infinity
+        return float(cumulative[-1])
+
+    def compute_predictive_likelihood(self, h, data, include_last=False):
+        """ What h.compute_predictive_likelihood(data, include_last) would be, for a DataPrefix """
+        m = data.n if include_last else max(0, data.n-1)
+        return numpy.concatenate(([0.0], self.cumulative_likelihoods(h, data.full, m)[:m]))
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            pickle.dump(self.table.values(), f, pickle.HIGHEST_PROTOCOL)
+
+    def load(self, path):
+        """ Add the likelihoods saved in path, if it exists, keeping ours where we have computed more data """
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                for key, cumulative in pickle.load(f):
+                    ours = self.table.get(key)
+                    if ours is None or len(cumulative) > len(ours[1]):
+                        self.table[key] = (key, cumulative)
+            self.evict()
+
+    def __len__(self):
+        return len(self.table)
+
+    def __str__(self):
+        return "<LikelihoodStore: %s hypotheses, %s hits, %s misses, %s evictions>" % \
+               (len(self), self.hits, self.misses, self.evictions)
+
+
+# The store DataPrefixes look their likelihoods up in
+likelihood_store = LikelihoodStore()
@@ -0,0 +1,190 @@
+"""
+        A likelihood mixin that reuses the likelihood of hypotheses that compute the same function on the data.
+
+        Many different trees compute the same function, and chains spend much of their time on likelihoods they
+        have already computed for some other tree. SemanticLikelihoodCache first runs a hypothesis on a few of the
+        data's inputs (the probes). Only if a hypothesis we have stored gave the same outputs on the probes do we run
+        it on all the other inputs too, and if the outputs all match, we reuse the stored likelihood. Otherwise the
+        likelihood is computed as usual, from the outputs we already have, and stored.
+
+        The cache assumes that hypotheses are deterministic, and that compute_single_likelihood depends only on the
+        datum and the hypothesis's output on it. So hypotheses of one class must not differ in anything else it uses
+        (e.g. an outlier parameter). It holds the likelihoods for one set of data at a time, and starts over when it
+        is given another.
+
+        Example:
+            class MyHypothesis(SemanticLikelihoodCache, BinaryLikelihood, LOTHypothesis):
+                pass
+            ... run a sampler ...
+            print likelihood_cache # or likelihood_cache.hit_rate()
+"""
+from collections import OrderedDict
+
+from LOTlib.DataAndObjects import Dataset, data_key
+from LOTlib.Miscellaneous import Infinity, attrmem
+
+
+class RaisedException(object):
+    """ Stands in for an output when running the hypothesis raised exception """
+    __slots__ = ['exception']
+
+    def __init__(self, exception):
+        self.exception = exception
+
+
+def output_key(output):
+    """ A hashable key for a hypothesis's output; see DataAndObjects.data_key """
+    if isinstance(output, RaisedException):
+        return ('raised', output.exception.__class__.__name__)
+    else:
+        return data_key(output)
+
+NOT_RUN = object() # outputs we have not computed yet
+
+
+class LikelihoodCache(object):
+    """
+    The likelihoods of each row of a Dataset (without temperature), for the hypotheses we have seen on it, stored
+    under their class and outputs on the probes, and then under their outputs on all the distinct inputs. Keeps the
+    maxsize most recently used probe outputs.
+
+    Counts hits (stored likelihoods reused), misses, and collisions (the misses where the probes matched something
+    stored, but the other outputs did not).
+    """
+
+    def __init__(self, maxsize=10000, probes=10):
+        self.maxsize, self.probes = maxsize, probes
+        self.clear()
+
+    def clear(self):
+        """ Forget the data and all the likelihoods, and reset the counts """
+        self.data = None
+        self.table = OrderedDict() # fingerprint -> {outputs key -> row likelihoods}, least recently used first
+        self.hits, self.misses, self.collisions = 0, 0, 0
+
+    def set_data(self, data):
+        """ Start over on data, finding its distinct inputs. If some datum has no input, inputs is None """
+        self.data = data
+        self.dataset = data if isinstance(data, Dataset) else Dataset(data)
+        self.table = OrderedDict()
+
+        self.inputs, self.row_input = [], [] # the distinct inputs, and the one for each row
+        index = dict()
+        for x in self.dataset.inputs:
+            if not isinstance(x, (list, tuple)):
+                self.inputs = None
+                return
+            k = data_key(x)
+            if k not in index:
+                index[k] = len(self.inputs)
+                self.inputs.append(x)
+            self.row_input.append(index[k])
+
+    def can_cache(self, data):
+        if data is not self.data:
+            self.set_data(data)
+        return self.inputs is not None
+
+    def get(self, fingerprint):
+        """ Return the {outputs key -> row likelihoods} stored for fingerprint, or None """
+        try:
+            stored = self.table.pop(fingerprint)
+        except KeyError:
+            return None
+        self.table[fingerprint] = stored # move it to the most recently used end
+        return stored
+
+    def add(self, fingerprint, outputs, row_likelihoods):
+        self.table.setdefault(fingerprint, dict())[outputs] = row_likelihoods
+        while len(self.table) > self.maxsize:
+            self.table.popitem(last=False)
+
+    def hit_rate(self):
+        return float(self.hits) / max(1, self.hits + self.misses)
+
+    def __len__(self):
+        return len(self.table)
+
+    def __str__(self):
+        return "<LikelihoodCache: %s fingerprints, %s hits, %s misses (%s collisions), hit rate %.3f>" % \
+               (len(self), self.hits, self.misses, self.collisions, self.hit_rate())
+
+
+# The cache used by SemanticLikelihoodCache, unless a class sets its own
+likelihood_cache = LikelihoodCache()
+
+
+class SemanticLikelihoodCache(object):
+    """
+    Look up likelihoods in likelihood_cache by what the hypothesis computes on the data (see above). This must come
+    before the other likelihood and hypothesis classes, so that its compute_likelihood and __call__ are used.
+    """
+    likelihood_cache = likelihood_cache
+    _semantic_call = None # (input, output) while compute_single_likelihood is given an output we already have
+
+    def __call__(self, *args):
+        call = self._semantic_call
+        if call is not None and len(args) == len(call[0]) and all([a is b for a, b in zip(args, call[0])]):
+            if isinstance(call[1], RaisedException):
+                raise call[1].exception
+            return call[1]
+        return super(SemanticLikelihoodCache, self).__call__(*args)
+
+    def semantic_output(self, x):
+        try:
+            return self(*x)
+        except Exception as e:
+            return RaisedException(e)
+
+    def compute_single_likelihood_from_output(self, datum, output):
+        """ compute_single_likelihood(datum), where we already know our output on datum.input """
+        self._semantic_call = (datum.input, output)
+        try:
+            return self.compute_single_likelihood(datum)
+        finally:
+            self._semantic_call = None
+
+    @attrmem('likelihood')
+    def compute_likelihood(self, data, shortcut=-Infinity, **kwargs):
+        cache = self.likelihood_cache
+        if kwargs or not cache.can_cache(data):
+            return super(SemanticLikelihoodCache, self).compute_likelihood(data, shortcut=shortcut, **kwargs)
+
+        outputs = [NOT_RUN] * len(cache.inputs)
+        for j in xrange(min(cache.probes, len(outputs))):
+            outputs[j] = self.semantic_output(cache.inputs[j])
+        fingerprint = (self.__class__, tuple(map(output_key, outputs[:cache.probes])))
+
+        row_ll = None
+        stored = cache.get(fingerprint)
+        if stored is not None: # something gave these outputs on the probes, so check the rest
+            for j in xrange(len(outputs)):
+                if outputs[j] is NOT_RUN:
+                    outputs[j] = self.semantic_output(cache.inputs[j])
+            row_ll = stored.get(tuple(map(output_key, outputs)))
+            if row_ll is None:
+                cache.collisions += 1
+
+        computed = row_ll is None
+        if computed:
+            cache.misses += 1
+            row_ll = [None] * len(cache.dataset.rows)
+        else:
+            cache.hits += 1
+
+        # Add up the data in order, as Hypothesis.compute_likelihood does, computing the rows we don't have
+        ll = 0.0
+        for i in cache.dataset.order:
+            if row_ll[i] is None:
+                j = cache.row_input[i]
+                if outputs[j] is NOT_RUN:
+                    outputs[j] = self.semantic_output(cache.inputs[j])
+                row_ll[i] = self.compute_single_likelihood_from_output(cache.dataset.rows[i], outputs[j])
+            ll += row_ll[i] / self.likelihood_temperature
+            if ll < shortcut:
+                return -Infinity # NOTE: we don't store partial likelihoods
+
+        if computed:
+            cache.add(fingerprint, tuple(map(output_key, outputs)), row_ll)
+
+        return ll
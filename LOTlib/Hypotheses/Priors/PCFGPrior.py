@@ -4,6 +4,17 @@
 from LOTlib.Miscellaneous import attrmem, Infinity
 
 class PCFGPrior(object):
+    """
+        The value's log probability under the grammar is kept in value_log_probability. When a proposer says what it
+        changed (a ProposalEdit), the proposal's is computed from ours as old - removed subtree + added subtree,
+        instead of walking the whole tree again. It is forgotten whenever the grammar's probabilities change (Grammar.p_version).
+
+        If validate_prior is True, every prior is also computed in full and checked against the stored one.
+    """
+    validate_prior = False
+
+    value_log_probability = None
+    value_log_probability_version = None
 
     @attrmem('prior')
     def compute_prior(self):
@@ -17,4 +28,22 @@ class PCFGPrior(object):
         else:
 
             # Compute the grammar's probability
-            return self.grammar.log_probability(self.value) / self.prior_temperature
+            lp = self.value_log_probability
+            if self.value_log_probability_version is not self.grammar.p_version():
+                lp = None
+
+            if lp is None or self.validate_prior:
+                full_lp = self.grammar.log_probability(self.value)
+                assert lp is None or abs(lp - full_lp) < 1e-6, \
+                    "*** Incremental prior %s does not match %s for %s" % (lp, full_lp, self.value)
+                lp = full_lp
+                self.value_log_probability, self.value_log_probability_version = lp, self.grammar.p_version()
+
+            return lp / self.prior_temperature
+
+    def set_edited_prior(self, previous, edit):
+        """We were proposed from previous by edit (a ProposalEdit, or None); update value_log_probability from its"""
+        if (edit is not None and previous.value_log_probability is not None and
+                previous.value_log_probability_version is self.grammar.p_version()):
+            self.value_log_probability = previous.value_log_probability + edit.delta()
+            self.value_log_probability_version = self.grammar.p_version()
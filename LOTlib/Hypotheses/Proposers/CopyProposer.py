@@ -9,7 +9,7 @@ from LOTlib.FunctionNode import NodeSamplingException
 from LOTlib.Hypotheses.Proposers.Proposer import *
 from LOTlib.Hypotheses.Proposers.Utilities import *
 from LOTlib.Miscellaneous import Infinity, lambdaOne, logsumexp, nicelog
-from LOTlib.Subtrees import least_common_difference
+from LOTlib.Subtrees import least_common_difference_paths
 from copy import copy, deepcopy
 
 class CopyProposer(Proposer):
@@ -33,29 +33,27 @@ class CopyProposer(Proposer):
         return new_t
     
     def compute_proposal_probability(self,grammar, t1, t2, resampleProbability=lambdaOne, recurse=True):
-        chosen_node1 , chosen_node2 = least_common_difference(t1,t2)
+        path1, path2 = least_common_difference_paths(t1,t2)
     
         lps = []
-        if chosen_node1 is None: # any node in the tree could have been copied
+        if path1 is None: # any node in the tree could have been copied
+            chosen_node1 = None
             for node in t1:
                 could_be_source = lambda x: 1.0 * nodes_equal_except_parents(grammar,x,node) * resampleProbability(x)
                 lp_of_choosing_source = (nicelog(t1.sample_node_normalizer(could_be_source) - could_be_source(node)) - nicelog(t1.sample_node_normalizer(resampleProbability)))
                 lp_of_choosing_target = t1.sampling_log_probability(chosen_node1,resampleProbability=resampleProbability)
                 lps += [lp_of_choosing_source + lp_of_choosing_target]
         else: # we have a specific path up the tree
-            while chosen_node1:
+            # NOTE: we go up the paths rather than following parent refs, since t1 and t2 may share subtrees
+            if not recurse:
+                path1, path2 = path1[-1:], path2[-1:]
+            for chosen_node1, chosen_node2 in reversed(zip(path1, path2)):
                 could_be_source = lambda x: 1.0 * nodes_equal_except_parents(grammar,x,chosen_node2) * resampleProbability(x)
     
                 lp_of_choosing_source = nicelog(t1.sample_node_normalizer(could_be_source)) - nicelog(t1.sample_node_normalizer(resampleProbability))
                 lp_of_choosing_target = t1.sampling_log_probability(chosen_node1,resampleProbability=resampleProbability)
                 lps += [lp_of_choosing_source + lp_of_choosing_target]
     
-                if recurse:
-                    chosen_node1 = chosen_node1.parent
-                    chosen_node2 = chosen_node2.parent
-                else:
-                    chosen_node1 = None
-    
         return logsumexp(lps)
 
 if __name__ == "__main__": # test code
@@ -18,6 +18,9 @@ from LOTlib.Subtrees import least_common_difference
 
 class DeleteProposer(Proposer):
     def propose_tree(self,grammar,tree,resampleProbability=lambdaOne):
+        return self.propose_edit(grammar,tree,resampleProbability)[0]
+
+    def propose_edit(self,grammar,tree,resampleProbability=lambdaOne):
         new_t = copy(tree)
 
         try: # to choose a node to delete
@@ -33,10 +36,13 @@ class DeleteProposer(Proposer):
         # who to promote; NOTE: not done via any weighting
         chosen_child = sample1(replicating_children)
 
-        # perform the deletion
-        n.setto(chosen_child)
+        # perform the deletion, scoring n before and after in its parent's context
+        with BVRuleContextManager(grammar, n.parent, recurse_up=True):
+            old_lp = grammar.log_probability(n)
+            n.setto(chosen_child)
+            new_lp = grammar.log_probability(n)
 
-        return new_t
+        return new_t, ProposalEdit(n, old_lp, new_lp)
 
     def compute_proposal_probability(self,grammar,t1,t2,resampleProbability=lambdaOne):
         node_1,node_2 = least_common_difference(t1,t2)
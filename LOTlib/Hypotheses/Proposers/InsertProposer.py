@@ -14,6 +14,9 @@ from LOTlib.Subtrees import least_common_difference
 
 class InsertProposer(Proposer):
     def propose_tree(self,grammar,tree,resampleProbability=lambdaOne):
+        return self.propose_edit(grammar,tree,resampleProbability)[0]
+
+    def propose_edit(self,grammar,tree,resampleProbability=lambdaOne):
         new_t = copy(tree)
 
         try: # to choose a node to insert on
@@ -22,7 +25,7 @@ class InsertProposer(Proposer):
             raise ProposalFailedException
 
         # is there a rule that expands from ni.returntype to some ni.returntype?
-        replicating_rules = filter(can_insert_GrammarRule, grammar.rules[ni.returntype])
+        replicating_rules = filter(can_insert_GrammarRule, grammar.get_rules(ni.returntype))
         if len(replicating_rules) == 0:
             raise ProposalFailedException
 
@@ -45,10 +48,13 @@ class InsertProposer(Proposer):
             for i,a in enumerate(fn.args):
                 fn.args[i] = copy(ni) if (i == replace_i) else grammar.generate(a)
 
-        # perform the insertion
-        ni.setto(fn)
+        # perform the insertion, scoring ni before and after in its parent's context
+        with BVRuleContextManager(grammar, ni.parent, recurse_up=True):
+            old_lp = grammar.log_probability(ni)
+            ni.setto(fn)
+            new_lp = grammar.log_probability(ni)
 
-        return new_t
+        return new_t, ProposalEdit(ni, old_lp, new_lp)
 
     def compute_proposal_probability(self,grammar,t1,t2,resampleProbability=lambdaOne):
         node_1,node_2 = least_common_difference(t1,t2)
@@ -57,7 +63,7 @@ class InsertProposer(Proposer):
 
             lp_choosing_node_1 =  t1.sampling_log_probability(node_1,resampleProbability=lambda t: can_insert_FunctionNode(t, grammar)*resampleProbability(t))
 
-            lp_choosing_rule = -nicelog(len(filter(can_insert_GrammarRule, grammar.rules[node_1.returntype])))
+            lp_choosing_rule = -nicelog(len(filter(can_insert_GrammarRule, grammar.get_rules(node_1.returntype))))
             lp_choosing_replacement = -nicelog(len(filter( lambda i: node_2.args[i].returntype == node_1.returntype, xrange(len(node_2.args)))))
 
             lp_generation = []
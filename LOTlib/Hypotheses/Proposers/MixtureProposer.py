@@ -20,6 +20,11 @@ class MixtureProposer(Proposer):
         chosen_proposer = weighted_sample(self.proposers, probs=self.proposer_weights)
         return chosen_proposer.propose_tree(grammar,tree,resampleProbability)
 
+    def propose_edit(self,grammar,tree,resampleProbability=lambdaOne):
+        """ sample a sub-proposer and propose from it, keeping its edit """
+        chosen_proposer = weighted_sample(self.proposers, probs=self.proposer_weights)
+        return chosen_proposer.propose_edit(grammar,tree,resampleProbability)
+
     def compute_proposal_probability(self,grammar, t1, t2, resampleProbability=lambdaOne, **kwargs):
         """
             sum over all possible ways of generating t2 from t1 over all
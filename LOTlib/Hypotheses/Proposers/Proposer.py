@@ -6,26 +6,52 @@ class ProposalFailedException(Exception):
     """
     pass
 
+class ProposalEdit(object):
+    """
+    What a proposal changed: it put node where there was a subtree whose log probability under the grammar (in its
+    context) was old_lp, and node's is new_lp. Nothing else's probability changes, so the new tree's log probability
+    is the old tree's plus delta() (see PCFGPrior).
+    """
+    __slots__ = ['node', 'old_lp', 'new_lp']
+
+    def __init__(self, node, old_lp, new_lp):
+        self.node, self.old_lp, self.new_lp = node, old_lp, new_lp
+
+    def delta(self):
+        return self.new_lp - self.old_lp
+
+
 class Proposer(object):
     def propose(self, **kwargs):
-        ret_value, fb = None, None
+        ret_value, fb, edit = None, None, None
         while not ret_value: # keep trying to propose
             try:
-                ret_value, fb =  self.proposal_content(self.grammar, self.value, **kwargs)
+                ret_value, fb, edit = self.edit_proposal_content(self.grammar, self.value, **kwargs)
             except ProposalFailedException:
                 pass
         ret = self.__copy__(value=ret_value)
+        if hasattr(ret, 'set_edited_prior'): # see PCFGPrior
+            ret.set_edited_prior(self, edit)
         return ret, fb
 
     def proposal_content(self, grammar, tree, resampleProbability=lambdaOne):
-        t = self.propose_tree(grammar,tree,resampleProbability)
+        t, fb, _ = self.edit_proposal_content(grammar, tree, resampleProbability)
+        return t, fb
+
+    def edit_proposal_content(self, grammar, tree, resampleProbability=lambdaOne):
+        """ As proposal_content, but also returning the ProposalEdit (or None if we do not know what changed) """
+        t, edit = self.propose_edit(grammar, tree, resampleProbability)
         fb = self.compute_fb(grammar,tree,t,resampleProbability)
-        return t,fb
+        return t, fb, edit
 
     def compute_fb(self, grammar, t1, t2, resampleProbability=lambdaOne):
         return (self.compute_proposal_probability(grammar,t1,t2,resampleProbability) -
                 self.compute_proposal_probability(grammar,t2,t1,resampleProbability))
 
+    def propose_edit(self, grammar, tree, resampleProbability=lambdaOne):
+        """ Propose, returning the new tree and a ProposalEdit, if the subclass can say what it changed """
+        return self.propose_tree(grammar,tree,resampleProbability), None
+
     def propose_tree(self, grammar,tree,resampleProbability=lambdaOne):
         raise NotImplementedError
 
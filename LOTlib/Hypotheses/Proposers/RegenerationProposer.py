@@ -8,16 +8,43 @@
 from LOTlib.BVRuleContextManager import BVRuleContextManager
 from LOTlib.FunctionNode import NodeSamplingException
 from LOTlib.Hypotheses.Proposers.Proposer import *
-from LOTlib.Miscellaneous import lambdaOne, logsumexp
-from LOTlib.Subtrees import least_common_difference
+from LOTlib.Miscellaneous import lambdaOne, logsumexp, Infinity
+from LOTlib.Subtrees import least_common_difference_paths
 from copy import copy
 from math import log
 
 class RegenerationProposer(Proposer):
+    """
+        If persistent is True, proposals do not copy the whole tree. Instead, they copy only the path from the root
+        down to the regenerated node and share everything else with the current tree (see FunctionNode.path_copy).
+        The trees this makes must not be changed in place. See PersistentRegenerationProposer, or, when this is
+        used as a mixin, give the hypothesis persistent=True.
 
-    def propose_tree(self, grammar, t, resampleProbability=lambdaOne):
+        If max_nodes is given, the regenerated subtree is drawn conditioned on the whole tree having at most
+        max_nodes nodes (see Grammar.generate_bounded), and the proposal probabilities account for that, so we
+        never propose a tree only for its prior to throw it away.
+    """
+    persistent = False
+
+    def edit_proposal_content(self, grammar, tree, resampleProbability=lambdaOne, max_nodes=Infinity):
+        t, edit = self.propose_edit(grammar, tree, resampleProbability, max_nodes=max_nodes)
+        fb = (self.compute_proposal_probability(grammar, tree, t, resampleProbability, max_nodes=max_nodes) -
+              self.compute_proposal_probability(grammar, t, tree, resampleProbability, max_nodes=max_nodes))
+        return t, fb, edit
+
+    def proposal_content(self, grammar, tree, resampleProbability=lambdaOne, max_nodes=Infinity):
+        t, fb, _ = self.edit_proposal_content(grammar, tree, resampleProbability, max_nodes=max_nodes)
+        return t, fb
+
+    def propose_tree(self, grammar, t, resampleProbability=lambdaOne, max_nodes=Infinity):
         """Propose, returning the new tree"""
-        new_t = copy(t)
+        return self.propose_edit(grammar, t, resampleProbability, max_nodes=max_nodes)[0]
+
+    def propose_edit(self, grammar, t, resampleProbability=lambdaOne, max_nodes=Infinity):
+        """Propose, returning the new tree and the ProposalEdit for the regenerated node"""
+        persistent = self.persistent
+
+        new_t = t if persistent else copy(t)
     
         try: # to sample a subnode
             n, lp = new_t.sample_subnode(resampleProbability=resampleProbability)
@@ -27,36 +54,61 @@ class RegenerationProposer(Proposer):
         # In the context of the parent, resample n according to the
         # grammar. recurse_up in order to add all the parent's rules
         with BVRuleContextManager(grammar, n.parent, recurse_up=True):
-            n.setto(grammar.generate(n.returntype))
-        return new_t
-    
-    def compute_proposal_probability(self, grammar, t1, t2, resampleProbability=lambdaOne, recurse=True):
+            if max_nodes < Infinity:
+                budget = max_nodes - (new_t.count_nodes() - n.count_nodes()) # what is left for n
+                if budget < grammar.nodes_to_terminal(n.returntype):
+                    raise ProposalFailedException
+                new = grammar.generate_bounded(n.returntype, max_nodes=budget)
+            else:
+                new = grammar.generate(n.returntype)
+
+            old_lp, new_lp = grammar.log_probability(n), grammar.log_probability(new)
+
+            if persistent:
+                new_t = t.path_copy(n, new)
+            else:
+                n.setto(new)
+                new = n
+        return new_t, ProposalEdit(new, old_lp, new_lp)
+
+    def generation_log_probability(self, grammar, t, node, max_nodes=Infinity):
+        """The log probability of regenerating node in t, in the grammar's current scope"""
+        if max_nodes < Infinity:
+            budget = max_nodes - (t.count_nodes() - node.count_nodes())
+            return grammar.bounded_sampler().log_probability(node, max_nodes=budget)
+        else:
+            return grammar.log_probability(node)
+
+    def compute_proposal_probability(self, grammar, t1, t2, resampleProbability=lambdaOne, recurse=True,
+                                     max_nodes=Infinity):
         # NOTE: This is not strictly necessary since we don't actually have to sum over trees
         # if we use an auxiliary variable argument. But this fits nicely with the other proposers
         # and is not much slower.
 
-        chosen_node1 , chosen_node2 = least_common_difference(t1,t2)
+        path1, path2 = least_common_difference_paths(t1,t2)
 
         lps = []
-        if chosen_node1 is None: # any node in the tree could have been regenerated
+        if path1 is None: # any node in the tree could have been regenerated
             for node in t1:
                 lp_of_choosing_node = t1.sampling_log_probability(node,resampleProbability=resampleProbability)
                 with BVRuleContextManager(grammar, node.parent, recurse_up=True):
-                    lp_of_generating_tree = grammar.log_probability(node)
+                    lp_of_generating_tree = self.generation_log_probability(grammar, t1, node, max_nodes)
                 lps += [lp_of_choosing_node + lp_of_generating_tree]
         else: # we have a specific path up the tree
-            while chosen_node1:
+            # NOTE: we go up the paths rather than following parent refs, since t1 and t2 may share subtrees
+            if not recurse:
+                path1, path2 = path1[-1:], path2[-1:]
+            for chosen_node1, chosen_node2 in reversed(zip(path1, path2)):
                 lp_of_choosing_node = t1.sampling_log_probability(chosen_node1,resampleProbability=resampleProbability)
                 with BVRuleContextManager(grammar, chosen_node2.parent, recurse_up=True):
-                    lp_of_generating_tree = grammar.log_probability(chosen_node2)
+                    lp_of_generating_tree = self.generation_log_probability(grammar, t2, chosen_node2, max_nodes)
                 lps += [lp_of_choosing_node + lp_of_generating_tree]
-                if recurse:
-                    chosen_node1 = chosen_node1.parent
-                    chosen_node2 = chosen_node2.parent
-                else:
-                    chosen_node1 = None
 
         return logsumexp(lps)
 
+class PersistentRegenerationProposer(RegenerationProposer):
+    """ A RegenerationProposer whose proposals share all untouched subtrees with the current tree """
+    persistent = True
+
 if __name__ == "__main__": # test code
     test_proposer(RegenerationProposer)
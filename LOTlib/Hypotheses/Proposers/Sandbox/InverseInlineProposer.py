@@ -146,6 +146,7 @@ class InverseInlineProposer(object):
 
             # build our little structure
             n.args = lambdafn, argval
+            n.invalidate_cache()
 
             assert self.can_inline_at(n) # this had better be true
 
@@ -173,7 +174,7 @@ class InverseInlineProposer(object):
             assert self.can_abstract_at(n) # this had better be true
 
             # figure out which rule we are supposed to use
-            possible_rules = [r for r in self.grammar.rules[n.returntype] if r.name==n.name and tuple(r.to) == tuple(n.argTypes()) ]
+            possible_rules = [r for r in self.grammar.get_rules(n.returntype) if r.name==n.name and tuple(r.to) == tuple(n.argTypes()) ]
             assert len(possible_rules) == 1 # for now?
 
             n.rule = possible_rules[0]
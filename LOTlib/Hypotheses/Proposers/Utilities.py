@@ -17,7 +17,7 @@ def can_insert_FunctionNode(x, grammar):
     """
     We can insert ot a function node if the grammar contains a rule from its NT to itself
     """
-    return any([can_insert_GrammarRule(r) for r in grammar.rules[x.returntype]])
+    return any([can_insert_GrammarRule(r) for r in grammar.get_rules(x.returntype)])
 
 def list_replicating_children(node):
     return [arg for arg in node.args if (isinstance(arg,FunctionNode)
@@ -33,9 +33,12 @@ def nodes_are_roughly_equal(n1,n2):
 
 def give_grammar(grammar,node):
     # BVRuleContextManager gives the grammar used inside a node, not
-    # at the node itself, so we consider the node's parent
+    # at the node itself, so we consider the node's parent. The bound
+    # variable rules are only in scope, so copy them into the new grammar
     with BVRuleContextManager(grammar, node.parent, recurse_up=True):
         g = deepcopy(grammar)
+        for r in reversed(list(grammar.iterate_bv_scope())):
+            g.rules[r.nt].append(r)
     return g
 
 def nodes_equal_except_parents(grammar,n1,n2):
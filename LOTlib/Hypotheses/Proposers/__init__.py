@@ -16,8 +16,11 @@ insert_delete_proposal = InsertDeleteProposer().proposal_content
 
 from MixtureProposer import MixtureProposer
 
-from RegenerationProposer import RegenerationProposer
-regeneration_proposal = RegenerationProposer().proposal_content
+from RegenerationProposer import RegenerationProposer, PersistentRegenerationProposer
+regeneration_proposer = RegenerationProposer()
+regeneration_proposal = regeneration_proposer.proposal_content
+persistent_regeneration_proposer = PersistentRegenerationProposer()
+persistent_regeneration_proposal = persistent_regeneration_proposer.proposal_content
 
 from InsertDeleteRegenerationProposer import InsertDeleteRegenerationProposer
 IDR_proposal = InsertDeleteRegenerationProposer().proposal_content
\ No newline at end of file
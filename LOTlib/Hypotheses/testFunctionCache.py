@@ -0,0 +1,69 @@
+import unittest
+from copy import copy
+
+from LOTlib.Eval import RecursionDepthException, TooBigException
+from LOTlib.Grammar import Grammar
+from LOTlib.Hypotheses.FunctionCache import FunctionCache, function_cache
+from LOTlib.Hypotheses.LOTHypothesis import LOTHypothesis
+from LOTlib.Hypotheses.RecursiveLOTHypothesis import RecursiveLOTHypothesis
+
+
+class FunctionCacheTest(unittest.TestCase):
+    def runTest(self):
+        print "# Testing FunctionCache"
+        c = FunctionCache(maxsize=2)
+        c.add('a', 1)
+        c.add('b', 2)
+        self.assertEqual(c.get('a'), 1) # so b is now the least recently used
+        c.add('c', 3)
+        self.assertEqual(c.get('b'), None)
+        self.assertEqual(c.get('a'), 1)
+        self.assertEqual(c.get('c'), 3)
+        self.assertEqual((c.hits, c.misses, c.evictions), (3, 1, 1))
+
+        c.resize(0)
+        c.add('d', 4)
+        self.assertEqual((len(c), c.get('d'), c.evictions), (0, None, 3))
+
+
+class LOTHypothesisCacheTest(unittest.TestCase):
+    def runTest(self):
+        print "# Testing LOTHypothesis compiled function caching"
+        grammar = Grammar()
+        grammar.add_rule('START', '', ['EXPR'], 1.0)
+        grammar.add_rule('EXPR', 'plus_', ['EXPR', 'EXPR'], 1.0)
+        grammar.add_rule('EXPR', 'x', None, 3.0)
+        grammar.add_rule('EXPR', '1', None, 1.0)
+
+        function_cache.clear()
+        for _ in xrange(100):
+            t = grammar.generate()
+            h = LOTHypothesis(grammar, value=t, maxnodes=100)
+            hits = function_cache.hits
+
+            # the same tree gives the same function, without compiling it again
+            h2 = LOTHypothesis(grammar, value=copy(t), maxnodes=100)
+            self.assertTrue(h2.fvalue is h.fvalue)
+            self.assertEqual(function_cache.hits, hits+1)
+
+            # but not if it's too big for this hypothesis
+            h3 = LOTHypothesis(grammar, value=copy(t), maxnodes=t.count_nodes()-1)
+            self.assertRaises(TooBigException, h3, 1)
+
+            # and not with a different display
+            h4 = LOTHypothesis(grammar, value=copy(t), display='lambda y, x: %s', maxnodes=100)
+            self.assertFalse(h4.fvalue is h.fvalue)
+            self.assertEqual(h4(None, 3), h(3))
+
+        # the cache keeps the code, not the trees
+        self.assertTrue(all([isinstance(k, str) for k in function_cache.cache]))
+
+        # recursive hypotheses with the same value share a function, but each recurses on itself
+        grammar = Grammar()
+        grammar.add_rule('START', '', ['EXPR'], 1.0)
+        grammar.add_rule('EXPR', '(0 if x <= 0 else 1 + recurse_(x-1))', None, 1.0)
+        r, r2 = RecursiveLOTHypothesis(grammar), RecursiveLOTHypothesis(grammar, recurse_bound=1000)
+        self.assertTrue(r.fvalue is r2.fvalue)
+        self.assertEqual(r(10), 10)
+        self.assertEqual(r2(100), 100)
+        self.assertRaises(RecursionDepthException, r, 100)
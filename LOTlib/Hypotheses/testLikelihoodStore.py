@@ -0,0 +1,61 @@
+import os
+import unittest
+from random import random
+from tempfile import mkstemp
+from numpy import allclose
+
+from LOTlib.Hypotheses.LikelihoodStore import DataPrefix, LikelihoodStore, likelihood_store
+from LOTlib.Miscellaneous import Infinity
+
+
+class LikelihoodStoreTest(unittest.TestCase):
+    def runTest(self):
+        print "# Testing LikelihoodStore"
+        from LOTlib.Examples.Number.Model import make_data, make_hypothesis
+
+        likelihood_store.clear()
+        hypotheses = dict() # distinct values
+        while len(hypotheses) < 20:
+            h = make_hypothesis()
+            hypotheses[h.value] = h
+        hypotheses = hypotheses.values()
+        for data in [make_data(100), list(make_data(100))]:
+            for n in [0, 1, 50, 10, 100]:
+                prefix = DataPrefix(data, n)
+                for h in hypotheses:
+                    h.likelihood_temperature = 2.0
+                    ll = h.compute_likelihood(list(data)[:n])
+                    self.assertAlmostEqual(h.compute_likelihood(prefix), ll)
+
+                    shortcut = ll + (random()-0.5)*10
+                    self.assertEqual(h.compute_likelihood(prefix, shortcut=shortcut) == -Infinity,
+                                     h.compute_likelihood(list(data)[:n], shortcut=shortcut) == -Infinity)
+
+                    for include_last in [False, True]:
+                        self.assertTrue(allclose(h.compute_predictive_likelihood(prefix, include_last=include_last),
+                                                 h.compute_predictive_likelihood(list(data)[:n], include_last=include_last)))
+
+        # hypotheses are stored once per data, and computed only when we need more of the data than before
+        self.assertEqual(len(likelihood_store), 2*len(hypotheses))
+        self.assertEqual(likelihood_store.misses, 2*3*len(hypotheses))
+
+        # a new store that loads this one has everything already
+        _, path = mkstemp()
+        try:
+            likelihood_store.save(path)
+            store = LikelihoodStore()
+            store.load(path)
+        finally:
+            os.remove(path)
+        for h in hypotheses:
+            store.compute_likelihood(h, DataPrefix(data, 100))
+        self.assertEqual((store.hits, store.misses), (len(hypotheses), 0))
+
+        # a bounded store keeps only the most recently used hypotheses
+        store = LikelihoodStore(maxsize=5)
+        for h in hypotheses:
+            store.compute_likelihood(h, DataPrefix(data, 10))
+        self.assertEqual((len(store), store.evictions), (5, len(hypotheses)-5))
+        for h in reversed(hypotheses):
+            store.compute_likelihood(h, DataPrefix(data, 10))
+        self.assertEqual((store.hits, store.misses), (5, 2*len(hypotheses)-5))
@@ -0,0 +1,39 @@
+import unittest
+
+from LOTlib.DefaultGrammars import finiteTestGrammar, infiniteTestGrammar
+from LOTlib.Grammar import Grammar
+from LOTlib.Hypotheses.LOTHypothesis import LOTHypothesis
+from LOTlib.Hypotheses.Proposers import MixtureProposer, InsertProposer, DeleteProposer, RegenerationProposer
+
+
+class IDRHypothesis(MixtureProposer, LOTHypothesis):
+    def __init__(self, grammar=None, **kwargs):
+        LOTHypothesis.__init__(self, grammar, **kwargs)
+        MixtureProposer.__init__(self, proposers=[InsertProposer(), DeleteProposer(), RegenerationProposer()],
+                                 proposer_weights=[1.0, 1.0, 1.0])
+
+
+class IncrementalPriorTest(unittest.TestCase):
+    def runTest(self):
+        print "# Testing incremental PCFG priors"
+        # insert and delete proposals need a grammar without string arguments
+        idr_grammar = Grammar()
+        idr_grammar.add_rule('START', '', ['EXPR'], 1.0)
+        idr_grammar.add_rule('EXPR', 'plus_', ['EXPR', 'EXPR'], 1.0)
+        idr_grammar.add_rule('EXPR', 'apply_', ['FUNC', 'EXPR'], 0.5)
+        idr_grammar.add_rule('FUNC', 'lambda', ['EXPR'], 1.0, bv_type='EXPR', bv_p=2.0)
+        idr_grammar.add_rule('EXPR', 'x', None, 3.0)
+        idr_grammar.add_rule('EXPR', '1', None, 1.0)
+
+        for grammar, make_h in [(finiteTestGrammar, lambda g: LOTHypothesis(g, maxnodes=1000)),
+                                (infiniteTestGrammar, lambda g: LOTHypothesis(g, maxnodes=1000)),
+                                (infiniteTestGrammar, lambda g: LOTHypothesis(g, maxnodes=1000, persistent=True)),
+                                (idr_grammar, lambda g: IDRHypothesis(g, maxnodes=1000))]:
+            h = make_h(grammar)
+            h.validate_prior = True # so each prior is also checked against a full recompute
+            h.compute_prior()
+            for _ in xrange(300):
+                p, fb = h.propose()
+                self.assertTrue(p.value_log_probability is not None) # computed from h's, not from scratch
+                self.assertAlmostEqual(p.compute_prior(), grammar.log_probability(p.value))
+                h = p
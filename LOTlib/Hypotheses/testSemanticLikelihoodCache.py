@@ -0,0 +1,33 @@
+import unittest
+from random import random
+
+from LOTlib.Hypotheses.Likelihoods.SemanticLikelihoodCache import SemanticLikelihoodCache, LikelihoodCache
+
+
+class SemanticLikelihoodCacheTest(unittest.TestCase):
+    def runTest(self):
+        print "# Testing SemanticLikelihoodCache"
+        from LOTlib.Examples.Number.Model import NumberExpression, make_data, grammar
+
+        class CachedNumberExpression(SemanticLikelihoodCache, NumberExpression):
+            likelihood_cache = LikelihoodCache(probes=3)
+
+        cache = CachedNumberExpression.likelihood_cache
+        for data in [make_data(100), list(make_data(100))]: # a Dataset, and a list, which starts the cache over
+            h = NumberExpression(grammar)
+            h.likelihood_temperature = 2.0
+            for _ in xrange(300):
+                h, _ = h.propose()
+                c = CachedNumberExpression(grammar)
+                c.set_value(h.value)
+                c.likelihood_temperature = 2.0
+
+                self.assertAlmostEqual(c.compute_likelihood(data), h.compute_likelihood(data))
+
+                shortcut = h.likelihood + (random()-0.5)*10
+                self.assertAlmostEqual(c.compute_likelihood(data, shortcut=shortcut),
+                                       h.compute_likelihood(data, shortcut=shortcut))
+            self.assertTrue(cache.data is data)
+
+        # most of the proposals compute a function we have seen before
+        self.assertTrue(cache.hits > cache.misses > 0)
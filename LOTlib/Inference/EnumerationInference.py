@@ -1,20 +1,35 @@
 """
     A simple class to do inference via enumeration
+
+    With by_probability=True, we go through the trees in order of decreasing prior (Grammar.enumerate_by_probability),
+    so the most plausible hypotheses are scored first, down to min_lp. Otherwise we go by depth.
+
+    coverage is the prior probability of the trees we have gone through so far, which could be compared to
+    Grammar.prior_mass to see how far we are through a depth.
 """
+from math import exp
 
 from LOTlib.Miscellaneous import Infinity, self_update
 
 class EnumerationInference(object):
     
-    def __init__(self, grammar, make_h, data, steps=Infinity):
+    def __init__(self, grammar, make_h, data, steps=Infinity, by_probability=False, min_lp=-Infinity):
         self_update(self, locals())
-        
+        self.coverage = 0.0
+
+    def trees(self):
+        if self.by_probability:
+            return self.grammar.enumerate_by_probability(min_lp=self.min_lp, max_count=self.steps)
+        else:
+            return self.grammar.enumerate()
+
     def __iter__(self):
-        for i, t in enumerate(self.grammar.enumerate()):
+        for i, t in enumerate(self.trees()):
 
             if i >= self.steps:
                 raise StopIteration
 
+            self.coverage += exp(self.grammar.log_probability(t))
             h = self.make_h(value=t)
             h.compute_posterior(self.data)
             yield h
@@ -35,8 +50,10 @@ if __name__ == "__main__":
 
     #from LOTlib.Examples.RationalRules.Shared import grammar, data, make_h0
 
-    for h in break_ctrlc(EnumerationInference(grammar, make_hypothesis, make_data(), steps=10000)):
+    inference = EnumerationInference(grammar, make_hypothesis, make_data(), steps=10000)
+    for h in break_ctrlc(inference):
         print h.posterior_score, h
+    print "# Enumerated %.2f%% of the prior" % (100*inference.coverage)
     
                 
                 
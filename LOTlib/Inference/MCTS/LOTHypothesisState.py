@@ -39,8 +39,7 @@ class LOTHypothesisState(MaxScoreState):
         ## For each nonterminal, find out how much (in the prior) we pay for a hole that size
         hole_penalty = dict()
         dct = defaultdict(list) # make a lit of the log_probabilities below
-        for _ in xrange(1000): # generate this many trees
-            t = grammar.generate()
+        for t in grammar.generate_batch(1000): # generate this many trees
             for fn in t:
                 dct[fn.returntype].append(grammar.log_probability(fn))
         hole_penalty = { nt : sum(dct[nt]) / len(dct[nt]) for nt in dct }
@@ -143,6 +142,7 @@ class LOTHypothesisState(MaxScoreState):
 
             for r in rules:
                 fn.args[argi] = r.make_FunctionNodeStub(self.grammar, fn)
+                fn.invalidate_cache()
 
                 # copy the type in self.value
                 newh = self.value.__copy__(value=None)
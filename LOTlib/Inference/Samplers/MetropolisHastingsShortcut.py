@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+from LOTlib.DataAndObjects import Dataset
+from LOTlib.Hypotheses.AdaptiveDataOrder import AdaptiveDataOrder
 from LOTlib.Miscellaneous import q, qq, Infinity
 from LOTlib.Inference.Samplers.MetropolisHastings import MHSampler, MH_acceptance
 
@@ -9,8 +11,37 @@ from random import random
 class MHSamplerShortcut(MHSampler):
     """A version of MHSampler that uses shortcut evaluation
 
+    Lists and Datasets of data are wrapped in an AdaptiveDataOrder, which (if adaptive_order) learns which data
+    reject proposals soonest and evaluates those first. Data that compute likelihoods their own way (e.g. a
+    DataPrefix, see LikelihoodStore) are used as they are. mean_data_per_rejection() says how many data we
+    evaluated, on average, for the proposals we rejected. Rejections whose likelihood did not go through an
+    AdaptiveDataOrder (a prior of -inf, data used as they are, or a hypothesis that overrides compute_likelihood,
+    e.g. to memoize it) are counted in unmeasured_rejection_count instead.
     """
 
+    def __init__(self, current_sample, data, adaptive_order=True, reorder_every=100, **kwargs):
+        if isinstance(data, Dataset) or not hasattr(data, 'compute_likelihood'):
+            data = AdaptiveDataOrder(data, adaptive=adaptive_order, reorder_every=reorder_every)
+        MHSampler.__init__(self, current_sample, data, **kwargs)
+
+    def reset_counters(self):
+        MHSampler.reset_counters(self)
+        self.rejection_count = 0
+        self.unmeasured_rejection_count = 0
+        self.rejected_data_evaluated = 0
+
+    def mean_data_per_rejection(self):
+        """
+        Returns the mean number of data whose likelihood we evaluated for each rejected proposal whose likelihood
+        went through the data.
+
+        """
+        measured = self.rejection_count - self.unmeasured_rejection_count
+        if measured > 0:
+            return float(self.rejected_data_evaluated) / float(measured)
+        else:
+            return float("nan")
+
     def next(self):
         """Generate another sample."""
         if self.samples_yielded >= self.steps:
@@ -28,6 +59,7 @@ class MHSamplerShortcut(MHSampler):
                 # to speed things along
                 # Note that this requires passing the same p to MH_acceptance, since it determines the cutoff
                 p = random() # the random number
+                self.proposal.compute_prior() # the proposal's prior, not the one copied from the current sample
                 ll_cutoff = (log(p)*self.acceptance_temperature + \
                             -self.proposal.prior/self.prior_temperature + \
                             self.current_sample.prior/self.prior_temperature + \
@@ -35,6 +67,8 @@ class MHSamplerShortcut(MHSampler):
                             fb) * self.likelihood_temperature
 
                 # Call myself so memoized subclasses can override
+                if hasattr(self.data, 'last_evaluated'):
+                    self.data.last_evaluated = None # stays None if the likelihood doesn't go through self.data
                 self.compute_posterior(self.proposal, self.data, shortcut=ll_cutoff)
 
                 # Note: It is important that we re-compute from the temperature since these may be altered
@@ -56,6 +90,11 @@ class MHSamplerShortcut(MHSampler):
                     self.acceptance_count += 1
                 else:
                     self.was_accepted = False
+                    self.rejection_count += 1
+                    if getattr(self.data, 'last_evaluated', None) is None:
+                        self.unmeasured_rejection_count += 1
+                    else:
+                        self.rejected_data_evaluated += self.data.last_evaluated
 
                 self.proposal_count += 1
 
@@ -73,5 +112,6 @@ if __name__ == "__main__":
     sampler = MHSamplerShortcut(h0, data, steps=100000)
     for h in break_ctrlc(sampler):
         print h.posterior_score, h.prior, h.likelihood, h.compute_likelihood(data), h
+    print "# Mean data evaluated per rejection:", sampler.mean_data_per_rejection()
 
 
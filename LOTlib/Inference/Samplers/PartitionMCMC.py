@@ -10,6 +10,7 @@
 from copy import copy
 
 from LOTlib import break_ctrlc
+from LOTlib.Enumeration import TreeCounter
 from LOTlib.Miscellaneous import Infinity, infrange
 from LOTlib.Subtrees import trim_leaves
 from LOTlib.Miscellaneous import None2Empty, lambdaNone
@@ -17,12 +18,6 @@ from LOTlib.Miscellaneous import None2Empty, lambdaNone
 from MultipleChainMCMC import MultipleChainMCMC
 
 
-class BreakException(Exception):
-    """
-    Break out of multiple loops
-    """
-    pass
-
 class PartitionMCMC(MultipleChainMCMC):
     """
         Partition-based MCMC.
@@ -41,23 +36,17 @@ class PartitionMCMC(MultipleChainMCMC):
         :return:
         """
 
-        # first figure out the depth we can go to without exceeding max_N
-        partitions = []
-        try:
-            for d in infrange():
-                #print "# trying ", d
-                tmp = []
-                for i, t in enumerate(grammar.enumerate_at_depth(d, leaves=False)):
-                    tmp.append(t)
-                    if i > max_N:
-                        raise BreakException
-
-                # this gets set if we successfully exit the loop
-                # so it will store the last set that didn't exceed size max_N
-                partitions = tmp
-        except BreakException:
-            pass
-
+        # first figure out the depth we can go to without exceeding max_N, by counting the trees at each depth
+        counter = TreeCounter(grammar, leaves=False)
+        depth = None
+        for d in infrange():
+            n = counter.count(d)
+            if n == 0 or n > max_N+1: # no trees this deep, or too many
+                break
+            depth = d
+
+        assert depth is not None
+        partitions = list(grammar.enumerate_at_depth(depth, leaves=False))
         assert len(partitions) > 0
 
         # and store these so we can see them later
@@ -71,12 +60,13 @@ class PartitionMCMC(MultipleChainMCMC):
 
             for n in p.subnodes():
                 # set to not resample these
-                setattr(n, 'p_propose', 0.0) ## NOTE: Hypothesis proposals must be sensitive to resample_p for this to work!
+                n.annotate('p_propose', 0.0) ## NOTE: Hypothesis proposals must be sensitive to resample_p for this to work!
 
                 # and fill in the missing leaves with a random generation
                 for i, a in enumerate(n.args):
                     if grammar.is_nonterminal(a):
                         n.args[i] = grammar.generate(a)
+                n.invalidate_cache()
         print "# Initialized %s partitions" % len(partitions)
 
         # initialize each chain
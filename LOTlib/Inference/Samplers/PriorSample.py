@@ -8,12 +8,15 @@ class PriorSampler(object):
     """
     Just sample from the prior.
     (Only implemented for LOTHypothesis)
+
+    The trees are generated batch at a time, with Grammar.generate_batch.
     """
 
-    def __init__(self, h0, data, steps=Infinity):
+    def __init__(self, h0, data, steps=Infinity, batch=100):
         self_update(self, locals())
         assert isinstance(h0, LOTHypothesis) # only implemented for LOTHypothesis
         self.samples_yielded = 0
+        self.trees = []
 
     def __iter__(self):
         return self
@@ -23,7 +26,10 @@ class PriorSampler(object):
             raise StopIteration
         else:
             self.samples_yielded += 1
-            h = type(self.h0)(self.h0.grammar, start=self.h0.value.returntype)
+            if not self.trees:
+                self.trees = self.h0.grammar.generate_batch(min(self.batch, self.steps - self.samples_yielded + 1),
+                                                            nt=self.h0.value.returntype)
+            h = type(self.h0)(self.h0.grammar, value=self.trees.pop(), start=self.h0.value.returntype)
             h.compute_posterior(self.data)
 
             return h
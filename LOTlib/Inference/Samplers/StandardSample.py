@@ -1,6 +1,7 @@
 import LOTlib
 import pickle
 from LOTlib.FunctionNode import cleanFunctionNodeString
+from LOTlib.Hypotheses.LOTHypothesis import packed_values
 from LOTlib.TopN import TopN
 from LOTlib.Miscellaneous import qq
 from LOTlib import break_ctrlc
@@ -51,7 +52,7 @@ def standard_sample(make_hypothesis, make_data, show_skip=9, show=True, N=100, s
 
     if save_top is not None:
         print "# Saving top hypotheses"
-        with open(save_top, 'w') as f:
-            pickle.dump(best_hypotheses, f)
+        with open(save_top, 'wb') as f, packed_values():
+            pickle.dump(best_hypotheses, f, pickle.HIGHEST_PROTOCOL)
 
     return best_hypotheses
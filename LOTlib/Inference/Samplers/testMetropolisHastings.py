@@ -2,7 +2,7 @@
 
 import unittest
 from collections import Counter
-from numpy import log, exp
+from numpy import log, exp, isnan
 from scipy.stats import chisquare
 
 from LOTlib import break_ctrlc
@@ -18,6 +18,8 @@ class TestMetropolisHastings(unittest.TestCase):
     TODO: Add tree checks to samples from the sampler!
 
     """
+    persistent = False # whether the hypotheses use persistent (path-copying) proposals
+
     def runTest(self):
         NSAMPLES = 10000
 
@@ -36,7 +38,7 @@ class TestMetropolisHastings(unittest.TestCase):
 
         print "# Taking MHSampler for a test run"
         cnt = Counter()
-        h0 = MyH(grammar=grammar)
+        h0 = MyH(grammar=grammar, persistent=self.persistent)
         for h in break_ctrlc(MHSampler(h0, [], steps=NSAMPLES, skip=10)): # huh the skip here seems to be important
             cnt[h] += 1
         trees = list(cnt.keys())
@@ -71,6 +73,62 @@ class TestMetropolisHastings(unittest.TestCase):
         self.assertGreater(pv, 0.01, msg="Sampler failed chi squared!")
 
 
+class TestPersistentMetropolisHastings(TestMetropolisHastings):
+    """
+    The same test, with proposals that share subtrees with the current sample
+    """
+    persistent = True
+
+
+class TestMHSamplerShortcut(unittest.TestCase):
+    """
+    Adaptive data ordering must not change the samples (the Number model's log likelihoods are never positive,
+    so the shortcut rejects the same proposals in any order), only how much data they take to reject
+    """
+    def runTest(self):
+        import random
+        from LOTlib.Examples.Number.Model import make_data, make_hypothesis
+        from MetropolisHastingsShortcut import MHSamplerShortcut
+
+        print "# Testing MHSamplerShortcut with adaptive data order"
+        data = make_data(100)
+        samples, evaluated = [], []
+        for adaptive_order in [False, True]:
+            random.seed(1)
+            sampler = MHSamplerShortcut(make_hypothesis(), data, steps=500, adaptive_order=adaptive_order)
+            samples.append([h.value for h in sampler])
+            evaluated.append(sampler.mean_data_per_rejection())
+
+            h = sampler.current_sample
+            self.assertAlmostEqual(h.compute_likelihood(sampler.data), h.compute_likelihood(list(data)))
+
+        self.assertEqual(samples[0], samples[1])
+        self.assertLess(evaluated[1], evaluated[0])
+
+        # data that compute their own likelihoods are used as they are, so a DataPrefix uses the likelihood store
+        from LOTlib.Hypotheses.LikelihoodStore import DataPrefix, likelihood_store
+        likelihood_store.clear()
+        random.seed(1)
+        sampler = MHSamplerShortcut(make_hypothesis(), DataPrefix(data, len(data)), steps=500)
+        self.assertEqual([h.value for h in sampler], samples[0])
+        self.assertGreater(likelihood_store.misses, 0)
+        self.assertEqual(sampler.unmeasured_rejection_count, sampler.rejection_count)
+
+        # rejections whose likelihood doesn't go through the sampler's data aren't counted as evaluating none
+        h0 = make_hypothesis()
+        class MemoizedHypothesis(h0.__class__):
+            def compute_likelihood(self, data, **kwargs):
+                self.likelihood = h0.__class__.compute_likelihood(self, list(data), **kwargs)
+                return self.likelihood
+
+        sampler = MHSamplerShortcut(MemoizedHypothesis(h0.grammar), data, steps=100)
+        for h in sampler:
+            pass
+        self.assertGreater(sampler.rejection_count, 0)
+        self.assertEqual(sampler.unmeasured_rejection_count, sampler.rejection_count)
+        self.assertTrue(isnan(sampler.mean_data_per_rejection()))
+
+
 
 
 
@@ -121,8 +121,10 @@ def worker_process(outfile=None):
             if outfile is not None:
                 out.write(*r) # non-blocking write to a file if we want it
 
-            # send a message that we've finished
-            comm.send([i, r], dest=MASTER_PROCESS, tag=RUN_TAG)
+            # send a message that we've finished, with any LOTHypotheses in it packed (see Grammar.pack)
+            from LOTlib.Hypotheses.LOTHypothesis import packed_values
+            with packed_values():
+                comm.send([i, r], dest=MASTER_PROCESS, tag=RUN_TAG)
 
     if outfile is not None:
         out.close()
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+        Benchmark of copying trees from Examples.Number: tree copies per second, node copies per second, and the
+        memory used per node.
+"""
+import sys
+from copy import copy
+from optparse import OptionParser
+from time import time
+
+parser = OptionParser()
+parser.add_option("--trees", dest="TREES", type="int", default=1000, help="How many trees to copy")
+parser.add_option("--repetitions", dest="REPETITIONS", type="int", default=20, help="How many times to copy each")
+options, _ = parser.parse_args()
+
+
+def node_bytes(t):
+    """ Bytes used by the nodes of t (not counting the strings and rules they share with the grammar) """
+    total = 0
+    for n in t:
+        total += sys.getsizeof(n)
+        d = getattr(n, '__dict__', None)
+        if d is not None:
+            total += sys.getsizeof(d)
+        if n.args is not None:
+            total += sys.getsizeof(n.args)
+    return total
+
+
+if __name__ == "__main__":
+    from LOTlib.Examples.Number.Model import grammar
+
+    trees = [grammar.generate() for _ in xrange(options.TREES)]
+    nnodes = sum([t.count_nodes() for t in trees])
+
+    start = time()
+    for _ in xrange(options.REPETITIONS):
+        for t in trees:
+            copy(t)
+    elapsed = time() - start
+
+    print "# %s trees, %s nodes" % (len(trees), nnodes)
+    print "tree copies/s\t%.0f" % (options.REPETITIONS * len(trees) / elapsed)
+    print "node copies/s\t%.0f" % (options.REPETITIONS * nnodes / elapsed)
+    print "bytes/node\t%.1f" % (sum(map(node_bytes, trees)) / float(nnodes))
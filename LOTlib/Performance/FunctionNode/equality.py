@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+        Micro-benchmark of FunctionNode equality: the current structural equality (hash check, then a tree walk)
+        versus the old implementation, which compared fullstrings.
+
+        We time identical trees (the worst case for the new version, since it must walk the whole tree), trees
+        that differ by a single regeneration proposal, and least_common_difference on those pairs.
+"""
+from copy import copy
+from optparse import OptionParser
+from timeit import timeit
+
+from LOTlib.FunctionNode import fullstring
+from LOTlib.Hypotheses.Proposers import RegenerationProposer, ProposalFailedException
+from LOTlib.Subtrees import least_common_difference
+
+parser = OptionParser()
+parser.add_option("--trees", dest="TREES", type="int", default=100, help="How many trees of each size")
+parser.add_option("--sizes", dest="SIZES", type="str", default="10,30,100", help="Tree sizes (in nodes) to test")
+parser.add_option("--repetitions", dest="REPETITIONS", type="int", default=10, help="Repetitions of each timing")
+options, _ = parser.parse_args()
+
+
+def old_eq(x, y):
+    return fullstring(x) == fullstring(y)
+
+def old_least_common_difference(t1, t2):
+    """ least_common_difference, as it was computed with fullstring equality """
+    if old_eq(t1, t2):
+        return None, None
+    elif t1.get_rule_signature() == t2.get_rule_signature():
+        for a, b in zip(t1.argNonFunctionNodes(), t2.argNonFunctionNodes()):
+            if a != b:
+                return t1, t2
+        t1afn = list(t1.argFunctionNodes())
+        t2afn = list(t2.argFunctionNodes())
+        differing = [not old_eq(arg1, arg2) for arg1, arg2 in zip(t1afn, t2afn)]
+        if sum(differing) == 1:
+            idx = differing.index(True)
+            return old_least_common_difference(t1afn[idx], t2afn[idx])
+        else:
+            return t1, t2
+    return t1, t2
+
+
+def make_pairs(grammar, size, n):
+    """ Make n pairs of identical (but separately built) trees, and n pairs differing by a proposal """
+    proposer = RegenerationProposer()
+    same, different = [], []
+    while len(different) < n:
+        t = grammar.generate()
+        if not (size <= t.count_nodes() < 2*size):
+            continue
+        try:
+            t2 = proposer.propose_tree(grammar, t)
+        except ProposalFailedException:
+            continue
+        same.append((t, grammar.unpack_ascii(grammar.pack_ascii(t))))
+        different.append((t, t2))
+    return same, different
+
+
+def time_pairs(f, pairs):
+    return timeit(lambda: [f(x, y) for x, y in pairs], number=options.REPETITIONS) / (options.REPETITIONS*len(pairs))
+
+
+if __name__ == "__main__":
+    from LOTlib.DefaultGrammars import infiniteTestGrammar as grammar
+
+    print "size\tcomparison\told (us)\tnew (us)\tspeedup"
+    for size in map(int, options.SIZES.split(',')):
+        same, different = make_pairs(grammar, size, options.TREES)
+
+        for name, f_old, f_new, pairs in [('eq-same',    old_eq, lambda x, y: x == y, same),
+                                          ('eq-differ',  old_eq, lambda x, y: x == y, different),
+                                          ('lcd-differ', old_least_common_difference, least_common_difference, different)]:
+            # hash once first so that we time the steady state, where the proposer has left the hashes cached
+            for x, y in pairs:
+                hash(x), hash(y)
+
+            told, tnew = time_pairs(f_old, pairs), time_pairs(f_new, pairs)
+            print "%s\t%s\t%.2f\t%.2f\t%.1fx" % (size, name, told*1e6, tnew*1e6, told/tnew)
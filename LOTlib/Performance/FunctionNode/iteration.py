@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+        Benchmark of iterating over trees: count_subnodes and sample_subnode calls per second on random (bushy)
+        trees and on chains (as deep as possible), of 10, 100 and 1000 nodes.
+"""
+from optparse import OptionParser
+from random import randint
+from time import time
+
+from LOTlib.FunctionNode import FunctionNode
+
+parser = OptionParser()
+parser.add_option("--trees", dest="TREES", type="int", default=100, help="How many trees of each size")
+parser.add_option("--time", dest="TIME", type="float", default=1.0, help="Seconds to spend on each measurement")
+options, _ = parser.parse_args()
+
+
+def random_tree(n, parent=None):
+    """ A random tree of plus_, neg_, and x with n nodes """
+    if n == 1:
+        return FunctionNode(parent, 'E', 'x', None)
+
+    t = FunctionNode(parent, 'E', 'neg_' if n == 2 else 'plus_', [])
+    if n == 2:
+        t.args = [random_tree(1, t)]
+    else:
+        k = randint(1, n-2)
+        t.args = [random_tree(k, t), random_tree(n-1-k, t)]
+    return t
+
+
+def chain(n):
+    """ neg_(neg_(...(x))) with n nodes """
+    t = FunctionNode(None, 'E', 'x', None)
+    for _ in xrange(n-1):
+        t = FunctionNode(None, 'E', 'neg_', [t])
+        t.args[0].parent = t
+    return t
+
+
+def rate(f, trees):
+    """ f(t) calls per second """
+    start, n = time(), 0
+    while time() - start < options.TIME:
+        for t in trees:
+            f(t)
+        n += len(trees)
+    return n / (time() - start)
+
+
+if __name__ == "__main__":
+    print "shape\tnodes\tcount_subnodes/s\tsample_subnode/s"
+    for n in [10, 100, 1000]:
+        for shape, make in [('random', random_tree), ('chain', chain)]:
+            trees = [make(n) for _ in xrange(options.TREES)]
+            print "%s\t%s\t%.0f\t%.0f" % (shape, n, rate(lambda t: t.count_subnodes(), trees),
+                                          rate(lambda t: t.sample_subnode(), trees))
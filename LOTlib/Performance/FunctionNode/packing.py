@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+        Benchmark of saving trees from Examples.Number: pack_ascii, the binary Grammar.pack, and pickling the
+        FunctionNodes. Reports trees per second each way and the average bytes per tree, and the same for pickling
+        whole LOTHypotheses, as is and inside packed_values() (which pickles their values with Grammar.pack).
+"""
+import pickle
+from optparse import OptionParser
+from time import time
+
+parser = OptionParser()
+parser.add_option("--trees", dest="TREES", type="int", default=1000, help="How many trees")
+parser.add_option("--repetitions", dest="REPETITIONS", type="int", default=5, help="Repetitions of each timing")
+options, _ = parser.parse_args()
+
+
+def rate(f, xs):
+    """ f(x) calls per second """
+    start = time()
+    for _ in xrange(options.REPETITIONS):
+        for x in xs:
+            f(x)
+    return options.REPETITIONS * len(xs) / (time() - start)
+
+
+def dumps(x):
+    return pickle.dumps(x, pickle.HIGHEST_PROTOCOL)
+
+
+def packed_dumps(x):
+    from LOTlib.Hypotheses.LOTHypothesis import packed_values
+    with packed_values():
+        return pickle.dumps(x, pickle.HIGHEST_PROTOCOL)
+
+
+if __name__ == "__main__":
+    from LOTlib.Examples.Number.Model import grammar, make_hypothesis
+
+    trees = [grammar.generate() for _ in xrange(options.TREES)]
+    hypotheses = [make_hypothesis(value=t) for t in trees]
+
+    print "format\tpack/s\tunpack/s\tbytes"
+    for name, pack, unpack, xs in [('pack_ascii', grammar.pack_ascii, grammar.unpack_ascii, trees),
+                                   ('pack', grammar.pack, grammar.unpack, trees),
+                                   ('pickle FunctionNode', dumps, pickle.loads, trees),
+                                   ('pickle LOTHypothesis', dumps, pickle.loads, hypotheses),
+                                   ('pickle LOTHypothesis, packed', packed_dumps, pickle.loads, hypotheses)]:
+        packed = map(pack, xs)
+        print "%s\t%.0f\t%.0f\t%.1f" % (name, rate(pack, xs), rate(unpack, packed),
+                                        float(sum(map(len, packed))) / len(packed))
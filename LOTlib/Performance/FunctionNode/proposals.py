@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+        Benchmark of regeneration proposals on trees of different sizes from Examples.Number, with and without
+        persistent (path-copying) proposals. Reports how many new trees per second each can make from a given node
+        (the copying part of a proposal), proposals (propose_tree) per second, and full proposals (including the
+        forward-backward probability) per second.
+"""
+from copy import copy
+from optparse import OptionParser
+from time import time
+
+from LOTlib.Hypotheses.Proposers import RegenerationProposer, PersistentRegenerationProposer, ProposalFailedException
+
+parser = OptionParser()
+parser.add_option("--trees", dest="TREES", type="int", default=100, help="How many trees of each size")
+parser.add_option("--repetitions", dest="REPETITIONS", type="int", default=10, help="How many proposals from each")
+options, _ = parser.parse_args()
+
+
+def trees_of_size(grammar, lo, hi, n):
+    """ n trees with between lo and hi nodes """
+    trees = []
+    while len(trees) < n:
+        t = grammar.generate()
+        if lo <= t.count_nodes() <= hi:
+            trees.append(t)
+    return trees
+
+
+def rate(f, trees):
+    """ f(t) calls per second """
+    start = time()
+    for _ in xrange(options.REPETITIONS):
+        for t in trees:
+            try:
+                f(t)
+            except ProposalFailedException:
+                pass
+    return options.REPETITIONS * len(trees) / (time() - start)
+
+
+if __name__ == "__main__":
+    from LOTlib.Examples.Number.Model import grammar
+
+    print "size\tproposer\tcopies/s\tpropose_tree/s\tproposal_content/s"
+    for lo, hi in [(5, 15), (30, 60), (100, 150)]:
+        trees = trees_of_size(grammar, lo, hi, options.TREES)
+        nodes = dict([(id(t), t.sample_subnode()[0]) for t in trees])
+
+        for proposer, f in [(RegenerationProposer(), copy),
+                            (PersistentRegenerationProposer(), lambda t: t.path_copy(nodes[id(t)], copy(nodes[id(t)])))]:
+            print "%s-%s\t%s\t%.0f\t%.0f\t%.0f" % (lo, hi, type(proposer).__name__, rate(f, trees),
+                                                  rate(lambda t: proposer.propose_tree(grammar, t), trees),
+                                                  rate(lambda t: proposer.proposal_content(grammar, t), trees))
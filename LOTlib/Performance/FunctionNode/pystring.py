@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""
+        Benchmark of turning trees from Examples.Number into python functions: pystring calls per second, and
+        pystring + eval (what LOTHypothesis.compile_function does on a cache miss) per second.
+"""
+from optparse import OptionParser
+from time import time
+
+from LOTlib.FunctionNode import pystring
+
+parser = OptionParser()
+parser.add_option("--trees", dest="TREES", type="int", default=1000, help="How many trees")
+parser.add_option("--repetitions", dest="REPETITIONS", type="int", default=10, help="How many times to do each")
+options, _ = parser.parse_args()
+
+
+def rate(f, trees):
+    """ f(t) calls per second """
+    start = time()
+    for _ in xrange(options.REPETITIONS):
+        for t in trees:
+            f(t)
+    return options.REPETITIONS * len(trees) / (time() - start)
+
+
+if __name__ == "__main__":
+    from LOTlib.Examples.Number.Model import grammar
+
+    trees = [grammar.generate() for _ in xrange(options.TREES)]
+
+    print "# %s trees, %s nodes" % (len(trees), sum([t.count_nodes() for t in trees]))
+    print "pystring/s\t%.0f" % rate(pystring, trees)
+    print "eval/s\t%.0f" % rate(lambda t: eval('lambda x: %s' % pystring(t)), trees)
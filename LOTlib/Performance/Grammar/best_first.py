@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""
+        Benchmark of Grammar.enumerate_by_probability: seconds to get the N most probable trees of the Number model's
+        grammar and of a grammar with lambdas, and the lowest log probability among them, for N of 10, 100, 1000...
+"""
+from optparse import OptionParser
+from time import time
+
+parser = OptionParser()
+parser.add_option("--max-count", dest="MAX_COUNT", type="int", default=10000, help="The largest N to time")
+options, _ = parser.parse_args()
+
+
+if __name__ == "__main__":
+    from LOTlib.DefaultGrammars import infiniteTestGrammar
+    from LOTlib.Examples.Number.Model import grammar
+
+    print "grammar\tN\tseconds\tlowest lp"
+    for name, g in [('Number', grammar), ('lambdas', infiniteTestGrammar)]:
+        n = 10
+        while n <= options.MAX_COUNT:
+            start = time()
+            trees = list(g.enumerate_by_probability(max_count=n))
+            elapsed = time() - start
+            print "%s\t%s\t%.3f\t%.2f" % (name, n, elapsed, g.log_probability(trees[-1]))
+            n *= 10
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+        Benchmark of Grammar.enumerate: for each depth, how many trees there are, and trees per second, on the Number
+        model's grammar and on a grammar with lambdas, as FunctionNodes and as CompactTrees. One Enumerator is used
+        for all the depths, as Grammar.enumerate does, so the subtrees from each depth are reused in the next.
+        For comparison, it also prints how many trees TreeCounter says there are, its prior mass, and the seconds
+        counting them took.
+"""
+from optparse import OptionParser
+from time import time
+
+from LOTlib.Enumeration import Enumerator, TreeCounter
+
+parser = OptionParser()
+parser.add_option("--depth", dest="DEPTH", type="int", default=3, help="Enumerate up to this depth")
+parser.add_option("--max-trees", dest="MAX_TREES", type="int", default=1000000, help="Stop each depth after this many trees")
+options, _ = parser.parse_args()
+
+
+if __name__ == "__main__":
+    from LOTlib.DefaultGrammars import infiniteTestGrammar
+    from LOTlib.Examples.Number.Model import grammar
+
+    print "grammar\tdepth\tcounted\tprior mass\tseconds"
+    for name, g in [('Number', grammar), ('lambdas', infiniteTestGrammar)]:
+        counter = TreeCounter(g)
+        for d in xrange(options.DEPTH+1):
+            start = time()
+            n, m = counter.count(d), counter.mass(d)
+            print "%s\t%s\t%s\t%.4f\t%.4f" % (name, d, n, m, time()-start)
+
+    print "grammar\tcompact\tdepth\ttrees\ttrees/s"
+    for name, g in [('Number', grammar), ('lambdas', infiniteTestGrammar)]:
+        for compact in [False, True]:
+            enumerator = Enumerator(g, compact=compact)
+            for d in xrange(options.DEPTH+1):
+                start, n = time(), 0
+                for _ in enumerator.enumerate_at_depth(d):
+                    n += 1
+                    if n >= options.MAX_TREES:
+                        break
+                print "%s\t%s\t%s\t%s\t%.0f" % (name, compact, d, n, n/(time()-start))
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+        Benchmark of Grammar.freeze, against the Grammar itself, on the Number model's grammar, on the same grammar
+        with many more words, and on a grammar with lambdas: the pickled size, pickles and unpickles per second (as
+        when sending the grammar to worker processes), and trees per second for generate and log_probability.
+"""
+import pickle
+from copy import deepcopy
+from optparse import OptionParser
+from time import time
+
+from LOTlib.Miscellaneous import q
+
+parser = OptionParser()
+parser.add_option("--trees", dest="TREES", type="int", default=1000, help="How many trees")
+parser.add_option("--words", dest="WORDS", type="int", default=500, help="How many words to add to the big grammar")
+parser.add_option("--repetitions", dest="REPETITIONS", type="int", default=5, help="Repetitions of each timing")
+options, _ = parser.parse_args()
+
+
+def rate(f, xs):
+    """ f(x) calls per second """
+    start = time()
+    for _ in xrange(options.REPETITIONS):
+        for x in xs:
+            f(x)
+    return options.REPETITIONS * len(xs) / (time() - start)
+
+
+def dumps(x):
+    return pickle.dumps(x, pickle.HIGHEST_PROTOCOL)
+
+
+if __name__ == "__main__":
+    from LOTlib.DefaultGrammars import infiniteTestGrammar
+    from LOTlib.Examples.Number.Model import grammar
+
+    biggrammar = deepcopy(grammar)
+    for i in xrange(options.WORDS):
+        biggrammar.add_rule('WORD', q('word%s' % i), None, 10.0/options.WORDS)
+
+    print "grammar\tkind\tbytes\tdumps/s\tloads/s\tgenerate/s\tlog_probability/s"
+    for name, g in [('Number', grammar), ('Number+words', biggrammar), ('lambdas', infiniteTestGrammar)]:
+        trees = [g.generate() for _ in xrange(options.TREES)]
+        for kind, x in [('Grammar', g), ('FrozenGrammar', g.freeze())]:
+            s = dumps(x)
+            print "%s\t%s\t%s\t%.0f\t%.0f\t%.0f\t%.0f" % (name, kind, len(s), rate(dumps, [x]), rate(pickle.loads, [s]),
+                                                      rate(lambda _: x.generate(), trees),
+                                                      rate(x.log_probability, trees))
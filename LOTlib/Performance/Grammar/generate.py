@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+        Benchmark of Grammar.generate: trees per second on the Number model's grammar, on the same grammar with many
+        more words, and on a grammar with lambdas, where bound variable rules come and go. Also trees per second
+        from Grammar.generate_batch, in batches of --batch.
+"""
+from copy import deepcopy
+from optparse import OptionParser
+from time import time
+
+from LOTlib.Miscellaneous import q
+
+parser = OptionParser()
+parser.add_option("--trees", dest="TREES", type="int", default=5000, help="How many trees to time")
+parser.add_option("--batch", dest="BATCH", type="int", default=1000, help="Trees per generate_batch")
+parser.add_option("--words", dest="WORDS", type="int", default=500, help="How many words to add to the big grammar")
+options, _ = parser.parse_args()
+
+
+if __name__ == "__main__":
+    from LOTlib.DefaultGrammars import infiniteTestGrammar
+    from LOTlib.Examples.Number.Model import grammar
+
+    biggrammar = deepcopy(grammar)
+    for i in xrange(options.WORDS):
+        biggrammar.add_rule('WORD', q('word%s' % i), None, 10.0/options.WORDS)
+
+    print "grammar\trules\tnodes/tree\tgenerate/s\tgenerate_batch/s"
+    for name, g in [('Number', grammar), ('Number+words', biggrammar), ('lambdas', infiniteTestGrammar)]:
+        start = time()
+        nodes = sum([g.generate().count_nodes() for _ in xrange(options.TREES)])
+        rate = options.TREES/(time()-start)
+
+        start = time()
+        for _ in xrange(options.TREES / options.BATCH):
+            g.generate_batch(options.BATCH)
+        batch_rate = (options.TREES / options.BATCH) * options.BATCH / (time()-start)
+
+        print "%s\t%s\t%.1f\t%.0f\t%.0f" % (name, g.nrules(), float(nodes)/options.TREES, rate, batch_rate)
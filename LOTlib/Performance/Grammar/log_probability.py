@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+        Benchmark of Grammar.log_probability (the PCFG prior): trees per second on the Number model's grammar, on
+        the same grammar with many more words (as in grammars with a rule per word), and on a grammar with lambdas,
+        where bound variable rules come and go.
+"""
+from copy import deepcopy
+from optparse import OptionParser
+from time import time
+
+from LOTlib.Miscellaneous import q
+
+parser = OptionParser()
+parser.add_option("--trees", dest="TREES", type="int", default=1000, help="How many trees")
+parser.add_option("--words", dest="WORDS", type="int", default=500, help="How many words to add to the big grammar")
+parser.add_option("--repetitions", dest="REPETITIONS", type="int", default=5, help="Repetitions of each timing")
+options, _ = parser.parse_args()
+
+
+def rate(f, xs):
+    """ f(x) calls per second """
+    start = time()
+    for _ in xrange(options.REPETITIONS):
+        for x in xs:
+            f(x)
+    return options.REPETITIONS * len(xs) / (time() - start)
+
+
+if __name__ == "__main__":
+    from LOTlib.DefaultGrammars import infiniteTestGrammar
+    from LOTlib.Examples.Number.Model import grammar
+
+    biggrammar = deepcopy(grammar)
+    for i in xrange(options.WORDS):
+        biggrammar.add_rule('WORD', q('word%s' % i), None, 10.0/options.WORDS)
+
+    print "grammar\trules\tnodes/tree\tlog_probability/s"
+    for name, g in [('Number', grammar), ('Number+words', biggrammar), ('lambdas', infiniteTestGrammar)]:
+        trees = [g.generate() for _ in xrange(options.TREES)]
+        print "%s\t%s\t%.1f\t%.0f" % (name, g.nrules(), sum([t.count_nodes() for t in trees]) / float(len(trees)),
+                                      rate(g.log_probability, trees))
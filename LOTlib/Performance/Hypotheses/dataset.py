@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+        Benchmark of compute_likelihood on a Dataset, against the same data as a list, for Examples.Number and
+        Examples.SymbolicRegression: likelihoods per second, with and without a shortcut, and how many rows the
+        Dataset keeps.
+"""
+from optparse import OptionParser
+from time import time
+
+from LOTlib.Miscellaneous import Infinity
+
+parser = OptionParser()
+parser.add_option("--hypotheses", dest="HYPOTHESES", type="int", default=500, help="How many hypotheses to time")
+parser.add_option("--data", dest="DATA", type="int", default=300, help="How many data points for Number")
+parser.add_option("--copies", dest="COPIES", type="int", default=50, help="How many copies of SymbolicRegression's data")
+options, _ = parser.parse_args()
+
+
+if __name__ == "__main__":
+    from LOTlib.Examples.Number import Model as Number
+    from LOTlib.Examples.SymbolicRegression import Model as SymbolicRegression
+
+    print "model\tdata\trows\tshortcut\tlist/s\tDataset/s"
+    for name, data, make_hypothesis in [('Number', Number.make_data(options.DATA), Number.make_hypothesis),
+                                        ('SymbolicRegression', SymbolicRegression.make_data(options.COPIES),
+                                         SymbolicRegression.make_hypothesis)]:
+        hypotheses = [make_hypothesis(maxnodes=1000) for _ in xrange(options.HYPOTHESES)]
+        for shortcut in [-Infinity, -100.0]:
+            rates = []
+            for d in [list(data), data]:
+                start = time()
+                for h in hypotheses:
+                    h.compute_likelihood(d, shortcut=shortcut)
+                rates.append(options.HYPOTHESES / (time()-start))
+            print "%s\t%s\t%s\t%s\t%.0f\t%.0f" % (name, len(data), len(data.rows), shortcut, rates[0], rates[1])
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""
+        Benchmark of the compiled function cache (Hypotheses.FunctionCache) on MCMC for Examples.Number: steps per
+        second with and without the cache, and how often it hits.
+"""
+from optparse import OptionParser
+from time import time
+
+parser = OptionParser()
+parser.add_option("--steps", dest="STEPS", type="int", default=5000, help="How many MCMC steps")
+parser.add_option("--data", dest="DATA", type="int", default=100, help="How many data points")
+parser.add_option("--cachesize", dest="CACHESIZE", type="int", default=10000, help="Size of the cache")
+options, _ = parser.parse_args()
+
+
+if __name__ == "__main__":
+    from LOTlib.Examples.Number.Model import make_hypothesis, make_data
+    from LOTlib.Hypotheses.FunctionCache import function_cache
+    from LOTlib.Inference.Samplers.MetropolisHastings import MHSampler
+
+    data = make_data(options.DATA)
+
+    for size in [0, options.CACHESIZE]:
+        function_cache.clear()
+        function_cache.resize(size)
+
+        start = time()
+        for h in MHSampler(make_hypothesis(), data, steps=options.STEPS):
+            pass
+        elapsed = time() - start
+
+        print "cache size %s\tsteps/s %.0f\t%s" % (size, options.STEPS / elapsed, function_cache)
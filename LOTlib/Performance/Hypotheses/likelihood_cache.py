@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+        Benchmark of the semantic likelihood cache (Hypotheses.Likelihoods.SemanticLikelihoodCache) on MCMC for
+        Examples.Number: steps per second with and without the cache, and how often it hits.
+"""
+from optparse import OptionParser
+from time import time
+
+parser = OptionParser()
+parser.add_option("--steps", dest="STEPS", type="int", default=5000, help="How many MCMC steps")
+parser.add_option("--data", dest="DATA", type="int", default=300, help="How many data points")
+parser.add_option("--probes", dest="PROBES", type="int", default=10, help="How many inputs to fingerprint on")
+options, _ = parser.parse_args()
+
+
+if __name__ == "__main__":
+    from LOTlib.Examples.Number.Model import NumberExpression, make_data, grammar
+    from LOTlib.Hypotheses.Likelihoods.SemanticLikelihoodCache import SemanticLikelihoodCache, LikelihoodCache
+    from LOTlib.Inference.Samplers.MetropolisHastings import MHSampler
+
+    class CachedNumberExpression(SemanticLikelihoodCache, NumberExpression):
+        likelihood_cache = LikelihoodCache(probes=options.PROBES)
+
+    for name, data in [('Dataset', make_data(options.DATA)), ('list', list(make_data(options.DATA)))]:
+        for cls in [NumberExpression, CachedNumberExpression]:
+            CachedNumberExpression.likelihood_cache.clear()
+
+            start = time()
+            for h in MHSampler(cls(grammar), data, steps=options.STEPS):
+                pass
+            elapsed = time() - start
+
+            print "%s\t%s\tsteps/s %.0f\t%s" % (name, cls.__name__, options.STEPS / elapsed,
+                                                 getattr(cls, 'likelihood_cache', ''))
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""
+        Benchmark of the likelihood store (Hypotheses.LikelihoodStore) on a data amount sweep for Examples.Number,
+        as Examples/Search.py runs: seconds for MCMC on each prefix of one data set, on lists and on DataPrefixes.
+"""
+from optparse import OptionParser
+from time import time
+
+parser = OptionParser()
+parser.add_option("--steps", dest="STEPS", type="int", default=1000, help="How many MCMC steps for each data amount")
+parser.add_option("--dmax", dest="DATA_MAX", type="int", default=300, help="Max data to run")
+parser.add_option("--dstep", dest="DATA_STEP", type="int", default=50, help="Step size for varying data")
+options, _ = parser.parse_args()
+
+
+if __name__ == "__main__":
+    from LOTlib.Examples.Number.Model import make_hypothesis, make_data
+    from LOTlib.Hypotheses.LikelihoodStore import DataPrefix, likelihood_store
+    from LOTlib.Inference.Samplers.MetropolisHastings import MHSampler
+
+    data = list(make_data(options.DATA_MAX))
+
+    for name, make_prefix in [('list', lambda n: data[:n]), ('DataPrefix', lambda n: DataPrefix(data, n))]:
+        likelihood_store.clear()
+        start = time()
+        for n in xrange(0, options.DATA_MAX+1, options.DATA_STEP):
+            for h in MHSampler(make_hypothesis(), make_prefix(n), steps=options.STEPS):
+                pass
+        print "%s\tseconds %.2f\t%s" % (name, time()-start, likelihood_store)
@@ -24,11 +24,16 @@ class FormalLanguage(object):
     def sample_string(self):
         return str(self.grammar.generate())
 
+    def sample_strings(self, n):
+        """ n samples from sample_string. If that just generates from self.grammar, the trees are made together """
+        if self.sample_string.im_func is FormalLanguage.sample_string.im_func:
+            return map(str, self.grammar.generate_batch(n))
+        else:
+            return [self.sample_string() for _ in xrange(n)]
+
     def sample_data(self, n):
         # Sample a string of data
-        cnt = Counter()
-        for _ in xrange(n):
-            cnt[self.sample_string()] += 1
+        cnt = Counter(self.sample_strings(n))
 
         return [FunctionData(input=[], output=cnt, alpha=self.ALPHA)]
 
@@ -62,12 +62,13 @@ for p in partitions:
     print ">>", p
     for n in p.subnodes():
         # set to not resample these
-        setattr(n, 'p_propose', 0.0) ## NOTE: Hypothesis proposals must be sensitive to resample_p for this to work!
+        n.annotate('p_propose', 0.0) ## NOTE: Hypothesis proposals must be sensitive to resample_p for this to work!
 
         # and fill in the missing leaves with a random generation
         for i, a in enumerate(n.args):
             if grammar.is_nonterminal(a):
                 n.args[i] = grammar.generate(a)
+        n.invalidate_cache()
 print "# Initialized %s partitions" % len(partitions)
 
 
@@ -50,7 +50,7 @@ for t in grammar.enumerate(7):
 
     t = deepcopy(t) # just make sure it's a copy (may not be necessary)
     for n in t:
-        setattr(n, "p_propose", 0.0) # add a tree attribute saying we can't propose
+        n.annotate("p_propose", 0.0) # add a tree attribute saying we can't propose
     partitions.append(t)
 
 grammar.add_rule('STRING', '%s%s', ['TERMINAL', 'STRING'], 1.0)
@@ -1,21 +1,29 @@
 import pickle
 from SampleStream import SampleStream
+from LOTlib.Hypotheses.CompactHypothesis import compact_hypothesis
+from LOTlib.Hypotheses.LOTHypothesis import packed_values
 
 class Save(SampleStream):
-    def __init__(self, path='samples.pkl'):
+    """
+    Store all samples and pickle them to path on exit. With compact=True, the samples are stored (and saved) as
+    CompactHypotheses, which can be turned back into hypotheses with expand().
+    """
+    def __init__(self, path='samples.pkl', compact=False):
         SampleStream.__init__(self, generator=None)
 
         self.path = path
+        self.compact = compact
         self.samples = []
 
     def process(self, x):
-        self.samples.append(x)
+        self.samples.append(compact_hypothesis(x) if self.compact else x)
         return x
 
     def __exit__(self, t, value, traceback):
 
-        f = open(self.path, 'w')
-        pickle.dump(self.samples, f)
+        f = open(self.path, 'wb')
+        with packed_values():
+            pickle.dump(self.samples, f, pickle.HIGHEST_PROTOCOL) # binary, so packed values (see Grammar.pack) stay small
         f.close()
 
         SampleStream.__exit__(self, t, value, traceback)
\ No newline at end of file
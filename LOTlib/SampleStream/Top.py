@@ -9,17 +9,18 @@ class Top(SampleStream):
     exit since it won't know what the samples are!)
     """
 
-    def __init__(self, N=1000, key='posterior_score', sorted=True):
+    def __init__(self, N=1000, key='posterior_score', sorted=True, compact=False):
         """
 
         :param N: How many samples to store.
         :param key:  The key we sort by
         :param sorted: When we output, do we output sorted? (slightly slower)
+        :param compact: Store the samples as CompactHypotheses until we output them (see TopN)
         :return:
         """
         self.__dict__.update(locals())
         SampleStream.__init__(self)
-        self.top = TopN(N=N, key=key)
+        self.top = TopN(N=N, key=key, compact=compact)
 
     def process(self, x):
         """ Overwrite process so all outputs are NOT sent to children.
@@ -1,15 +1,21 @@
 
 from SampleStream import SampleStream
+from LOTlib.Hypotheses.CompactHypothesis import compact_hypothesis
 
 class Unique(SampleStream):
-    def __init__(self):
+    """
+    Only pass on samples we have not seen before. With compact=True, the seen samples are stored as CompactHypotheses.
+    """
+    def __init__(self, compact=False):
         SampleStream.__init__(self)
 
+        self.compact = compact
         self.seen = set()
 
     def process(self, x):
-        if x in self.seen:
+        y = compact_hypothesis(x) if self.compact else x
+        if y in self.seen:
             return None
         else:
-            self.seen.add(x)
+            self.seen.add(y)
             return x
\ No newline at end of file
@@ -12,8 +12,8 @@ def generate_trees(grammar, start='START', N=1000):
     """
             Yield a bunch of unique trees, produced from the grammar
     """
-    for _ in break_ctrlc(xrange(N)):
-        yield grammar.generate(start)
+    for t in break_ctrlc(grammar.generate_batch(N, nt=start)):
+        yield t
 
 
 @UniquifyFunction
@@ -21,8 +21,7 @@ def generate_unique_trees(grammar, start='START', N=1000):
     """
             Yield a bunch of unique trees, produced from the grammar
     """
-    for _ in break_ctrlc(xrange(N)):
-        t = grammar.generate(start)
+    for t in break_ctrlc(grammar.generate_batch(N, nt=start)):
         yield t
 
 @UniquifyFunction
@@ -50,26 +49,39 @@ def least_common_difference(t1,t2):
         For a pair of trees, find the nodes (one in each tree) defining
         the root of their differences. Return None for identical trees.
     """
+    path1, path2 = least_common_difference_paths(t1, t2)
+    if path1 is None:
+        return None, None
+    return path1[-1], path2[-1]
 
+def least_common_difference_paths(t1,t2):
+    """
+        Like least_common_difference, but return the lists of nodes going down from t1 and t2
+        to the roots of their differences. Return None for identical trees.
+
+        These paths are the real ancestors even when t1 and t2 share subtrees (see FunctionNode.path_copy),
+        where following parent refs up from the differing nodes may not be.
+    """
     if t1 == t2:
         return None, None
-    elif t1.get_rule_signature() == t2.get_rule_signature(): # if these rules look the same, counting terminals and nonterminal kids
+
+    path1, path2 = [t1], [t2]
+    while t1.get_rule_signature() == t2.get_rule_signature(): # if these rules look the same, counting terminals and nonterminal kids
 
         # first check if any strings (non functions nodes) below differ
-        for a,b in zip(t1.argNonFunctionNodes(), t2.argNonFunctionNodes()):
-            if a != b:
-                return t1,t2 # if so, t1 and t2 differ
-
-        # otherwise check the functionNodes
-        t1afn = list(t1.argFunctionNodes())
-        t2afn = list(t2.argFunctionNodes())
-        differing = [arg1 != arg2 for arg1,arg2 in zip(t1afn, t2afn)]
-        if sum(differing) == 1:
-            idx = differing.index(True)
-            return least_common_difference(t1afn[idx],t2afn[idx])
-        else:
-            return t1, t2
-    return t1,t2
+        if any(a != b for a,b in zip(t1.argNonFunctionNodes(), t2.argNonFunctionNodes())):
+            break # if so, t1 and t2 differ
+
+        # otherwise check the functionNodes, and go down if exactly one differs
+        differing = [(arg1,arg2) for arg1,arg2 in zip(t1.argFunctionNodes(), t2.argFunctionNodes()) if arg1 != arg2]
+        if len(differing) != 1:
+            break
+
+        t1, t2 = differing[0]
+        path1.append(t1)
+        path2.append(t2)
+
+    return path1, path2
 
 # # # # # # # # # # # # # # # # # # # # # # # # #
 # Quick helper functions for subtrees
@@ -122,6 +134,7 @@ def trim_leaves_(t):
     
     if isFunctionNode(t) and t.args is not None:
         t.args = [ x.returntype if (isFunctionNode(x) and x.is_terminal()) else trim_leaves_(x) for x in t.args]
+        t.invalidate_cache()
     return t
                 
 
@@ -2,6 +2,7 @@
 
 import heapq
 from LOTlib.Miscellaneous import Infinity
+from LOTlib.Hypotheses.CompactHypothesis import compact_hypothesis, expand_hypothesis
 
 class QueueItem(object):
     """
@@ -19,22 +20,28 @@ class TopN(object):
     """
             This class stores the top N (possibly infinite) hypotheses it observes, keeping only unique ones.
             It works by storing a priority queue (in the opposite order), and popping off the worst as we need to add more
+
+            If compact=True, hypotheses are stored as CompactHypotheses (saving a lot of memory) and are only
+            expanded back into hypotheses when we are asked for them.
     """
 
-    def __init__(self, N=Infinity, key='posterior_score'):
+    def __init__(self, N=Infinity, key='posterior_score', compact=False):
         assert N > 0, "*** TopN must have N>0"
         self.N = N
         self.key = key
+        self.compact = compact
 
         self.Q = [] # we use heapq to
         self.unique_set = set()
 
     def __contains__(self, y):
+        if self.compact:
+            y = compact_hypothesis(y)
         return (y in self.unique_set)
 
     def __iter__(self):
         for x in self.Q:
-            yield x.item
+            yield expand_hypothesis(x.item)
 
     def __len__(self):
         return len(self.Q)
@@ -45,6 +52,10 @@ class TopN(object):
         if p is None:
             p = getattr(x, self.key)
 
+        # Only make x compact if we would otherwise keep it
+        if self.compact and (len(self.Q) < self.N or p > self.Q[0].priority):
+            x = compact_hypothesis(x)
+
         # Add if we are too short or our priority is better than the *worst*
         # AND we aren't in the set
         if (len(self.Q) < self.N or p > self.Q[0].priority) \
@@ -65,9 +76,9 @@ class TopN(object):
     def get_all(self, **kwargs):
         """ Return all elements (arbitrary order). Does NOT return a copy. This uses kwargs so that we can call one 'sorted' """
         if kwargs.get('sorted', False):
-            return [ c.item for c in sorted(self.Q, reverse=kwargs.get('decreasing',False))]
+            return [ expand_hypothesis(c.item) for c in sorted(self.Q, reverse=kwargs.get('decreasing',False))]
         else:
-            return [ c.item for c in self.Q]
+            return [ expand_hypothesis(c.item) for c in self.Q]
 
     def update(self, y):
         for yi in y:
@@ -77,7 +88,7 @@ class TopN(object):
         v = heapq.heappop(self.Q).item
         self.unique_set.remove(v)
         self.N -= 1
-        return v
+        return expand_hypothesis(v)
 
     def best(self):
         return self.get_all(sorted=True)[-1]
@@ -0,0 +1,53 @@
+
+import unittest
+import pickle
+
+from LOTlib.DefaultGrammars import finiteTestGrammar, infiniteTestGrammar
+from LOTlib.FunctionNode import fullstring
+from LOTlib.Hypotheses.LOTHypothesis import LOTHypothesis
+from LOTlib.TopN import TopN
+
+
+class CompactTreeTest(unittest.TestCase):
+    def runTest(self):
+        print "# Testing CompactTree"
+        for grammar in [finiteTestGrammar, infiniteTestGrammar]:
+            for _ in xrange(2000):
+                t = grammar.generate()
+                ct = grammar.compact(t)
+                self.assertEqual(len(ct), t.count_nodes())
+
+                # Lossless, down to the bound variable names
+                t2 = ct.expand()
+                self.assertEqual(t, t2)
+                self.assertEqual(fullstring(t), fullstring(t2))
+                self.assertEqual(str(t), str(t2))
+                self.assertTrue(t2.check_parent_refs())
+
+                # Equality and hashing follow the trees
+                ct2 = grammar.compact(grammar.unpack_ascii(grammar.pack_ascii(t)))
+                self.assertEqual(ct, ct2)
+                self.assertEqual(hash(ct), hash(ct2))
+
+                # And survive pickling
+                ct3 = pickle.loads(pickle.dumps(ct))
+                self.assertEqual(t, ct3.expand())
+
+
+class CompactTopNTest(unittest.TestCase):
+    def runTest(self):
+        print "# Testing compact TopN"
+        top, compacttop = TopN(N=10), TopN(N=10, compact=True)
+        for _ in xrange(1000):
+            h = LOTHypothesis(grammar=finiteTestGrammar, display="lambda: %s")
+            h.compute_prior()
+            h.posterior_score = h.prior
+            top.add(h)
+            compacttop.add(h)
+
+        self.assertEqual(len(top), len(compacttop))
+        for a, b in zip(top.get_all(sorted=True), compacttop.get_all(sorted=True)):
+            self.assertEqual(a, b)
+            self.assertEqual(a.posterior_score, b.posterior_score)
+            self.assertTrue(callable(b.fvalue)) # b's function must be recompiled
+            self.assertTrue(b in compacttop)
@@ -0,0 +1,35 @@
+import unittest
+from random import random
+
+from LOTlib.DataAndObjects import FunctionData, Dataset
+from LOTlib.Miscellaneous import Infinity
+
+
+class DatasetTest(unittest.TestCase):
+    def runTest(self):
+        print "# Testing Dataset"
+        data = [FunctionData(input=[1], output=True, alpha=0.5), FunctionData(input=[2], output=True, alpha=0.5),
+                FunctionData(input=[1], output=False, alpha=0.5), FunctionData(input=[1.0], output=True, alpha=0.5),
+                FunctionData(input=[set([1, 2])], output=True, alpha=0.9)]*3
+        d = Dataset(data)
+        self.assertEqual(len(d), len(data))
+        self.assertEqual(len(d.rows), 5)
+        self.assertEqual(d.counts, [3]*5)
+        self.assertEqual(d.inputs[1], [2])
+        self.assertEqual(d.outputs[2], False)
+        self.assertEqual([x.input for x in d], [x.input for x in data])
+        self.assertEqual([x.output for x in d[2:7]], [x.output for x in data[2:7]])
+
+        # the likelihood is the same as for the list, with and without a shortcut
+        from LOTlib.Examples.Number.Model import make_data, make_hypothesis
+        data = make_data(300)
+        self.assertTrue(isinstance(data, Dataset) and len(data.rows) < len(data))
+        for _ in xrange(100):
+            h = make_hypothesis(likelihood_temperature=2.0)
+            ll = h.compute_likelihood(list(data))
+            self.assertAlmostEqual(h.compute_likelihood(data), ll)
+
+            shortcut = ll + (random()-0.5)*10
+            ll = h.compute_likelihood(list(data), shortcut=shortcut)
+            self.assertEqual(h.compute_likelihood(data, shortcut=shortcut), ll)
+            self.assertEqual(h.likelihood, ll)
@@ -0,0 +1,245 @@
+
+import unittest
+from copy import copy
+from itertools import islice
+from math import log
+from random import seed
+
+from LOTlib.FunctionNode import FunctionNode, fullstring
+from LOTlib.Grammar import Grammar
+from LOTlib.Miscellaneous import lambdaOne
+from LOTlib.DefaultGrammars import finiteTestGrammar, infiniteTestGrammar
+from LOTlib.Hypotheses.Proposers import RegenerationProposer, PersistentRegenerationProposer, InsertProposer, \
+    DeleteProposer, ProposalFailedException
+
+
+# nested lambdas, whose bound variables all have the same type
+lambdaTestGrammar = Grammar()
+lambdaTestGrammar.add_rule('START', '', ['EXPR'], 1.0)
+lambdaTestGrammar.add_rule('EXPR', 'plus_', ['EXPR', 'EXPR'], 0.3)
+lambdaTestGrammar.add_rule('EXPR', 'apply_', ['FUNC', 'EXPR'], 0.3)
+lambdaTestGrammar.add_rule('FUNC', 'lambda', ['EXPR'], 1.0, bv_type='EXPR', bv_p=1.0)
+lambdaTestGrammar.add_rule('EXPR', '1', None, 1.0)
+
+
+def uncached_hash(t):
+    """ Recompute the hash of t from scratch, ignoring any cached values """
+    for n in t:
+        n._hash = None
+    return hash(t)
+
+
+class HashTest(unittest.TestCase):
+    def runTest(self):
+        print "# Testing FunctionNode hashing"
+        for grammar in [finiteTestGrammar, infiniteTestGrammar, lambdaTestGrammar]:
+            for _ in xrange(1000):
+                t = grammar.generate()
+
+                # copies, and equal trees, must hash equally
+                t2 = copy(t)
+                self.assertEqual(hash(t), hash(t2))
+                self.assertEqual(hash(t), hash(grammar.unpack_ascii(grammar.pack_ascii(t))))
+
+                # hashing the tree caches the hash of every node, including nodes that use bound variables from
+                # above, and hashing a node on its own agrees with recomputing it
+                self.assertTrue(all([n._hash is not None for n in t]))
+                for n in t:
+                    self.assertEqual(hash(n), uncached_hash(copy(n)))
+
+        # trees that differ only in which bound variable they use hash differently
+        trees = [lambdaTestGrammar.generate() for _ in xrange(5000)]
+        self.assertEqual(len(set(map(hash, trees))), len(set(map(fullstring, trees))))
+
+
+class HashInvalidationTest(unittest.TestCase):
+    def runTest(self):
+        print "# Testing FunctionNode hash invalidation"
+        for grammar in [finiteTestGrammar, infiniteTestGrammar, lambdaTestGrammar]:
+            for proposer in [RegenerationProposer(), InsertProposer(), DeleteProposer()]:
+                for _ in xrange(1000):
+                    t = grammar.generate()
+                    hash(t) # fill in the caches
+                    try:
+                        t = proposer.propose_tree(grammar, t)
+                    except ProposalFailedException:
+                        continue
+                    self.assertEqual(hash(t), uncached_hash(copy(t)))
+
+
+def leaf_weight(n):
+    """ A resampleProbability that prefers leaves, unless a node is annotated with its own p_propose """
+    return getattr(n, 'p_propose', 3.0 if n.is_terminal() else 1.0)
+
+
+class SubtreeWeightTest(unittest.TestCase):
+    def runTest(self):
+        print "# Testing FunctionNode cached subtree sizes"
+        for grammar in [finiteTestGrammar, infiniteTestGrammar]:
+            for proposer in [RegenerationProposer(), PersistentRegenerationProposer(), InsertProposer(), DeleteProposer()]:
+                for _ in xrange(500):
+                    t = grammar.generate()
+                    t.count_nodes() # fill in the cache
+                    try:
+                        t = proposer.propose_tree(grammar, t)
+                    except ProposalFailedException:
+                        continue
+
+                    nodes = list(t)
+                    self.assertEqual(t.count_nodes(), len(nodes))
+                    self.assertEqual(len(t), len(nodes))
+                    self.assertAlmostEqual(t.subtree_weight(leaf_weight), sum(map(leaf_weight, nodes)))
+
+                    # weights may depend on annotations
+                    n = nodes[len(nodes)/2]
+                    n.annotate('p_propose', 10.0)
+                    self.assertAlmostEqual(t.subtree_weight(leaf_weight), sum(map(leaf_weight, nodes)))
+
+                    # going down the cached sizes picks the same node as going through the tree
+                    for f in [leaf_weight, lambdaOne]:
+                        seed(len(nodes))
+                        n, lp = t.sample_subnode(f)
+                        seed(len(nodes))
+                        n2, lp2 = t.sample_subnode(lambda x: f(x)) # not cached
+                        self.assertTrue(n is n2)
+                        self.assertAlmostEqual(lp, lp2)
+                        self.assertAlmostEqual(lp, t.sampling_log_probability(n, f))
+
+
+class EqualityTest(unittest.TestCase):
+    def runTest(self):
+        print "# Testing FunctionNode equality"
+        for grammar in [finiteTestGrammar, infiniteTestGrammar, lambdaTestGrammar]:
+            for _ in xrange(5000):
+                x, y = grammar.generate(), grammar.generate()
+
+                # equality must agree with comparing fullstrings
+                self.assertEqual(x == y, fullstring(x) == fullstring(y))
+                self.assertEqual(x != y, fullstring(x) != fullstring(y))
+
+                # unpacking gives new bound variable uuids, which should not matter
+                self.assertTrue(x == grammar.unpack_ascii(grammar.pack_ascii(x)))
+
+
+class AnnotationTest(unittest.TestCase):
+    def runTest(self):
+        print "# Testing FunctionNode annotations and pickling"
+        import pickle
+        for grammar in [finiteTestGrammar, infiniteTestGrammar]:
+            for _ in xrange(1000):
+                t = grammar.generate()
+                for n in t:
+                    n.annotate('p_propose', 0.5)
+
+                t2 = copy(t)
+                self.assertTrue(all(getattr(n, 'p_propose', 1.0) == 0.5 for n in t2))
+                self.assertFalse(hasattr(t2, 'resample_p'))
+
+                for protocol in [0, 2]:
+                    t3 = pickle.loads(pickle.dumps(t, protocol))
+                    self.assertEqual(t, t3)
+                    self.assertTrue(t3.check_parent_refs())
+                    self.assertTrue(all(n.p_propose == 0.5 for n in t3))
+
+
+class PathCopyTest(unittest.TestCase):
+    def runTest(self):
+        print "# Testing FunctionNode path copying"
+        import pickle
+        proposer = PersistentRegenerationProposer()
+        for grammar in [finiteTestGrammar, infiniteTestGrammar]:
+            for _ in xrange(100):
+                t = grammar.generate()
+
+                # take a chain of proposals, so that later trees share subtrees with several earlier ones
+                for _ in xrange(5):
+                    s, h = fullstring(t), hash(t)
+                    try:
+                        t2 = proposer.propose_tree(grammar, t)
+                    except ProposalFailedException:
+                        continue
+
+                    # t is unchanged
+                    self.assertEqual(fullstring(t), s)
+                    self.assertEqual(hash(t), h)
+
+                    # t2 is a tree like any other
+                    t3 = copy(t2)
+                    self.assertTrue(t3.check_parent_refs())
+                    self.assertEqual(t2, t3)
+                    self.assertEqual(hash(t2), uncached_hash(t3))
+                    self.assertTrue(pickle.loads(pickle.dumps(t2)).check_parent_refs())
+
+                    # only the path down to the replaced node is new
+                    n = t2.sample_subnode()[0]
+                    path = t2.path_to(n)
+                    self.assertTrue(path[0] is t2 and path[-1] is n)
+                    t4 = t2.path_copy(n, copy(n))
+                    self.assertEqual(t4, t2)
+                    self.assertEqual(len([x for x in t4 if not any(x is y for y in t2)]), len(path)-1 + len(list(n)))
+
+                    # and has the same proposal probabilities as if it were a full copy
+                    self.assertAlmostEqual(proposer.compute_fb(grammar, t, t2), proposer.compute_fb(grammar, copy(t), t3))
+
+                    t = t2
+
+
+def recursive_iter(t, d=0):
+    """ What FunctionNode.iterdepth should give """
+    yield t, d
+    for a in t.argFunctionNodes():
+        for x in recursive_iter(a, d+1):
+            yield x
+
+
+def recursive_leaves(t):
+    """ What FunctionNode.all_leaves should give """
+    for a in t.args or []:
+        if isinstance(a, FunctionNode):
+            for x in recursive_leaves(a):
+                yield x
+        else:
+            yield a
+
+
+class IterationTest(unittest.TestCase):
+    def runTest(self):
+        print "# Testing FunctionNode iteration"
+        for grammar in [finiteTestGrammar, infiniteTestGrammar]:
+            rules = dict([(nt, list(grammar.get_rules(nt))) for nt in grammar.nonterminals()])
+            for _ in xrange(1000):
+                t = grammar.generate()
+
+                expected = list(recursive_iter(t))
+                self.assertTrue(all(x is y for x, y in zip(list(t), [n for n, _ in expected])))
+                self.assertEqual(list(t.iterdepth()), expected)
+                self.assertEqual(list(t.all_leaves()), list(recursive_leaves(t)))
+
+                # iterate_subnodes has each node's bound variables in the grammar, and only those
+                for n, d in t.iterate_subnodes(grammar, yield_depth=True):
+                    self.assertEqual(d, [y for x, y in expected if x is n][0])
+                    bvs = [x.added_rule.name for x in n.up_to(None) if x.added_rule is not None and x is not n]
+                    self.assertEqual(sorted([r.name for nt in grammar.nonterminals() for r in grammar.get_rules(nt)
+                                             if r not in rules[nt]]), sorted(bvs))
+
+                # starting at a subnode and recursing up gives the same context below it, and stopping early
+                # must still remove the rules
+                for n in t:
+                    for m in islice(n.iterate_subnodes(grammar, recurse_up=True), 2):
+                        if m is not n:
+                            bvs = [x.added_rule.name for x in m.up_to(None) if x.added_rule is not None and x is not m]
+                            self.assertEqual(sorted([r.name for nt in grammar.nonterminals()
+                                                     for r in grammar.get_rules(nt) if r not in rules[nt]]), sorted(bvs))
+
+                # and when we are done, the grammar is back how it was
+                self.assertEqual(rules, dict([(nt, list(grammar.get_rules(nt))) for nt in grammar.nonterminals()]))
+
+        # deep trees do not hit the recursion limit
+        t = FunctionNode(None, 'A', 'f', ['x'])
+        for _ in xrange(5000):
+            t = FunctionNode(None, 'A', 'f', [t])
+            t.args[0].parent = t
+        self.assertEqual(len(list(t)), 5001)
+        self.assertEqual(max(d for _, d in t.iterdepth()), 5000)
+        self.assertEqual(list(t.all_leaves()), ['x'])
+        self.assertEqual(t.sample_subnode()[1], -log(5001))
@@ -1,8 +1,10 @@
 
 import unittest
+from math import log
 
 from DefaultGrammars import finiteTestGrammar, infiniteTestGrammar
 from LOTlib.FunctionNode import FunctionNode, BVUseFunctionNode, BVAddFunctionNode
+from LOTlib.Miscellaneous import Infinity
 
 class EnumerationTest(unittest.TestCase):
     def runTest(self):
@@ -13,6 +15,105 @@ class EnumerationTest(unittest.TestCase):
         self.assertEqual(n,27)
 
 
+class MemoizedEnumerationTest(unittest.TestCase):
+    def runTest(self):
+        print "# Testing memoized enumeration"
+        from LOTlib.Enumeration import Enumerator
+
+        # CompactTrees give the same trees
+        trees = list(finiteTestGrammar.enumerate())
+        self.assertEqual([ct.expand() for ct in finiteTestGrammar.enumerate(compact=True)], trees)
+
+        grammar = infiniteTestGrammar
+        enumerator = Enumerator(grammar)
+        seen = set()
+        for d in xrange(5):
+            trees = list(enumerator.enumerate_at_depth(d))
+            strs = map(str, trees)
+            for t in trees:
+                # each tree is new, has the right depth, and can be scored
+                self.assertTrue(t not in seen)
+                seen.add(t)
+                self.assertEqual(t.depth(), d)
+                self.assertTrue(grammar.log_probability(t) > -Infinity)
+                for ti in t:
+                    if ti.args is not None:
+                        for a in ti.argFunctionNodes():
+                            self.assertTrue(a.parent is ti)
+
+            # changing one tree does not change any other
+            for t in trees:
+                t.args = None
+            self.assertEqual(map(str, enumerator.enumerate_at_depth(d)), strs)
+            self.assertEqual(map(str, grammar.enumerate_at_depth(d)), strs)
+
+        # without leaves, the trees stop at nonterminals, which are all at the bottom
+        for t in grammar.enumerate_at_depth(3, leaves=False):
+            self.assertFalse(t.is_complete_tree(grammar))
+            self.assertEqual(t.depth(), 2)
+
+
+class BestFirstEnumerationTest(unittest.TestCase):
+    def runTest(self):
+        print "# Testing best-first enumeration"
+
+        # On a finite grammar we get every tree, in order of decreasing prior
+        trees = list(finiteTestGrammar.enumerate_by_probability())
+        self.assertEqual(sorted(map(str, trees)), sorted(map(str, finiteTestGrammar.enumerate())))
+        lps = map(finiteTestGrammar.log_probability, trees)
+        for a, b in zip(lps, lps[1:]):
+            self.assertTrue(a >= b - 1e-9)
+
+        # On an infinite one, we get every tree above min_lp (all of which are shallow here), and no others
+        grammar = infiniteTestGrammar
+        trees = list(grammar.enumerate_by_probability(min_lp=-6.0))
+        lps = map(grammar.log_probability, trees)
+        self.assertTrue(min(lps) >= -6.0 - 1e-9)
+        for a, b in zip(lps, lps[1:]):
+            self.assertTrue(a >= b - 1e-9)
+        self.assertEqual(sorted(map(str, trees)),
+                         sorted([str(t) for t in grammar.enumerate(5) if grammar.log_probability(t) >= -6.0]))
+        for t in trees:
+            for ti in t:
+                if ti.args is not None:
+                    for a in ti.argFunctionNodes():
+                        self.assertTrue(a.parent is ti)
+
+        # and follow random.seed, as generate does
+        import random
+        batches = []
+        for _ in xrange(2):
+            random.seed(3)
+            batches.append(infiniteTestGrammar.generate_batch(100))
+        self.assertEqual(batches[0], batches[1])
+
+        self.assertEqual(len(list(grammar.enumerate_by_probability(max_count=10))), 10)
+
+
+class TreeCountTest(unittest.TestCase):
+    def runTest(self):
+        print "# Testing tree counts and prior mass"
+        from math import exp
+        from LOTlib.Enumeration import TreeCounter
+
+        for grammar in [finiteTestGrammar, infiniteTestGrammar]:
+            for leaves in [True, False]:
+                counter = TreeCounter(grammar, leaves=leaves)
+                for d in xrange(5):
+                    trees = list(grammar.enumerate_at_depth(d, leaves=leaves))
+                    self.assertEqual(counter.count(d), len(trees))
+                    self.assertEqual(grammar.count_trees(d, leaves=leaves), len(trees))
+                    if leaves:
+                        mass = sum([exp(grammar.log_probability(t)) for t in trees])
+                        self.assertAlmostEqual(counter.mass(d), mass)
+                        self.assertAlmostEqual(grammar.prior_mass(d), mass)
+
+        # all of a finite grammar's trees are shallow, and have all the prior
+        counter = TreeCounter(finiteTestGrammar)
+        self.assertEqual(counter.cumulative_count(20), 27)
+        self.assertAlmostEqual(counter.cumulative_mass(20), 1.0)
+
+
 import re
 class GrammarTreeTest(unittest.TestCase):
     def runTest(self):
@@ -53,18 +154,18 @@ class GrammarTreeTest(unittest.TestCase):
 
                         # NOTE: We cannot use "in" here since that uses rule "is", but we've created
                         # a new thing that is equivalent to the rule. So instead, we check the bv name
-                        self.assertTrue(r.name in [r.name for r in grammar.rules[ti.returntype]])
+                        self.assertTrue(r.name in [r.name for r in grammar.get_rules(ti.returntype)])
                         added_rules.append(r)
 
                     if re.match(r'lambda', ti.name):
                         self.assertTrue(isinstance(ti, BVAddFunctionNode))
 
                         # assert that this rule isn't already there
-                        self.assertTrue(ti.added_rule.name not in [r.name for r in grammar.rules[ti.returntype]])
+                        self.assertTrue(ti.added_rule.name not in [r.name for r in grammar.get_rules(ti.returntype)])
 
                 # Then assert that none of the rules are still in the grammar
                 for therule in added_rules:
-                    self.assertTrue(therule.name not in [r.name for r in grammar.rules[ti.returntype]])
+                    self.assertTrue(therule.name not in [r.name for r in grammar.get_rules(ti.returntype)])
 
 
 class FinitePackTest(unittest.TestCase):
@@ -88,3 +189,341 @@ class InfinitePackTest(unittest.TestCase):
 
             self.assertTrue(t==t2)
 
+
+
+class BinaryPackTest(unittest.TestCase):
+    def runTest(self):
+        print "# Testing binary packing"
+        import pickle
+        from LOTlib.Grammar import Grammar
+        from copy import deepcopy
+        from LOTlib.Hypotheses.LOTHypothesis import LOTHypothesis, packed_values
+
+        # more rules than pack_ascii can handle
+        biggrammar = Grammar()
+        biggrammar.add_rule('START', '', ['EXPR'], 1.0)
+        biggrammar.add_rule('EXPR', 'plus_', ['EXPR', 'EXPR'], 20.0)
+        biggrammar.add_rule('EXPR', 'apply_', ['FUNC', 'EXPR'], 5.0)
+        biggrammar.add_rule('FUNC', 'lambda', ['EXPR'], 1.0, bv_type='EXPR')
+        for i in xrange(300):
+            biggrammar.add_rule('EXPR', str(i), None, 1.0)
+
+        for grammar in [finiteTestGrammar, infiniteTestGrammar, biggrammar]:
+            copied = pickle.loads(pickle.dumps(grammar)) # gives the same indices
+            trees = [grammar.generate() for _ in xrange(1000)]
+            for t in trees:
+                s = grammar.pack(t)
+                self.assertTrue(t == grammar.unpack(s))
+                self.assertTrue(grammar.unpack(s).check_parent_refs())
+                self.assertTrue(t == copied.unpack(s))
+
+            # decoding packs that were put end to end
+            s = ''.join(map(grammar.pack, trees))
+            self.assertEqual(list(grammar.rule_table().unpack_all(s)), trees)
+            self.assertRaises(ValueError, list, grammar.rule_table().unpack_all(s[:-1]))
+
+            # LOTHypotheses are pickled with packed values inside packed_values()
+            h = LOTHypothesis(grammar, display="lambda: %s", maxnodes=1000)
+            h.compute_prior()
+            with packed_values():
+                self.assertTrue('packed_value' in h.__getstate__())
+                h2 = pickle.loads(pickle.dumps(h, pickle.HIGHEST_PROTOCOL))
+            self.assertEqual(h, h2)
+            self.assertEqual(h.prior, h2.prior)
+            self.assertEqual(str(h), str(h2))
+            self.assertFalse('packed_value' in h.__getstate__())
+
+            # and never when deepcopied, or when they have annotations, which packing would lose
+            h.value.annotate('p_propose', 0.5)
+            self.assertEqual(deepcopy(h).value.p_propose, 0.5)
+            with packed_values():
+                self.assertEqual(deepcopy(h).value.p_propose, 0.5)
+                self.assertEqual(pickle.loads(pickle.dumps(h, pickle.HIGHEST_PROTOCOL)).value.p_propose, 0.5)
+
+        # values using a rule the rule table doesn't know (appended to grammar.rules directly) are pickled unpacked
+        from LOTlib.FunctionNode import FunctionNode
+        from LOTlib.GrammarRule import GrammarRule
+        grammar = Grammar()
+        grammar.add_rule('START', '', ['WORD'], 1.0)
+        grammar.add_rule('WORD', 'a_', None, 1.0)
+        h = LOTHypothesis(grammar, display="lambda: %s")
+        grammar.rule_table()
+        grammar.rules['WORD'].append(GrammarRule('WORD', 'direct_', None, 1.0))
+        h.set_value(FunctionNode(None, 'START', '', [FunctionNode(None, 'WORD', 'direct_', None)]))
+        with packed_values():
+            h2 = pickle.loads(pickle.dumps(h, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(h, h2)
+        self.assertEqual(str(h2), "lambda: direct_")
+
+
+class RuleIndexTest(unittest.TestCase):
+    def runTest(self):
+        print "# Testing the rule signature index"
+        from copy import copy
+        from LOTlib.Grammar import Grammar
+
+        def scan(grammar, t):
+            """ get_matching_rule, as it was done before the index """
+            return [r for r in grammar.get_rules(t.returntype) if r.get_rule_signature() == t.get_rule_signature()]
+
+        for grammar in [finiteTestGrammar, infiniteTestGrammar]:
+            nsignatures = len(set([r.get_rule_signature() for r in grammar]))
+            for _ in xrange(1000):
+                t = grammar.generate()
+
+                # inside each node's bound variable context, we find the same rule as a scan of the rules
+                for ti in t.iterate_subnodes(grammar):
+                    self.assertEqual([grammar.get_matching_rule(ti)], scan(grammar, ti))
+                    self.assertTrue(grammar.get_matching_rule(ti) is scan(grammar, ti)[0])
+
+                # and the bound variable rules are gone when we leave
+                self.assertEqual(len(grammar.rule_index()), nsignatures)
+
+        # add_rule and renormalize
+        grammar = Grammar()
+        grammar.add_rule('START', '', ['EXPR'], 1.0)
+        grammar.add_rule('EXPR', 'f_', ['EXPR'], 1.0)
+        grammar.add_rule('EXPR', 'x', None, 3.0)
+        for _ in xrange(100):
+            t = grammar.generate()
+            nf = t.count_nodes() - 2
+            self.assertAlmostEqual(grammar.log_probability(t), nf*log(1.0/4.0) + log(3.0/4.0))
+
+        r = grammar.add_rule('EXPR', 'y', None, 4.0)
+        self.assertAlmostEqual(grammar.log_probability(t), nf*log(1.0/8.0) + log(3.0/8.0))
+        leaf = list(t)[-1]
+        leaf.name = 'y'
+        self.assertTrue(grammar.get_matching_rule(leaf) is r)
+
+        grammar.renormalize()
+        self.assertAlmostEqual(grammar.log_probability(t), nf*log(1.0/8.0) + log(4.0/8.0))
+
+
+class NormalizerTest(unittest.TestCase):
+    def runTest(self):
+        print "# Testing the cached log normalizers"
+        import pickle
+        from copy import deepcopy
+
+        for grammar in [finiteTestGrammar, infiniteTestGrammar]:
+            for _ in xrange(1000):
+                t = grammar.generate()
+
+                # in each node's context, the cached tables agree with summing the rules
+                lp = 0.0
+                for ti in t.iterate_subnodes(grammar):
+                    rules = grammar.get_rules(ti.returntype)
+                    self.assertEqual(grammar.log_normalizer(ti.returntype), log(sum([r.p for r in rules])))
+                    r = grammar.get_matching_rule(ti)
+                    lp += log(r.p) - log(sum([r.p for r in rules]))
+                self.assertAlmostEqual(grammar.log_probability(t), lp)
+
+                self.assertAlmostEqual(grammar.single_probability(t), log(grammar.get_matching_rule(t).p) -
+                                       log(sum([r.p for r in grammar.get_rules(t.returntype)])))
+
+            # changing a rule's probability, with set_p or by renormalizing, is noticed (on a copy, so that we don't
+            # change the grammars for the other tests), and doesn't throw away other grammars' tables
+            other = deepcopy(grammar)
+            other_tables = other.nonterminal_tables()
+            grammar = deepcopy(grammar)
+            nt = grammar.start
+            r = grammar.get_rules(nt)[0]
+            z = sum([x.p for x in grammar.get_rules(nt)])
+            self.assertEqual(grammar.log_normalizer(nt), log(z))
+            version = grammar.p_version()
+            grammar.set_p(r, r.p * 2.0)
+            self.assertEqual(grammar.log_normalizer(nt), log(z + r.p/2.0))
+            self.assertTrue(grammar.p_version() is not version)
+            self.assertTrue(other.nonterminal_tables() is other_tables)
+            grammar.renormalize()
+            self.assertAlmostEqual(grammar.log_normalizer(nt), 0.0)
+            self.assertAlmostEqual(grammar.rule_log_probability(r), log(r.p))
+
+            # and so is setting p directly, also on grammars that have been pickled
+            for grammar in [grammar, pickle.loads(pickle.dumps(grammar))]:
+                r = grammar.get_rules(nt)[0]
+                version = grammar.p_version()
+                r.p *= 2.0
+                self.assertTrue(grammar.p_version() is not version)
+                self.assertAlmostEqual(grammar.log_normalizer(nt), log(1.0 + r.p/2.0))
+                self.assertAlmostEqual(grammar.rule_log_probability(r), log(r.p) - log(1.0 + r.p/2.0))
+            self.assertTrue(other.nonterminal_tables() is other_tables)
+
+
+class GenerationDistributionTest(unittest.TestCase):
+    def runTest(self):
+        print "# Testing the distribution of generated trees"
+        from collections import Counter
+        from math import exp
+
+        trees = list(finiteTestGrammar.enumerate())
+        probs = [exp(finiteTestGrammar.log_probability(t)) for t in trees]
+        self.assertAlmostEqual(sum(probs), 1.0)
+
+        N = 20000
+        for generated in [[finiteTestGrammar.generate() for _ in xrange(N)],
+                          finiteTestGrammar.generate_batch(N),
+                          [ct.expand() for ct in finiteTestGrammar.generate_batch(N, compact=True)]]:
+            counts = Counter(generated)
+            self.assertEqual(sum([counts[t] for t in trees]), N)
+            for t, p in zip(trees, probs):
+                self.assertTrue(abs(float(counts[t])/N - p) < 0.02, "%s: %s vs %s" % (t, float(counts[t])/N, p))
+
+        # batches of trees with bound variables are well formed
+        for t in infiniteTestGrammar.generate_batch(1000):
+            self.assertTrue(t.is_complete_tree(infiniteTestGrammar))
+            self.assertTrue(infiniteTestGrammar.log_probability(t) > -Infinity)
+            for ti in t:
+                if ti.args is not None:
+                    for a in ti.argFunctionNodes():
+                        self.assertTrue(a.parent is ti)
+
+        # and follow random.seed, as generate does
+        import random
+        batches = []
+        for _ in xrange(2):
+            random.seed(3)
+            batches.append(infiniteTestGrammar.generate_batch(100))
+        self.assertEqual(batches[0], batches[1])
+
+
+class BoundedGenerationTest(unittest.TestCase):
+    def runTest(self):
+        print "# Testing bounded generation"
+        from collections import Counter
+        from math import exp
+
+        grammar = infiniteTestGrammar
+        trees = list(grammar.enumerate(5))
+
+        # the minimal completions are those of the smallest trees
+        for nt in grammar.nonterminals():
+            ts = list(grammar.enumerate(3, nt=nt))
+            self.assertEqual(grammar.depth_to_terminal(nt), min([t.depth() for t in ts]))
+            self.assertEqual(grammar.nodes_to_terminal(nt), min([t.count_nodes() for t in ts]))
+
+        # masses are those of the trees that fit
+        sampler = grammar.bounded_sampler()
+        for kwargs, fits in [(dict(max_depth=3), lambda t: t.depth() <= 3),
+                             (dict(max_nodes=5), lambda t: t.count_nodes() <= 5),
+                             (dict(max_depth=2, max_nodes=4), lambda t: t.depth() <= 2 and t.count_nodes() <= 4)]:
+            fitting = [t for t in trees if fits(t)]
+            probs = [exp(grammar.log_probability(t)) for t in fitting]
+            self.assertAlmostEqual(sampler.mass(grammar.start, **kwargs), sum(probs))
+
+            # and we sample them in proportion to their prior
+            N = 5000
+            counts = Counter([grammar.generate_bounded(**kwargs) for _ in xrange(N)])
+            self.assertEqual(sum([counts[t] for t in fitting]), N)
+            for t, p in zip(fitting, probs):
+                self.assertTrue(abs(float(counts[t])/N - p/sum(probs)) < 0.03)
+
+        # LOTHypotheses can be made to never go over maxnodes
+        from LOTlib.Hypotheses.LOTHypothesis import LOTHypothesis
+        class BoundedHypothesis(LOTHypothesis):
+            bounded = True
+        h = BoundedHypothesis(grammar, maxnodes=6)
+        for _ in xrange(200):
+            h, _ = h.propose()
+            self.assertTrue(h.value.count_nodes() <= 6)
+
+
+class BVScopeTest(unittest.TestCase):
+    def runTest(self):
+        print "# Testing bound variable scopes"
+        import threading
+        from itertools import izip
+        from LOTlib.BVRuleContextManager import BVRuleContextManager
+
+        grammar = infiniteTestGrammar
+        lengths = dict([(nt, len(grammar.rules[nt])) for nt in grammar.nonterminals()])
+
+        # generating, scoring and iterating never change the grammar's own rules
+        trees = [grammar.generate() for _ in xrange(1000)]
+        for t in trees:
+            grammar.log_probability(t)
+            for ti in t.iterate_subnodes(grammar):
+                self.assertEqual(dict([(nt, len(grammar.rules[nt])) for nt in grammar.nonterminals()]), lengths)
+        self.assertTrue(grammar.bv_scope() is None)
+
+        lambdas = [ti for t in trees for ti in t if ti.added_rule is not None]
+        self.assertTrue(len(lambdas) > 0)
+        fn = lambdas[0]
+
+        # inside a context, the rule is in scope, and it's gone when we leave, even on an exception
+        try:
+            with BVRuleContextManager(grammar, fn):
+                self.assertTrue(fn.added_rule in grammar.bv_rules(fn.added_rule.nt))
+                self.assertTrue(grammar.get_rules(fn.added_rule.nt)[-1] is fn.added_rule)
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertTrue(grammar.bv_scope() is None)
+        self.assertEqual(len(grammar.rules[fn.added_rule.nt]), lengths[fn.added_rule.nt])
+
+        # contexts can be left out of order, as interleaved iterate_subnodes do
+        big = [t for t in trees if sum([ti.added_rule is not None for ti in t]) > 1]
+        for t1, t2 in zip(big, big[1:]):
+            for a, b in izip(t1.iterate_subnodes(grammar), t2.iterate_subnodes(grammar)):
+                for x in [a, b]:
+                    self.assertTrue(grammar.get_matching_rule(x) is not None)
+            self.assertTrue(grammar.bv_scope() is None)
+
+        # several threads can share the grammar
+        lps = [grammar.log_probability(t) for t in trees]
+        errors = []
+        def check():
+            try:
+                for _ in xrange(5):
+                    for t, lp in zip(trees, lps):
+                        self.assertAlmostEqual(grammar.log_probability(t), lp)
+                        grammar.generate()
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=check) for _ in xrange(4)]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        self.assertEqual(errors, [])
+
+
+class FrozenGrammarTest(unittest.TestCase):
+    def runTest(self):
+        print "# Testing frozen grammars"
+        import pickle
+        from collections import Counter
+        from math import exp
+
+        for grammar in [finiteTestGrammar, infiniteTestGrammar]:
+            frozen = pickle.loads(pickle.dumps(grammar.freeze(), pickle.HIGHEST_PROTOCOL))
+            self.assertEqual(frozen.nrules(), grammar.rule_table().nrules)
+            self.assertEqual(sorted(frozen.nonterminals()), sorted(grammar.nonterminals()))
+
+            for _ in xrange(1000):
+                for t in [grammar.generate(), frozen.generate()]:
+                    # the same probabilities, packing, and rule counts as the grammar
+                    self.assertAlmostEqual(frozen.log_probability(t), grammar.log_probability(t))
+                    self.assertEqual(frozen.pack(t), grammar.pack(t))
+                    self.assertEqual(frozen.unpack(grammar.pack(t)), t)
+                    self.assertEqual(grammar.unpack(frozen.pack(t)), t)
+
+                    counts = frozen.count_rules(t)
+                    self.assertEqual(sum(counts), len([x for x in t if not isinstance(x, BVUseFunctionNode)]))
+                    for k in counts.nonzero()[0]:
+                        r = grammar.rule_table().rules[k]
+                        self.assertEqual(counts[k], len([x for x in t if x.get_rule_signature() == r.get_rule_signature()]))
+
+            thawed = frozen.thaw()
+            self.assertEqual(thawed.freeze().pack(t), grammar.pack(t))
+            self.assertAlmostEqual(thawed.log_probability(t), grammar.log_probability(t))
+
+        # and it generates trees with the right probabilities
+        trees = list(finiteTestGrammar.enumerate())
+        frozen = finiteTestGrammar.freeze()
+        N = 20000
+        counts = Counter([frozen.generate() for _ in xrange(N)])
+        self.assertEqual(sum([counts[t] for t in trees]), N)
+        for t in trees:
+            p = exp(frozen.log_probability(t))
+            self.assertTrue(abs(float(counts[t])/N - p) < 0.02, "%s: %s vs %s" % (t, float(counts[t])/N, p))